@@ -1,25 +1,29 @@
+"""Write a protocol's runtime parameters to a CSV file.
 
+usage: python "abr_testing/api 2.20/params_to_csv.py" PROTOCOL [OUTPUT]
+"""
 
+import sys
+from pathlib import Path
 
-def find_params(contents):
-    START_TAG = "def add_parameters"
-    END_TAG = "### RUN ###"
-    start_ind = contents.index(START_TAG)
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
 
-    end_ind = contents.index(END_TAG)
-    return contents[start_ind : end_ind]
+from analysis.extract import extract_source, write_parameters_csv  # noqa: E402
 
 
-def write_csv(params):
-    
+def main() -> int:
+    if len(sys.argv) < 2:
+        print(__doc__.strip().splitlines()[-1])
+        return 2
+    protocol = Path(sys.argv[1])
+    output = Path(sys.argv[2]) if len(sys.argv) > 2 else protocol.with_suffix(".csv")
+    info = extract_source(protocol.read_text(encoding="utf-8"), protocol.name)
+    for error in info.errors:
+        print(error, file=sys.stderr)
+    write_parameters_csv([info], output)
+    print(f"{len(info.parameters)} parameters written to {output}")
+    return 0
 
 
-
-file_name = input("file: ")
-
-file = open(file_name)
-
-file_contents = file.read()
-
-
-print(find_params(file_contents))
\ No newline at end of file
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1 @@
+"""Bulk analysis of the protocols catalogued in this repository."""
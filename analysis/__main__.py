@@ -0,0 +1,412 @@
+"""Command line entry point: python -m analysis <command>."""
+
+import argparse
+import sys
+from pathlib import Path
+from typing import List, Optional
+
+from analysis import (
+    deck,
+    diff,
+    extract,
+    gripper,
+    incremental,
+    liquids,
+    preflight,
+    profiles,
+    ramps,
+    runner,
+    runtime,
+    sandbox,
+    sweep,
+    timeline,
+    tips,
+    warmup,
+    waste,
+)
+from analysis.cache import DEFAULT_MAX_BYTES, AnalysisCache, analyzer_version
+from analysis.discover import REPO_ROOT, Protocol, discover
+from analysis.jsonstream import StreamingProtocol
+from analysis.labware_store import LabwareStore
+
+DEFAULT_RAMPS = REPO_ROOT / "results" / "ramps.json"
+
+
+def _run(args: argparse.Namespace) -> int:
+    discovered = protocols = discover(args.root)
+    if args.since:
+        changed = incremental.changed_files(args.since, args.root)
+        protocols = incremental.affected(protocols, changed)
+    if args.match:
+        protocols = [p for p in protocols if args.match in p.relative]
+    limits = None
+    if args.sandbox:
+        limits = sandbox.Limits(
+            args.memory_limit, args.cpu_limit, args.time_limit, args.allow_network
+        )
+    cache = None
+    if not args.no_cache:
+        cache = AnalysisCache(
+            args.cache,
+            args.cache_size * 1024 * 1024,
+            analyzer_version(args.analyzer, limits),
+        )
+    results = runner.run_all(
+        protocols,
+        args.out,
+        args.workers,
+        cache,
+        args.analyzer,
+        limits,
+        not args.no_preflight,
+    )
+    if args.since:
+        previous = incremental.previous_results(args.out)
+        runner.write_summary(incremental.merge(previous, results, discovered), args.out)
+        print(runner.summary_table(results))
+    else:
+        print(runner.write_summary(results, args.out))
+    if cache is not None:
+        print(cache.stats)
+    return 1 if args.check and any(r.status != "ok" for r in results) else 0
+
+
+def _ramp_model(path: Path) -> ramps.RampModel:
+    """The calibrated model at path, or the default rates if none was fitted."""
+    return ramps.load_model(path) if path.is_file() else ramps.DEFAULT
+
+
+def _estimate(args: argparse.Namespace) -> int:
+    estimates = runtime.estimate_results(args.out, _ramp_model(args.ramps))
+    print(runtime.write_runtimes(estimates, args.out))
+    return 0
+
+
+def _tips(args: argparse.Namespace) -> int:
+    ledgers = tips.tips_results(args.out)
+    print(tips.write_tips(ledgers, args.out))
+    return 0
+
+
+def _liquids(args: argparse.Namespace) -> int:
+    reports = liquids.liquid_results(args.out)
+    print(liquids.write_liquids(reports, args.out))
+    return 0
+
+
+def _waste(args: argparse.Namespace) -> int:
+    reports = waste.waste_results(args.out)
+    print(waste.write_waste(reports, args.out))
+    return 0
+
+
+def _timeline(args: argparse.Namespace) -> int:
+    timelines = timeline.timeline_results(args.out, _ramp_model(args.ramps))
+    print(timeline.write_timelines(timelines, args.out))
+    return 0
+
+
+def _ramps(args: argparse.Namespace) -> int:
+    model = ramps.calibrate(args.logs)
+    ramps.write_model(model, args.out)
+    print(ramps.ramps_table(model))
+    return 0
+
+
+def _profiles(args: argparse.Namespace) -> int:
+    uses = profiles.profile_results(args.out)
+    print(profiles.write_profiles(uses, args.out, _ramp_model(args.ramps)))
+    return 0
+
+
+def _warmup(args: argparse.Namespace) -> int:
+    reports = warmup.warmup_results(args.out, _ramp_model(args.ramps))
+    print(warmup.write_warmup(reports, args.out))
+    return 0
+
+
+def _gripper(args: argparse.Namespace) -> int:
+    plans = gripper.gripper_results(args.out)
+    print(gripper.write_gripper(plans, args.out))
+    return 0
+
+
+def _deck(args: argparse.Namespace) -> int:
+    reports = deck.deck_results(args.out)
+    print(deck.write_deck(reports, args.out))
+    return 0
+
+
+def _preflight(args: argparse.Namespace) -> int:
+    protocols = discover(args.root)
+    if args.match:
+        protocols = [p for p in protocols if args.match in p.relative]
+    print(preflight.preflight_table(protocols, args.analyzer))
+    return 0
+
+
+def _labware(args: argparse.Namespace) -> int:
+    store = LabwareStore()
+    unreadable = []
+    for protocol in discover(args.root):
+        try:
+            for path in protocol.labware:
+                store.add_file(path)
+            if protocol.kind == "json":
+                streamed = StreamingProtocol(protocol.path, store=store)
+                for key in streamed.definition_keys():
+                    streamed.labware_definition(key)
+        except ValueError as error:
+            unreadable.append(f"{protocol.relative}: {error}")
+    print(store.stats)
+    for problem in unreadable:
+        print(problem)
+    return 0
+
+
+def _metadata(args: argparse.Namespace) -> int:
+    infos = extract.extract_all(discover(args.root))
+    print(extract.write_metadata(infos, args.out))
+    return 0
+
+
+def _sweep(args: argparse.Namespace) -> int:
+    protocols = discover(args.root)
+    if args.match:
+        protocols = [p for p in protocols if args.match in p.relative]
+    reports = sweep.sweep(
+        protocols, args.out, args.mode, args.limit, args.workers, args.analyzer
+    )
+    print(sweep.write_sweep(reports, args.out))
+    return 1 if args.check and any(report.failed for report in reports) else 0
+
+
+def _protocol(path: Path, protocols: List[Protocol]) -> Protocol:
+    """The discovered protocol at path, with its sidecar files, or a bare one."""
+    for protocol in protocols:
+        if protocol.path.resolve() == path.resolve():
+            return protocol
+    return Protocol(path, str(path), "python" if path.suffix == ".py" else "json")
+
+
+def _diff(args: argparse.Namespace) -> int:
+    protocols = discover(args.root)
+    if args.variants:
+        print(diff.write_variants(diff.diff_variants(protocols), args.out))
+        return 0
+    if len(args.paths) != 2:
+        print("diff needs two protocols, or --variants", file=sys.stderr)
+        return 2
+    a, b = (_protocol(path, protocols) for path in args.paths)
+    result = diff.diff(diff.commands_of(a), diff.commands_of(b), a.relative, b.relative)
+    print(result)
+    return 0 if result.identical else 1
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m analysis")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="analyze every protocol in parallel")
+    run.add_argument("--root", type=Path, default=REPO_ROOT)
+    run.add_argument("--out", type=Path, default=REPO_ROOT / "results")
+    run.add_argument("--workers", type=int, help="defaults to one per core")
+    run.add_argument("--match", help="only protocols whose path contains this")
+    run.add_argument(
+        "--since",
+        metavar="REF",
+        help="only protocols changed since this git ref, merged into the last report",
+    )
+    run.add_argument(
+        "--analyzer",
+        choices=sorted(runner.ANALYZERS),
+        default="opentrons",
+        help="recorder runs protocols offline without opentrons, much faster",
+    )
+    run.add_argument("--cache", type=Path, default=REPO_ROOT / ".analysis-cache")
+    run.add_argument(
+        "--cache-size",
+        type=int,
+        default=DEFAULT_MAX_BYTES // (1024 * 1024),
+        help="megabytes to keep before evicting least recently used results",
+    )
+    run.add_argument("--no-cache", action="store_true", help="analyze everything")
+    run.add_argument(
+        "--no-preflight",
+        action="store_true",
+        help="analyze protocols even if static checks show they will fail",
+    )
+    run.add_argument(
+        "--sandbox",
+        action="store_true",
+        help="analyze each protocol in a process of its own, under the limits below",
+    )
+    run.add_argument(
+        "--memory-limit",
+        type=int,
+        default=sandbox.Limits.memory_mb,
+        metavar="MB",
+        help="address space",
+    )
+    run.add_argument(
+        "--cpu-limit", type=int, default=sandbox.Limits.cpu_seconds, metavar="SECONDS"
+    )
+    run.add_argument(
+        "--time-limit",
+        type=float,
+        default=sandbox.Limits.wall_seconds,
+        metavar="SECONDS",
+    )
+    run.add_argument(
+        "--allow-network", action="store_true", help="let protocols use the network"
+    )
+    run.add_argument(
+        "--check", action="store_true", help="exit non-zero if any protocol errors"
+    )
+    run.set_defaults(handler=_run)
+
+    estimate = commands.add_parser(
+        "estimate", help="model each analyzed protocol's runtime on the robot"
+    )
+    estimate.add_argument("--out", type=Path, default=REPO_ROOT / "results")
+    estimate.add_argument(
+        "--ramps",
+        type=Path,
+        default=DEFAULT_RAMPS,
+        help="ramp rates fitted by the ramps command, used if the file exists",
+    )
+    estimate.set_defaults(handler=_estimate)
+
+    calibrate = commands.add_parser(
+        "ramps", help="fit module ramp rates from temperature logs"
+    )
+    calibrate.add_argument("logs", type=Path, nargs="+", help="CSV temperature logs")
+    calibrate.add_argument("--out", type=Path, default=DEFAULT_RAMPS)
+    calibrate.set_defaults(handler=_ramps)
+
+    profile = commands.add_parser(
+        "profiles", help="list the distinct thermocycler profiles protocols run"
+    )
+    profile.add_argument("--out", type=Path, default=REPO_ROOT / "results")
+    profile.add_argument("--ramps", type=Path, default=DEFAULT_RAMPS)
+    profile.set_defaults(handler=_profiles)
+
+    overlap = commands.add_parser(
+        "timeline",
+        help="overlap module ramps with pipetting and find the critical path",
+    )
+    overlap.add_argument("--out", type=Path, default=REPO_ROOT / "results")
+    overlap.add_argument("--ramps", type=Path, default=DEFAULT_RAMPS)
+    overlap.set_defaults(handler=_timeline)
+
+    warm = commands.add_parser(
+        "warmup",
+        help="find module warm-ups waited on one by one and time them together",
+    )
+    warm.add_argument("--out", type=Path, default=REPO_ROOT / "results")
+    warm.add_argument("--ramps", type=Path, default=DEFAULT_RAMPS)
+    warm.set_defaults(handler=_warmup)
+
+    move = commands.add_parser(
+        "gripper", help="map labware moves and find gripper trips that could be skipped"
+    )
+    move.add_argument("--out", type=Path, default=REPO_ROOT / "results")
+    move.set_defaults(handler=_gripper)
+
+    layout = commands.add_parser(
+        "deck", help="check each analyzed protocol's deck layout for slot conflicts"
+    )
+    layout.add_argument("--out", type=Path, default=REPO_ROOT / "results")
+    layout.set_defaults(handler=_deck)
+
+    tip = commands.add_parser(
+        "tips", help="account for every tip each analyzed protocol uses, rack by rack"
+    )
+    tip.add_argument("--out", type=Path, default=REPO_ROOT / "results")
+    tip.set_defaults(handler=_tips)
+
+    liquid = commands.add_parser(
+        "liquids", help="follow well volumes through each analyzed protocol"
+    )
+    liquid.add_argument("--out", type=Path, default=REPO_ROOT / "results")
+    liquid.set_defaults(handler=_liquids)
+
+    sink = commands.add_parser(
+        "waste", help="predict when each analyzed protocol's liquid waste fills"
+    )
+    sink.add_argument("--out", type=Path, default=REPO_ROOT / "results")
+    sink.set_defaults(handler=_waste)
+
+    check = commands.add_parser(
+        "preflight", help="list protocols that static checks show will fail analysis"
+    )
+    check.add_argument("--root", type=Path, default=REPO_ROOT)
+    check.add_argument("--match", help="only protocols whose path contains this")
+    check.add_argument(
+        "--analyzer", choices=sorted(preflight.ANALYZER_ERRORS), default="opentrons"
+    )
+    check.set_defaults(handler=_preflight)
+
+    labware = commands.add_parser(
+        "labware", help="count the distinct labware definitions protocols use"
+    )
+    labware.add_argument("--root", type=Path, default=REPO_ROOT)
+    labware.set_defaults(handler=_labware)
+
+    metadata = commands.add_parser(
+        "metadata",
+        help="read metadata, requirements and runtime parameters without running anything",
+    )
+    metadata.add_argument("--root", type=Path, default=REPO_ROOT)
+    metadata.add_argument("--out", type=Path, default=REPO_ROOT / "results")
+    metadata.set_defaults(handler=_metadata)
+
+    swept = commands.add_parser(
+        "sweep",
+        help="analyze protocols across combinations of their runtime parameters",
+    )
+    swept.add_argument("--root", type=Path, default=REPO_ROOT)
+    swept.add_argument("--out", type=Path, default=REPO_ROOT / "results" / "sweep")
+    swept.add_argument("--workers", type=int, help="defaults to one per core")
+    swept.add_argument("--match", help="only protocols whose path contains this")
+    swept.add_argument(
+        "--mode",
+        choices=sweep.MODES,
+        default="pairwise",
+        help="every combination, or enough to cover every pair of values",
+    )
+    swept.add_argument(
+        "--limit",
+        type=int,
+        default=sweep.DEFAULT_LIMIT,
+        help="protocols with more combinations than this are swept pairwise",
+    )
+    swept.add_argument(
+        "--analyzer", choices=sorted(runner.ANALYZERS), default="opentrons"
+    )
+    swept.add_argument(
+        "--check", action="store_true", help="exit non-zero if any combination errors"
+    )
+    swept.set_defaults(handler=_sweep)
+
+    compare = commands.add_parser(
+        "diff", help="align two protocols' command streams and show how they differ"
+    )
+    compare.add_argument(
+        "paths", type=Path, nargs="*", help="two protocols or analysis JSON files"
+    )
+    compare.add_argument(
+        "--variants",
+        action="store_true",
+        help="compare every pair of copies of a protocol at different API levels",
+    )
+    compare.add_argument("--root", type=Path, default=REPO_ROOT)
+    compare.add_argument("--out", type=Path, default=REPO_ROOT / "results" / "diff")
+    compare.set_defaults(handler=_diff)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
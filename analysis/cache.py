@@ -0,0 +1,142 @@
+"""On-disk analysis cache keyed by the content of everything analysis reads."""
+
+import hashlib
+import os
+import shutil
+from dataclasses import dataclass
+from importlib import metadata
+from pathlib import Path
+from typing import TYPE_CHECKING, List, Optional, Tuple
+
+from analysis.discover import Protocol
+
+if TYPE_CHECKING:
+    from analysis.sandbox import Limits
+
+# bump when the shape of cached entries changes
+CACHE_FORMAT = 1
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+
+
+def _sandboxed(limits: Optional["Limits"]) -> str:
+    if limits is None:
+        return ""
+    network = "network" if limits.network else "offline"
+    return (
+        f":sandbox:{limits.memory_mb}:{limits.cpu_seconds}"
+        f":{limits.wall_seconds:g}:{network}"
+    )
+
+
+def analyzer_version(
+    analyzer: str = "opentrons", limits: Optional["Limits"] = None
+) -> str:
+    """The cache format plus the version of whatever produces the analyses.
+
+    For opentrons that is the installed package version, read without
+    importing it. Sandboxed runs add their limits, since a protocol can
+    analyze differently under other ones.
+    """
+    if analyzer.startswith("recorder"):
+        from analysis.recorder import RECORDER_VERSION
+
+        return f"{CACHE_FORMAT}:{analyzer}:{RECORDER_VERSION}{_sandboxed(limits)}"
+    try:
+        opentrons = metadata.version("opentrons")
+    except metadata.PackageNotFoundError:
+        opentrons = "missing"
+    return f"{CACHE_FORMAT}:{opentrons}{_sandboxed(limits)}"
+
+
+def cache_key(protocol: Protocol, version: str) -> str:
+    """SHA-256 over the protocol source, its sidecar files and the analyzer version."""
+    digest = hashlib.sha256(version.encode())
+    sidecars = [("labware", path) for path in protocol.labware] + sorted(
+        protocol.csv_files.items()
+    )
+    for name, path in [("protocol", protocol.path), *sidecars]:
+        digest.update(f"\0{name}\0{path.name}\0".encode())
+        digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+@dataclass
+class CacheStats:
+    """Counters for one run against the cache."""
+
+    hits: int = 0
+    misses: int = 0
+    stores: int = 0
+    evictions: int = 0
+
+    def __str__(self) -> str:
+        looked_up = self.hits + self.misses
+        rate = 100 * self.hits / looked_up if looked_up else 0
+        return (
+            f"cache: {self.hits} hits, {self.misses} misses ({rate:.0f}% hit rate), "
+            f"{self.stores} stored, {self.evictions} evicted"
+        )
+
+
+class AnalysisCache:
+    """Analysis JSON files stored by key, evicted least recently used first.
+
+    Recency is the file's modification time, refreshed on every hit, so the
+    cache needs no index beyond the directory itself.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        version: Optional[str] = None,
+    ) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.version = version or analyzer_version()
+        self.stats = CacheStats()
+
+    def _entry(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.json"
+
+    def key(self, protocol: Protocol) -> str:
+        return cache_key(protocol, self.version)
+
+    def fetch(self, key: str, destination: Path) -> bool:
+        """Copy a cached analysis to destination if there is one."""
+        entry = self._entry(key)
+        if not entry.exists():
+            self.stats.misses += 1
+            return False
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(entry, destination)
+        os.utime(entry)
+        self.stats.hits += 1
+        return True
+
+    def store(self, key: str, analysis: Path) -> None:
+        """Keep a copy of an analysis; call evict() once done storing."""
+        entry = self._entry(key)
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        partial = entry.with_suffix(".partial")
+        shutil.copyfile(analysis, partial)
+        partial.replace(entry)
+        self.stats.stores += 1
+
+    def _entries(self) -> List[Tuple[float, int, Path]]:
+        entries = []
+        for entry in self.directory.glob("*/*.json"):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry))
+        return sorted(entries)
+
+    def evict(self) -> None:
+        """Delete least recently used entries until the cache fits max_bytes."""
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in entries:
+            if total <= self.max_bytes:
+                break
+            entry.unlink()
+            total -= size
+            self.stats.evictions += 1
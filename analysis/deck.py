@@ -0,0 +1,347 @@
+"""Check every protocol's deck layout for conflicts the robot would refuse.
+
+The rules are the ones heater_shaker/restrictions exercises one lettered
+scenario at a time, plus where each module may go on either robot. Slot
+neighbours on the OT-2 and Flex decks are worked out once, when the module
+is imported, so each check is a set lookup and one pass over a command
+stream finds every conflict in it.
+
+On the OT-2 a Heater-Shaker may not have a module on any side, nor tall
+labware to its left or right. A multichannel pipette may not reach labware
+to its left or right, nor in front of or behind it unless that is a tip
+rack. While it shakes no pipette may go to it or any slot around it, and
+while its latch is open none may go to it or the slots beside it. On the
+Flex these pipette rules cover the Heater-Shaker's own slot only. The robot
+type comes from the analysis; Flex protocols numbering slots 1-12 are
+checked as D1 to A3.
+"""
+
+import json
+import re
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, FrozenSet, Iterable, List, Set, Tuple
+
+from analysis.gripper import FLEX_ROBOT, OFF_DECK, OT2_ROBOT, GripperPlan, MoveTracker
+from analysis.recorder.instrument import pipette_spec
+from analysis.runs import analysis_commands
+from analysis.tips import active_channels
+
+OT2_SLOTS = [str(number) for number in range(1, 13)]
+FLEX_SLOTS = [f"{row}{column}" for row in "DCBA" for column in range(1, 5)]
+OT2_TRASH = "12"
+HEATER_SHAKER = "heaterShaker"
+THERMOCYCLER = "thermocycler"
+# slots each kind of module can't be loaded in, apart from the OT-2 trash
+FORBIDDEN: Dict[str, FrozenSet[str]] = {
+    HEATER_SHAKER: frozenset(
+        ["9", "11"] + [slot for slot in FLEX_SLOTS if slot[1] in "24"]
+    ),
+    "temperature": frozenset(slot for slot in FLEX_SLOTS if slot[1] in "24"),
+    THERMOCYCLER: frozenset(OT2_SLOTS + FLEX_SLOTS) - {"7", "B1"},
+    "magneticBlock": frozenset(slot for slot in FLEX_SLOTS if slot[1] == "4"),
+}
+# the slots a thermocycler covers, by the slot it is loaded in
+FOOTPRINTS = {"7": ("7", "8", "10", "11"), "B1": ("A1", "B1")}
+# labware standing taller than 53 mm; synthesized definitions carry no real heights
+TALL = re.compile(r"tuberack|conical|falcon", re.IGNORECASE)
+
+
+def _cell(slot: str) -> Tuple[int, int]:
+    """A slot's column and row, counting from the front left."""
+    if slot.isdigit():
+        return (int(slot) - 1) % 3, (int(slot) - 1) // 3
+    return int(slot[1:]) - 1, "DCBA".index(slot[0])
+
+
+def _neighbours(
+    slots: List[str],
+) -> Tuple[Dict[str, FrozenSet[str]], Dict[str, FrozenSet[str]]]:
+    """The slots left and right of each slot, and those in front and behind."""
+    cells = {_cell(slot): slot for slot in slots}
+    sides, ends = {}, {}
+    for slot in slots:
+        column, row = _cell(slot)
+        sides[slot] = frozenset(
+            cells[cell]
+            for cell in ((column - 1, row), (column + 1, row))
+            if cell in cells
+        )
+        ends[slot] = frozenset(
+            cells[cell]
+            for cell in ((column, row - 1), (column, row + 1))
+            if cell in cells
+        )
+    return sides, ends
+
+
+# slot names on the two decks never clash, so one index serves both
+SIDES, ENDS = (
+    {**ot2, **flex}
+    for ot2, flex in zip(_neighbours(OT2_SLOTS), _neighbours(FLEX_SLOTS))
+)
+AROUND = {slot: SIDES[slot] | ENDS[slot] for slot in SIDES}
+
+
+def module_kind(model: str) -> str:
+    """heaterShaker, temperature, thermocycler, magnetic or magneticBlock."""
+    return re.sub(r"(Module)?V\d+$", "", model)
+
+
+@dataclass
+class Conflict:
+    """One thing the robot would refuse, at the command that first does it."""
+
+    index: int
+    rule: str
+    slot: str
+    subject: str
+    detail: str
+
+
+@dataclass
+class DeckReport:
+    """Every conflict in one protocol's layout and pipette moves."""
+
+    protocol: str
+    conflicts: List[Conflict] = field(default_factory=list)
+
+    def rules(self) -> Dict[str, int]:
+        counted: Dict[str, int] = {}
+        for conflict in self.conflicts:
+            counted[conflict.rule] = counted.get(conflict.rule, 0) + 1
+        return counted
+
+
+class DeckTracker:
+    """Walks one command stream, keeping what occupies each slot.
+
+    Locations, through stacks of labware and modules, are followed by the
+    gripper's MoveTracker, which sees every command after this does.
+    """
+
+    def __init__(self, report: DeckReport, robot_type: str = OT2_ROBOT) -> None:
+        self.report = report
+        # slots are named as the robot's deck names them, numbers only on the OT-2
+        self.moves = MoveTracker(GripperPlan(report.protocol), robot_type)
+        self.ot2 = robot_type != FLEX_ROBOT
+        self.occupants: Dict[str, str] = {}
+        self.names: Dict[str, str] = {}
+        self.modules: Dict[str, str] = {}
+        self.tall: Set[str] = set()
+        self.channels: Dict[str, int] = {}
+        # Heater-Shakers by slot, and which are shaking or have their latch open
+        self.heater_shakers: Dict[str, str] = {}
+        self.shaking: Set[str] = set()
+        self.open: Set[str] = set()
+        self.seen: Set[Tuple[str, str]] = set()
+        self.handlers: Dict[str, Callable[[int, dict], None]] = {
+            "loadModule": self._load_module,
+            "loadLabware": self._load_labware,
+            "moveLabware": self._move,
+            "loadPipette": self._load_pipette,
+            "configureNozzleLayout": self._configure,
+            "heaterShaker/setAndWaitForShakeSpeed": self._shake,
+            "heaterShaker/deactivateShaker": self._stop,
+            "heaterShaker/openLabwareLatch": self._open,
+            "heaterShaker/closeLabwareLatch": self._close,
+        }
+
+    def command(self, index: int, command_type: str, params: dict) -> None:
+        handler = self.handlers.get(command_type)
+        if handler is not None:
+            handler(index, params)
+        elif "pipetteId" in params and "labwareId" in params:
+            self._reach(index, params)
+        self.moves.command(index, command_type, params)
+
+    def _flag(
+        self, index: int, rule: str, slot: str, subject: str, detail: str
+    ) -> None:
+        # a rule broken over and over by the same thing is reported where it starts
+        if (rule, subject) not in self.seen:
+            self.seen.add((rule, subject))
+            self.report.conflicts.append(Conflict(index, rule, slot, subject, detail))
+
+    def _occupy(self, index: int, item: str, slots: Iterable[str]) -> None:
+        for slot in slots:
+            held = self.occupants.get(slot)
+            if held is not None and held != item:
+                self._flag(
+                    index,
+                    "occupied",
+                    slot,
+                    item,
+                    f"{self.names[held]} is already there",
+                )
+            self.occupants[slot] = item
+
+    def _load_module(self, index: int, params: dict) -> None:
+        module_id = str(params.get("moduleId", ""))
+        model = str(params.get("model", ""))
+        kind = module_kind(model)
+        slot = self.moves.slot(params.get("location"))
+        self.modules[module_id], self.names[module_id] = kind, f"{model} in {slot}"
+        if slot == OT2_TRASH or slot in FORBIDDEN.get(kind, ()):
+            self._flag(index, "slot", slot, module_id, f"{model} can't go in {slot}")
+        footprint = FOOTPRINTS.get(slot, (slot,)) if kind == THERMOCYCLER else (slot,)
+        self._occupy(index, module_id, footprint)
+        if kind == HEATER_SHAKER:
+            self.heater_shakers[slot] = module_id
+        self._beside(index, module_id, slot)
+
+    def _load_labware(self, index: int, params: dict) -> None:
+        labware_id = str(params.get("labwareId", ""))
+        self.names[labware_id] = str(params.get("loadName", ""))
+        if TALL.search(self.names[labware_id]):
+            self.tall.add(labware_id)
+        self._place(index, labware_id, params.get("location"))
+
+    def _move(self, index: int, params: dict) -> None:
+        labware_id = str(params.get("labwareId", ""))
+        for slot, item in list(self.occupants.items()):
+            if item == labware_id:
+                del self.occupants[slot]
+        self._place(index, labware_id, params.get("newLocation"))
+
+    def _place(self, index: int, labware_id: str, location: object) -> None:
+        # only labware standing on the deck itself takes up its slot
+        if isinstance(location, dict) and "slotName" in location:
+            slot = self.moves.slot(location)
+            self._occupy(index, labware_id, (slot,))
+            self._beside(index, labware_id, slot)
+
+    def _beside(self, index: int, item: str, slot: str) -> None:
+        """Flag modules around an OT-2 Heater-Shaker and tall labware beside it."""
+        # thermocycler spans and other areas have no neighbours to check
+        if not self.ot2 or slot not in AROUND:
+            return
+        kind = self.modules.get(item)
+        if kind == HEATER_SHAKER:
+            around = [self.occupants.get(other) for other in AROUND[slot]]
+            beside = [self.occupants.get(other) for other in SIDES[slot]]
+            others = [o for o in around if o in self.modules]
+            others += [o for o in beside if o in self.tall]
+        else:
+            near = AROUND[slot] if kind else SIDES[slot] if item in self.tall else ()
+            others = [self.heater_shakers[o] for o in near if o in self.heater_shakers]
+        for other in others:
+            if other != item:
+                self._flag(
+                    index, "adjacent", slot, item, f"next to {self.names[other]}"
+                )
+
+    def _load_pipette(self, index: int, params: dict) -> None:
+        channels = pipette_spec(str(params.get("pipetteName", "")))[0]
+        self.channels[str(params.get("pipetteId", ""))] = channels
+
+    def _configure(self, index: int, params: dict) -> None:
+        pipette = str(params.get("pipetteId", ""))
+        layout = params.get("configurationParams") or {}
+        self.channels[pipette] = active_channels(self.channels.get(pipette, 1), layout)
+
+    def _shake(self, index: int, params: dict) -> None:
+        self.shaking.add(str(params.get("moduleId", "")))
+
+    def _stop(self, index: int, params: dict) -> None:
+        self.shaking.discard(str(params.get("moduleId", "")))
+
+    def _open(self, index: int, params: dict) -> None:
+        self.open.add(str(params.get("moduleId", "")))
+
+    def _close(self, index: int, params: dict) -> None:
+        self.open.discard(str(params.get("moduleId", "")))
+
+    def _reach(self, index: int, params: dict) -> None:
+        """Flag a pipette going where a Heater-Shaker keeps it out."""
+        labware_id = str(params["labwareId"])
+        slot = self.moves.slot(self.moves.locations.get(labware_id))
+        if slot == OFF_DECK:
+            return
+        multichannel = self.channels.get(str(params["pipetteId"]), 1) == 8
+        ot2 = self.ot2
+        for place, module_id in self.heater_shakers.items():
+            if module_id in self.shaking and (
+                slot == place or (ot2 and slot in AROUND[place])
+            ):
+                self._flag(index, "shaking", slot, labware_id, self.names[module_id])
+            if module_id in self.open and (
+                slot == place or (ot2 and slot in SIDES[place])
+            ):
+                self._flag(index, "latch", slot, labware_id, self.names[module_id])
+            if multichannel and ot2 and self._out_of_reach(labware_id, slot, place):
+                self._flag(
+                    index, "multichannel", slot, labware_id, self.names[module_id]
+                )
+
+    def _out_of_reach(self, labware_id: str, slot: str, place: str) -> bool:
+        rack = "tiprack" in self.names.get(labware_id, "")
+        return slot in SIDES[place] or (slot in ENDS[place] and not rack)
+
+
+def check(
+    protocol: str, commands: Iterable[dict], robot_type: str = OT2_ROBOT
+) -> DeckReport:
+    """Every deck conflict in one command stream."""
+    report = DeckReport(protocol)
+    tracker = DeckTracker(report, robot_type)
+    for index, command in enumerate(commands):
+        tracker.command(
+            index, command.get("commandType", ""), command.get("params") or {}
+        )
+    return report
+
+
+def check_analysis(protocol: str, analysis: Path) -> DeckReport:
+    """The deck report from an analysis JSON file written by either analyzer."""
+    loaded = json.loads(analysis.read_text(encoding="utf-8"))
+    return check(
+        protocol, analysis_commands(loaded), loaded.get("robotType", OT2_ROBOT)
+    )
+
+
+def deck_table(reports: List[DeckReport]) -> str:
+    """Protocols with deck conflicts, the most first."""
+    shown = [report for report in reports if report.conflicts]
+    width = max([len(report.protocol) for report in shown] + [len("protocol")])
+    lines = [f"{'protocol':<{width}}  {'conflicts':>9}  first"]
+    for report in sorted(shown, key=lambda r: (-len(r.conflicts), r.protocol)):
+        first = report.conflicts[0]
+        lines.append(
+            f"{report.protocol:<{width}}  {len(report.conflicts):>9}  "
+            f"#{first.index} {first.rule} {first.subject} in {first.slot}: {first.detail}"
+        )
+    lines.append(f"{len(reports)} protocols, {len(shown)} with deck conflicts")
+    return "\n".join(lines)
+
+
+def write_deck(reports: List[DeckReport], out_dir: Path) -> str:
+    """deck.json, listing every conflict, and deck.txt in out_dir."""
+    (out_dir / "deck.json").write_text(
+        json.dumps(
+            [
+                {
+                    "protocol": report.protocol,
+                    "rules": report.rules(),
+                    "conflicts": [asdict(conflict) for conflict in report.conflicts],
+                }
+                for report in reports
+                if report.conflicts
+            ],
+            indent=2,
+        ),
+        encoding="utf-8",
+    )
+    table = deck_table(reports)
+    (out_dir / "deck.txt").write_text(table + "\n", encoding="utf-8")
+    return table
+
+
+def deck_results(out_dir: Path) -> List[DeckReport]:
+    """Deck reports for every protocol in a results directory's summary.json."""
+    summary = json.loads((out_dir / "summary.json").read_text(encoding="utf-8"))
+    return [
+        check_analysis(result["protocol"], Path(result["output"]))
+        for result in summary
+        if result["status"] == "ok" and result["output"]
+    ]
@@ -0,0 +1,344 @@
+"""Align two command streams and report how they differ, step by step.
+
+Commands are compared after normalization (see analysis.sweep.normalized),
+so random ids do not count as differences. The alignment is Myers' O(ND)
+algorithm in its linear-space form: each level finds the middle snake of
+the optimal edit path and recurses on either side of it, so memory stays
+proportional to the streams' lengths rather than their product.
+
+Streams are aligned as runs of repeated blocks first (see analysis.runs),
+a whole repeat matching as one item, and command by command only between
+runs that did not match.
+"""
+
+import json
+import re
+from dataclasses import dataclass, field
+from itertools import accumulate, combinations
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from analysis.discover import Protocol
+from analysis.jsonstream import StreamingProtocol
+from analysis.runs import Run, analysis_commands, as_runs, expand
+from analysis.sweep import normalized_runs
+
+# what tells variants of one protocol at different API levels apart, e.g. _219api
+API_SUFFIX = re.compile(r"_2\.?\d\d(api)?$")
+# comments like "-----Beginning Bind Steps-----" mark where a step begins
+DECORATION = " -=*#>:"
+START = "(start)"
+
+Match = Tuple[int, int]
+
+
+def _furthest(v: List[int], index: int, k: int, d: int) -> int:
+    """Where diagonal k's path starts at distance d: down from k+1 or right from k-1."""
+    if k == -d or (k != d and v[index - 1] < v[index + 1]):
+        return v[index + 1]
+    return v[index - 1] + 1
+
+
+def _middle_snake(
+    a: Sequence[int], b: Sequence[int], a0: int, a1: int, b0: int, b1: int
+) -> Tuple[int, int, int, int]:
+    """The snake in the middle of an optimal edit path, as (x, y, u, v).
+
+    The region is a[a0:a1] against b[b0:b1]; the snake matches a[x:u] to
+    b[y:v], in coordinates relative to a0 and b0.
+    """
+    n, m = a1 - a0, b1 - b0
+    delta = n - m
+    odd = delta % 2 == 1
+    limit = (n + m + 1) // 2 + 1
+    offset = limit + 1
+    forward = [0] * (2 * offset + 1)
+    backward = [0] * (2 * offset + 1)
+    for d in range(limit):
+        for k in range(-d, d + 1, 2):
+            x = _furthest(forward, offset + k, k, d)
+            y = x - k
+            start = x, y
+            while x < n and y < m and a[a0 + x] == b[b0 + y]:
+                x, y = x + 1, y + 1
+            forward[offset + k] = x
+            c = delta - k
+            if odd and -(d - 1) <= c <= d - 1 and x + backward[offset + c] >= n:
+                return start[0], start[1], x, y
+        for c in range(-d, d + 1, 2):
+            x = _furthest(backward, offset + c, c, d)
+            y = x - c
+            start = x, y
+            while x < n and y < m and a[a1 - 1 - x] == b[b1 - 1 - y]:
+                x, y = x + 1, y + 1
+            backward[offset + c] = x
+            k = delta - c
+            if not odd and -d <= k <= d and x + forward[offset + k] >= n:
+                return n - x, m - y, n - start[0], m - start[1]
+    raise AssertionError("no middle snake")  # pragma: no cover
+
+
+def align(a: Sequence[int], b: Sequence[int]) -> List[Match]:
+    """Index pairs of a longest common subsequence of a and b, in order."""
+    matches: List[Match] = []
+    # explicit stack of regions still to align, so deep recursion cannot overflow
+    regions = [(0, len(a), 0, len(b))]
+    while regions:
+        a0, a1, b0, b1 = regions.pop()
+        while a0 < a1 and b0 < b1 and a[a0] == b[b0]:
+            matches.append((a0, b0))
+            a0, b0 = a0 + 1, b0 + 1
+        while a0 < a1 and b0 < b1 and a[a1 - 1] == b[b1 - 1]:
+            a1, b1 = a1 - 1, b1 - 1
+            matches.append((a1, b1))
+        if a0 == a1 or b0 == b1:
+            continue
+        x, y, u, v = _middle_snake(a, b, a0, a1, b0, b1)
+        matches.extend((a0 + x + i, b0 + y + i) for i in range(u - x))
+        regions.append((a0, a0 + x, b0, b0 + y))
+        regions.append((a0 + u, a1, b0 + v, b1))
+    return sorted(matches)
+
+
+def _keys(commands: List[dict]) -> List[int]:
+    """Each normalized command as a small integer, equal commands equal."""
+    table: Dict[str, int] = {}
+    return [
+        table.setdefault(json.dumps(command, sort_keys=True), len(table))
+        for command in commands
+    ]
+
+
+def _run_matches(a: List[Run], b: List[Run]) -> List[Match]:
+    """Command index pairs from aligning runs, then the commands between them."""
+    keys = _keys([run.as_dict() for run in a + b])
+    a_starts = list(accumulate([len(run) for run in a], initial=0))
+    b_starts = list(accumulate([len(run) for run in b], initial=0))
+    matches: List[Match] = []
+    i = j = 0
+    for next_i, next_j in [*align(keys[: len(a)], keys[len(a) :]), (len(a), len(b))]:
+        a_gap, b_gap = list(expand(a[i:next_i])), list(expand(b[j:next_j]))
+        gap_keys = _keys(a_gap + b_gap)
+        matches.extend(
+            (a_starts[i] + x, b_starts[j] + y)
+            for x, y in align(gap_keys[: len(a_gap)], gap_keys[len(a_gap) :])
+        )
+        if next_i < len(a):
+            matches.extend(
+                (a_starts[next_i] + k, b_starts[next_j] + k)
+                for k in range(len(a[next_i]))
+            )
+        i, j = next_i + 1, next_j + 1
+    return matches
+
+
+def step_labels(commands: List[dict]) -> List[str]:
+    """For each command, the last comment before it that names a step."""
+    steps = []
+    current = START
+    for command in commands:
+        if command["commandType"] == "comment":
+            label = str(command["params"].get("message", "")).strip(DECORATION)
+            if any(character.isalpha() for character in label):
+                current = label
+        steps.append(current)
+    return steps
+
+
+@dataclass
+class Change:
+    """A command removed from a, inserted in b, or changed between them."""
+
+    kind: str
+    step: str
+    command_type: str
+    a_index: Optional[int] = None
+    b_index: Optional[int] = None
+    fields: List[str] = field(default_factory=list)
+
+    def __str__(self) -> str:
+        marker = {"removed": "-", "inserted": "+", "changed": "~"}[self.kind]
+        where = self.a_index if self.b_index is None else self.b_index
+        detail = f" ({', '.join(self.fields)})" if self.fields else ""
+        return f"  {marker} #{where} {self.command_type}{detail}"
+
+
+def _changed_fields(before: dict, after: dict) -> List[str]:
+    keys = sorted(set(before) | set(after))
+    return [key for key in keys if before.get(key) != after.get(key)]
+
+
+@dataclass
+class StreamDiff:
+    """Every difference between two command streams, in a's order."""
+
+    a: str
+    b: str
+    a_commands: int
+    b_commands: int
+    changes: List[Change] = field(default_factory=list)
+
+    @property
+    def identical(self) -> bool:
+        return not self.changes
+
+    def counts(self) -> Dict[str, int]:
+        counted = {"removed": 0, "inserted": 0, "changed": 0}
+        for change in self.changes:
+            counted[change.kind] += 1
+        return counted
+
+    def by_step(self) -> Dict[str, List[Change]]:
+        steps: Dict[str, List[Change]] = {}
+        for change in self.changes:
+            steps.setdefault(change.step, []).append(change)
+        return steps
+
+    def as_dict(self) -> dict:
+        return {
+            "a": self.a,
+            "b": self.b,
+            "commands": [self.a_commands, self.b_commands],
+            **self.counts(),
+            "steps": {
+                step: [change.__dict__ for change in changes]
+                for step, changes in self.by_step().items()
+            },
+        }
+
+    def __str__(self) -> str:
+        counted = self.counts()
+        lines = [
+            f"--- {self.a} ({self.a_commands} commands)",
+            f"+++ {self.b} ({self.b_commands} commands)",
+            f"{counted['removed']} removed, {counted['inserted']} inserted, "
+            f"{counted['changed']} changed",
+        ]
+        for step, changes in self.by_step().items():
+            lines.append(f"{step}:")
+            lines.extend(str(change) for change in changes)
+        return "\n".join(lines)
+
+
+class _Differ:
+    """Turns an alignment into Changes, pairing up edits within each gap."""
+
+    def __init__(self, a: List[dict], b: List[dict]) -> None:
+        self.a, self.b = a, b
+        self.a_steps, self.b_steps = step_labels(a), step_labels(b)
+
+    def changes(self, matches: List[Match]) -> Iterator[Change]:
+        i = j = 0
+        for next_i, next_j in [*matches, (len(self.a), len(self.b))]:
+            yield from self._gap(range(i, next_i), range(j, next_j))
+            i, j = next_i + 1, next_j + 1
+
+    def _gap(self, removed: range, inserted: range) -> Iterator[Change]:
+        """Commands of the same type, in order, are changes; the rest are not."""
+        a_types = [self.a[i]["commandType"] for i in removed]
+        b_types = [self.b[j]["commandType"] for j in inserted]
+        type_keys = _keys([{"t": t} for t in a_types + b_types])
+        pairs = align(type_keys[: len(a_types)], type_keys[len(a_types) :])
+        paired_a = {removed[x]: inserted[y] for x, y in pairs}
+        paired_b = set(paired_a.values())
+        for i in removed:
+            command = self.a[i]
+            if i in paired_a:
+                j = paired_a[i]
+                fields = _changed_fields(command["params"], self.b[j]["params"])
+                yield Change(
+                    "changed", self.a_steps[i], command["commandType"], i, j, fields
+                )
+            else:
+                yield Change("removed", self.a_steps[i], command["commandType"], i)
+        for j in inserted:
+            if j not in paired_b:
+                yield Change(
+                    "inserted", self.b_steps[j], self.b[j]["commandType"], None, j
+                )
+
+
+def diff(
+    a: Iterable[dict], b: Iterable[dict], a_name: str = "a", b_name: str = "b"
+) -> StreamDiff:
+    """Align two command streams and describe every difference."""
+    a_runs = list(normalized_runs(as_runs(a)))
+    b_runs = list(normalized_runs(as_runs(b)))
+    a_commands, b_commands = list(expand(a_runs)), list(expand(b_runs))
+    matches = _run_matches(a_runs, b_runs)
+    differ = _Differ(a_commands, b_commands)
+    return StreamDiff(
+        a_name, b_name, len(a_commands), len(b_commands), list(differ.changes(matches))
+    )
+
+
+def commands_of(protocol: Protocol) -> Iterable[dict]:
+    """A protocol's command stream from the recorder, or an analysis file's."""
+    from analysis.recorder import record, record_json
+
+    if protocol.kind == "python":
+        recording = record(protocol.path, None, protocol.csv_files, protocol.labware)
+        return recording.commands
+    streamed = StreamingProtocol(protocol.path)
+    if "schemaVersion" in streamed.header:
+        return record_json(protocol.path).commands
+    # an analysis written by `python -m analysis run`
+    if "commandRuns" in streamed.header:
+        return analysis_commands(streamed.header)
+    return list(streamed.commands())
+
+
+def variants(protocols: Iterable[Protocol]) -> Dict[str, List[Protocol]]:
+    """Python protocols that differ only in an API level suffix, by shared name.
+
+    A name counts only if some copy of it has the suffix, so unrelated
+    protocols that happen to share a file name are not compared.
+    """
+    groups: Dict[str, List[Protocol]] = {}
+    suffixed = set()
+    for protocol in protocols:
+        if protocol.kind == "python":
+            name = API_SUFFIX.sub("", protocol.path.stem)
+            groups.setdefault(name, []).append(protocol)
+            if name != protocol.path.stem:
+                suffixed.add(name)
+    return {
+        name: group
+        for name, group in groups.items()
+        if len(group) > 1 and name in suffixed
+    }
+
+
+def diff_variants(protocols: Iterable[Protocol]) -> List[StreamDiff]:
+    """Every pair of variants of every protocol, each recorded once."""
+    diffs = []
+    for group in variants(protocols).values():
+        streams = {protocol.relative: commands_of(protocol) for protocol in group}
+        for a, b in combinations(sorted(streams), 2):
+            diffs.append(diff(streams[a], streams[b], a, b))
+    return diffs
+
+
+def variants_table(diffs: List[StreamDiff]) -> str:
+    lines = []
+    for result in diffs:
+        counted = result.counts()
+        lines.append(
+            f"{result.a}\n  vs {result.b}: {result.a_commands} -> {result.b_commands} commands, "
+            f"{counted['removed']} removed, {counted['inserted']} inserted, "
+            f"{counted['changed']} changed"
+        )
+    identical = len([result for result in diffs if result.identical])
+    lines.append(f"{len(diffs)} variant pairs, {identical} identical")
+    return "\n".join(lines)
+
+
+def write_variants(diffs: List[StreamDiff], out_dir: Path) -> str:
+    """variants.json and variants.txt in out_dir."""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    (out_dir / "variants.json").write_text(
+        json.dumps([result.as_dict() for result in diffs], indent=2), encoding="utf-8"
+    )
+    table = variants_table(diffs)
+    (out_dir / "variants.txt").write_text(table + "\n", encoding="utf-8")
+    return table
@@ -0,0 +1,132 @@
+"""Find every protocol in the repository along with the files it needs."""
+
+import json
+import re
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+# directories that never hold protocols
+EXCLUDED_DIRS = {"analysis", "results", "__pycache__", "node_modules"}
+
+CSV_PARAMETER = re.compile(r"add_csv_file\(\s*variable_name\s*=\s*[\"'](\w+)[\"']")
+WORD = re.compile(r"[a-z0-9]+")
+
+
+@dataclass(frozen=True)
+class Protocol:
+    """A protocol file and the sidecar files analysis must be given."""
+
+    path: Path
+    relative: str
+    kind: str
+    labware: Tuple[Path, ...] = ()
+    csv_files: Dict[str, Path] = field(default_factory=dict, hash=False)
+
+
+def _walk(root: Path) -> Iterator[Path]:
+    for entry in sorted(root.iterdir()):
+        if entry.name.startswith(".") or entry.name in EXCLUDED_DIRS:
+            continue
+        if entry.is_dir():
+            yield from _walk(entry)
+        elif entry.suffix in (".py", ".json", ".csv"):
+            yield entry
+
+
+def _load_json(path: Path) -> Optional[dict]:
+    try:
+        loaded = json.loads(path.read_text(encoding="utf-8"))
+    except (ValueError, UnicodeDecodeError):
+        return None
+    return loaded if isinstance(loaded, dict) else None
+
+
+def is_labware_definition(contents: Optional[dict]) -> bool:
+    """Labware definitions have an ordering and no commands."""
+    return (
+        contents is not None and "ordering" in contents and "commands" not in contents
+    )
+
+
+def _nearest(candidates: List[Path], protocol: Path) -> Path:
+    """Pick the candidate sharing the longest directory prefix with the protocol.
+
+    Deliberately broken definitions live under error/ and lose every tie.
+    """
+
+    def rank(candidate: Path) -> Tuple[int, bool]:
+        shared = [
+            a for a, b in zip(candidate.parent.parts, protocol.parent.parts) if a == b
+        ]
+        return len(shared), "error" not in candidate.parts
+
+    return max(candidates, key=rank)
+
+
+def _labware_for(
+    source: str, path: Path, labware: Dict[str, List[Path]]
+) -> Tuple[Path, ...]:
+    """Custom labware whose load name is quoted somewhere in the protocol."""
+    found = [
+        _nearest(paths, path)
+        for load_name, paths in labware.items()
+        if f'"{load_name}"' in source or f"'{load_name}'" in source
+    ]
+    return tuple(sorted(found))
+
+
+def _words(name: str) -> set:
+    return set(WORD.findall(name.lower()))
+
+
+def _csv_for(source: str, path: Path, csv_files: List[Path]) -> Dict[str, Path]:
+    """Match each declared CSV parameter to the most similarly named CSV nearby."""
+    variables = CSV_PARAMETER.findall(source)
+    nearby = [csv for csv in csv_files if csv.parent == path.parent]
+    if not variables or not nearby:
+        return {}
+    stem = _words(path.stem)
+    best = max(nearby, key=lambda csv: (len(stem & _words(csv.stem)), -len(csv.name)))
+    return {variable: best for variable in variables}
+
+
+def discover(root: Path = REPO_ROOT) -> List[Protocol]:
+    """Every Python and JSON protocol under root, sorted by path."""
+    python: List[Tuple[Path, str]] = []
+    json_protocols: List[Path] = []
+    csv_files: List[Path] = []
+    labware: Dict[str, List[Path]] = {}
+    for path in _walk(root):
+        if path.suffix == ".csv":
+            csv_files.append(path)
+        elif path.suffix == ".py":
+            source = path.read_text(encoding="utf-8", errors="replace")
+            if "def run(" in source:
+                python.append((path, source))
+        else:
+            contents = _load_json(path)
+            if is_labware_definition(contents):
+                load_name = contents.get("parameters", {}).get("loadName")
+                if load_name:
+                    labware.setdefault(load_name, []).append(path)
+            else:
+                json_protocols.append(path)
+
+    protocols = [
+        Protocol(path, path.relative_to(root).as_posix(), "json")
+        for path in json_protocols
+    ]
+    for path, source in python:
+        protocols.append(
+            Protocol(
+                path,
+                path.relative_to(root).as_posix(),
+                "python",
+                _labware_for(source, path, labware),
+                _csv_for(source, path, csv_files),
+            )
+        )
+    return sorted(protocols, key=lambda protocol: protocol.relative)
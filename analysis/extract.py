@@ -0,0 +1,273 @@
+"""Read protocol metadata, requirements and parameters without running anything.
+
+Protocols are parsed, never imported, so nothing from `opentrons` (or any
+other dependency) is loaded. Values are evaluated from the syntax tree:
+literals, arithmetic on them, f-strings and names bound to earlier
+module-level literals all resolve. Anything else is reported as
+unresolved rather than guessed at.
+"""
+
+import ast
+import csv
+import json
+import operator
+import re
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from analysis.discover import Protocol
+from analysis.recorder.parameters import Parameters
+
+# module-level names kept as constants, e.g. DRYRUN, STEP_WASH, COLUMNS
+CONSTANT = re.compile(r"^[A-Z][A-Z0-9_]*$")
+OPERATORS: Dict[type, Callable[[Any, Any], Any]] = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: operator.pow,
+}
+UNARY_OPERATORS: Dict[type, Callable[[Any], Any]] = {
+    ast.UAdd: operator.pos,
+    ast.USub: operator.neg,
+    ast.Not: operator.not_,
+    ast.Invert: operator.invert,
+}
+# f-string conversions: !s, !r and !a
+CONVERSIONS: Dict[str, Callable[[Any], str]] = {"s": str, "r": repr, "a": ascii}
+PARAMETER_METHODS = ("add_int", "add_float", "add_bool", "add_str", "add_csv_file")
+
+
+class Unresolved(ValueError):
+    """An expression depends on something only running the protocol would know."""
+
+
+@dataclass
+class ProtocolInfo:
+    """What a protocol declares at module level and in add_parameters()."""
+
+    protocol: str
+    metadata: Dict[str, Any] = field(default_factory=dict)
+    requirements: Dict[str, Any] = field(default_factory=dict)
+    parameters: List[dict] = field(default_factory=list)
+    constants: Dict[str, Any] = field(default_factory=dict)
+    errors: List[str] = field(default_factory=list)
+
+    @property
+    def api_level(self) -> Optional[str]:
+        level = self.requirements.get("apiLevel") or self.metadata.get("apiLevel")
+        return None if level is None else str(level)
+
+    @property
+    def robot_type(self) -> str:
+        robot = self.requirements.get("robotType", "OT-2")
+        return "Flex" if robot in ("Flex", "OT-3") else str(robot)
+
+    def as_dict(self) -> dict:
+        return {
+            **asdict(self),
+            "apiLevel": self.api_level,
+            "robotType": self.robot_type,
+        }
+
+
+class _Evaluator:
+    """Evaluates the literal subset of Python against known names."""
+
+    def __init__(self, names: Dict[str, Any]) -> None:
+        self.names = names
+
+    def __call__(self, node: ast.AST) -> Any:
+        method = getattr(self, f"_{type(node).__name__}", None)
+        if method is None:
+            raise Unresolved(f"{ast.unparse(node)} (line {node.lineno})")
+        return method(node)
+
+    def _Constant(self, node: ast.Constant) -> Any:
+        return node.value
+
+    def _Name(self, node: ast.Name) -> Any:
+        if node.id not in self.names:
+            raise Unresolved(f"{node.id} (line {node.lineno})")
+        return self.names[node.id]
+
+    def _List(self, node: ast.List) -> list:
+        return [self(element) for element in node.elts]
+
+    def _Tuple(self, node: ast.Tuple) -> tuple:
+        return tuple(self(element) for element in node.elts)
+
+    def _Set(self, node: ast.Set) -> set:
+        return {self(element) for element in node.elts}
+
+    def _Dict(self, node: ast.Dict) -> dict:
+        if None in node.keys:
+            raise Unresolved(f"** in a dict (line {node.lineno})")
+        return {self(key): self(value) for key, value in zip(node.keys, node.values)}
+
+    def _UnaryOp(self, node: ast.UnaryOp) -> Any:
+        return UNARY_OPERATORS[type(node.op)](self(node.operand))
+
+    def _BinOp(self, node: ast.BinOp) -> Any:
+        combine = OPERATORS.get(type(node.op))
+        if combine is None:
+            raise Unresolved(f"{ast.unparse(node)} (line {node.lineno})")
+        return combine(self(node.left), self(node.right))
+
+    def _JoinedStr(self, node: ast.JoinedStr) -> str:
+        return "".join(str(self(part)) for part in node.values)
+
+    def _FormattedValue(self, node: ast.FormattedValue) -> str:
+        value = self(node.value)
+        if node.conversion != -1:
+            value = CONVERSIONS[chr(node.conversion)](value)
+        spec = "" if node.format_spec is None else self(node.format_spec)
+        try:
+            return format(value, spec)
+        except ValueError:
+            raise Unresolved(f"{ast.unparse(node)} (line {node.lineno})") from None
+
+
+def _assignments(tree: ast.Module) -> Iterable[Tuple[str, ast.expr]]:
+    """Simple `name = value` statements at module level, in order."""
+    for statement in tree.body:
+        if isinstance(statement, ast.AnnAssign) and statement.value is not None:
+            targets, value = [statement.target], statement.value
+        elif isinstance(statement, ast.Assign):
+            targets, value = statement.targets, statement.value
+        else:
+            continue
+        for target in targets:
+            if isinstance(target, ast.Name):
+                yield target.id, value
+
+
+def _module_names(tree: ast.Module, info: ProtocolInfo) -> Dict[str, Any]:
+    """Module-level assignments, in order, that evaluate to literals."""
+    names: Dict[str, Any] = {}
+    evaluate = _Evaluator(names)
+    for name, value in _assignments(tree):
+        try:
+            names[name] = evaluate(value)
+        except Unresolved as error:
+            if name in ("metadata", "requirements"):
+                info.errors.append(f"{name}: cannot resolve {error}")
+        except (TypeError, ArithmeticError):
+            continue
+    return names
+
+
+def _parameter_calls(function: ast.FunctionDef) -> Iterable[ast.Call]:
+    if not function.args.args:
+        return
+    receiver = function.args.args[0].arg
+    for node in ast.walk(function):
+        if (
+            isinstance(node, ast.Call)
+            and isinstance(node.func, ast.Attribute)
+            and node.func.attr in PARAMETER_METHODS
+            and isinstance(node.func.value, ast.Name)
+            and node.func.value.id == receiver
+        ):
+            yield node
+
+
+def _parameters(tree: ast.Module, names: Dict[str, Any], info: ProtocolInfo) -> None:
+    """Replay add_parameters()'s declarations on a recorder Parameters."""
+    functions = [
+        node
+        for node in tree.body
+        if isinstance(node, ast.FunctionDef) and node.name == "add_parameters"
+    ]
+    if not functions:
+        return
+    parameters = Parameters()
+    evaluate = _Evaluator(names)
+    for call in _parameter_calls(functions[-1]):
+        try:
+            args = [evaluate(arg) for arg in call.args]
+            kwargs = {keyword.arg: evaluate(keyword.value) for keyword in call.keywords}
+            getattr(parameters, call.func.attr)(*args, **kwargs)
+        except Unresolved as error:
+            info.errors.append(f"add_parameters: cannot resolve {error}")
+        except TypeError as error:
+            info.errors.append(f"add_parameters (line {call.lineno}): {error}")
+    info.parameters = parameters.definitions
+
+
+def extract_source(source: str, protocol: str) -> ProtocolInfo:
+    """Everything a protocol declares, from its source text."""
+    info = ProtocolInfo(protocol)
+    try:
+        tree = ast.parse(source, protocol)
+    except SyntaxError as error:
+        info.errors.append(f"SyntaxError: {error.msg} (line {error.lineno})")
+        return info
+    names = _module_names(tree, info)
+    for name in ("metadata", "requirements"):
+        value = names.get(name, {})
+        if isinstance(value, dict):
+            setattr(info, name, value)
+    info.constants = {
+        name: value for name, value in names.items() if CONSTANT.match(name)
+    }
+    _parameters(tree, names, info)
+    return info
+
+
+def extract(protocol: Protocol) -> ProtocolInfo:
+    source = protocol.path.read_text(encoding="utf-8", errors="replace")
+    return extract_source(source, protocol.relative)
+
+
+def extract_all(protocols: Iterable[Protocol]) -> List[ProtocolInfo]:
+    """ProtocolInfo for every Python protocol; JSON protocols have no source."""
+    return [extract(p) for p in protocols if p.kind == "python"]
+
+
+def write_parameters_csv(infos: Iterable[ProtocolInfo], destination: Path) -> None:
+    """One row per declared parameter, as params_to_csv.py set out to write."""
+    columns = [
+        "protocol",
+        "type",
+        "variableName",
+        "displayName",
+        "default",
+        "min",
+        "max",
+        "choices",
+        "suffix",
+        "description",
+    ]
+    with destination.open("w", newline="", encoding="utf-8") as handle:
+        writer = csv.DictWriter(handle, columns, extrasaction="ignore")
+        writer.writeheader()
+        for info in infos:
+            for parameter in info.parameters:
+                choices = parameter.get("choices", [])
+                writer.writerow(
+                    {
+                        **parameter,
+                        "protocol": info.protocol,
+                        "choices": "; ".join(str(c["value"]) for c in choices),
+                    }
+                )
+
+
+def write_metadata(infos: List[ProtocolInfo], out_dir: Path) -> str:
+    """metadata.json and parameters.csv under out_dir; gives a one-line summary."""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    (out_dir / "metadata.json").write_text(
+        # sets of constants become lists
+        json.dumps([info.as_dict() for info in infos], indent=2, default=list),
+        encoding="utf-8",
+    )
+    write_parameters_csv(infos, out_dir / "parameters.csv")
+    parameters = sum(len(info.parameters) for info in infos)
+    problems = [f"{info.protocol}: {error}" for info in infos for error in info.errors]
+    return "\n".join(
+        [f"{len(infos)} protocols, {parameters} runtime parameters", *problems]
+    )
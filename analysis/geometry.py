@@ -0,0 +1,115 @@
+"""Well geometry compiled into NumPy arrays, once per labware definition.
+
+Wells are numbered in the definition's ordering, column by column, which
+is the order Labware.wells() gives them in. Every per-well quantity is an
+array indexed by that number, for bulk queries, with plain lists beside
+the ones read one well at a time. Looking a well up by name, or finding
+its row or column and its place in them, is a table lookup.
+"""
+
+import math
+import re
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+ROW_NAME = re.compile(r"^[A-Z]+")
+
+
+class WellIndex:
+    """Arrays of well positions and dimensions, with name, row and column tables."""
+
+    def __init__(self, definition: dict) -> None:
+        ordering = definition.get("ordering", [])
+        wells = definition.get("wells", {})
+        self.names: List[str] = [name for column in ordering for name in column]
+        self.positions: Dict[str, int] = {
+            name: number for number, name in enumerate(self.names)
+        }
+        geometry = [wells[name] for name in self.names]
+
+        def column(key: str, default: float = np.nan) -> np.ndarray:
+            return np.array([well.get(key, default) for well in geometry], dtype=float)
+
+        self.bottoms = np.stack(
+            [column("x", 0), column("y", 0), column("z", 0)], axis=-1
+        ).reshape(-1, 3)
+        self.depth = column("depth", 0)
+        self.diameter = column("diameter")
+        self.x_dimension = column("xDimension")
+        self.y_dimension = column("yDimension")
+        self.max_volume = column("totalLiquidVolume", 0)
+        rise = np.zeros_like(self.bottoms)
+        rise[:, 2] = self.depth
+        self.tops = self.bottoms + rise
+        # plain Python copies for wells looked up one at a time, which NumPy
+        # is slower at than a list; the arrays are for bulk queries
+        self.bottom_list: List[Tuple[float, ...]] = [
+            tuple(point) for point in self.bottoms.tolist()
+        ]
+        self.top_list: List[Tuple[float, ...]] = [
+            tuple(point) for point in self.tops.tolist()
+        ]
+        # max volume, depth, diameter, x and y dimension; None where absent
+        self.dimensions: List[Tuple[Optional[float], ...]] = [
+            tuple(None if math.isnan(value) else value for value in values)
+            for values in zip(
+                self.max_volume.tolist(),
+                self.depth.tolist(),
+                self.diameter.tolist(),
+                self.x_dimension.tolist(),
+                self.y_dimension.tolist(),
+            )
+        ]
+        self.columns: List[np.ndarray] = [
+            np.array([self.positions[name] for name in names], dtype=int)
+            for names in ordering
+        ]
+        rows: Dict[str, List[int]] = {}
+        for number, name in enumerate(self.names):
+            found = ROW_NAME.match(name)
+            rows.setdefault(found.group() if found else name, []).append(number)
+        self.rows: Dict[str, np.ndarray] = {
+            name: np.array(rows[name], dtype=int)
+            for name in sorted(rows, key=lambda row: (len(row), row))
+        }
+        # for each well, its column's number and its row's name, and how far
+        # along each it is
+        self.in_column: List[Tuple[int, int]] = [(0, 0)] * len(self.names)
+        for number, names in enumerate(ordering):
+            for along, name in enumerate(names):
+                self.in_column[self.positions[name]] = (number, along)
+        self.in_row: List[Tuple[str, int]] = [("", 0)] * len(self.names)
+        for name, numbers in rows.items():
+            for along, well in enumerate(numbers):
+                self.in_row[well] = (name, along)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+
+# indexes kept for the definitions used most recently
+MAX_INDEXES = 256
+# keyed by id(); the definition is kept alongside, so an id reused after
+# its definition was dropped is told apart by identity
+_INDEXES: "OrderedDict[int, Tuple[dict, WellIndex]]" = OrderedDict()
+
+
+def index_for(definition: dict) -> WellIndex:
+    """The compiled index for a definition, built the first time it is seen.
+
+    Definitions are shared and read-only (see analysis.labware_store), so
+    one index serves every labware loaded from the same definition. Only the
+    MAX_INDEXES used most recently are kept.
+    """
+    cached = _INDEXES.get(id(definition))
+    if cached is not None and cached[0] is definition:
+        _INDEXES.move_to_end(id(definition))
+        return cached[1]
+    index = WellIndex(definition)
+    _INDEXES[id(definition)] = (definition, index)
+    _INDEXES.move_to_end(id(definition))
+    if len(_INDEXES) > MAX_INDEXES:
+        _INDEXES.popitem(last=False)
+    return index
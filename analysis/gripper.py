@@ -0,0 +1,317 @@
+"""Map where labware travels and find gripper trips a protocol could skip.
+
+Every moveLabware is resolved to the deck slots it leaves and reaches,
+following labware stacked on adapters and modules down to their slot.
+Gripper trips are costed by the distance between slot centers. A labware
+that is moved, left untouched, then moved again took a detour: going
+straight to the second destination, or staying put when that destination
+is where it came from, saves the difference.
+
+A labware counts as used at a stop when a command names it or the module
+under it, or when a delay runs while it sits on a magnetic block, which
+works by being waited on.
+"""
+
+import json
+import math
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from analysis.runs import analysis_commands
+from analysis.runtime import duration
+
+OFF_DECK = "offDeck"
+FLEX_ROBOT = "OT-3 Standard"
+OT2_ROBOT = "OT-2 Standard"
+# where addressable areas that take labware sit on the deck
+AREAS = {"gripperWasteChute": "D3"}
+FLEX_ROWS = "DCBA"
+# slot pitch in millimeters, left to right and front to back
+FLEX_PITCH = (164.0, 107.0)
+OT2_PITCH = (132.5, 90.5)
+# commands that only let labware on or off a module, without using it
+HANDLING = (
+    "heaterShaker/openLabwareLatch",
+    "heaterShaker/closeLabwareLatch",
+    "thermocycler/openLid",
+    "thermocycler/closeLid",
+)
+# gripping, lifting and releasing, then travel at the gripper's speed
+GRIP_SECONDS = 10.0
+GRIPPER_MM_PER_SECOND = 100.0
+
+
+def deck_slot(slot: str, robot_type: str) -> str:
+    """A slot as the robot's own deck names it.
+
+    Flex protocols may number slots 1-12 the way the OT-2 does; those are
+    D1 to A3, front to back.
+    """
+    if robot_type == FLEX_ROBOT and slot.isdigit() and 1 <= int(slot) <= 12:
+        number = int(slot) - 1
+        return f"{FLEX_ROWS[number // 3]}{number % 3 + 1}"
+    return slot
+
+
+def slot_center(slot: str) -> Optional[Tuple[float, float]]:
+    """A slot's center on the deck, from the front left slot's; None off deck."""
+    if slot[:1] in FLEX_ROWS and slot[1:].isdigit():
+        return (
+            (int(slot[1:]) - 1) * FLEX_PITCH[0],
+            FLEX_ROWS.index(slot[0]) * FLEX_PITCH[1],
+        )
+    if slot.isdigit():
+        column, row = (int(slot) - 1) % 3, (int(slot) - 1) // 3
+        return column * OT2_PITCH[0], row * OT2_PITCH[1]
+    return None
+
+
+def trip_seconds(source: str, destination: str) -> float:
+    """Modeled seconds for one gripper trip between two slots."""
+    start, end = slot_center(source), slot_center(destination)
+    if start is None or end is None:
+        return GRIP_SECONDS
+    return GRIP_SECONDS + math.dist(start, end) / GRIPPER_MM_PER_SECOND
+
+
+@dataclass
+class Move:
+    """One moveLabware, resolved to slots."""
+
+    index: int
+    labware: str
+    source: str
+    destination: str
+    gripper: bool
+
+    @property
+    def seconds(self) -> float:
+        return trip_seconds(self.source, self.destination) if self.gripper else 0.0
+
+
+@dataclass
+class Detour:
+    """Two moves of one labware with nothing using it at the stop between."""
+
+    labware: str
+    first: int
+    second: int
+    source: str
+    via: str
+    destination: str
+    saved: float
+
+    @property
+    def round_trip(self) -> bool:
+        return self.source == self.destination
+
+
+@dataclass
+class GripperPlan:
+    """Every labware move in one protocol and the detours among them."""
+
+    protocol: str
+    moves: List[Move] = field(default_factory=list)
+    detours: List[Detour] = field(default_factory=list)
+
+    @property
+    def gripper_seconds(self) -> float:
+        return sum(move.seconds for move in self.moves)
+
+    @property
+    def saved(self) -> float:
+        return sum(detour.saved for detour in self.detours)
+
+    def edges(self) -> Dict[Tuple[str, str], int]:
+        """How often labware travels each way between two places."""
+        counted: Dict[Tuple[str, str], int] = {}
+        for move in self.moves:
+            edge = (move.source, move.destination)
+            counted[edge] = counted.get(edge, 0) + 1
+        return counted
+
+
+class MoveTracker:
+    """Walks one command stream, keeping where everything is and what is in use."""
+
+    def __init__(self, plan: GripperPlan, robot_type: str = OT2_ROBOT) -> None:
+        self.plan = plan
+        self.robot_type = robot_type
+        self.locations: Dict[str, object] = {}
+        self.models: Dict[str, str] = {}
+        # the move that brought each labware to where it is, if nothing used it since
+        self.idle: Dict[str, Move] = {}
+        self.handlers: Dict[str, Callable[[int, dict], None]] = {
+            "loadModule": self._load_module,
+            "loadLabware": self._load_labware,
+            "moveLabware": self._move,
+            "waitForDuration": self._delay,
+        }
+
+    def command(self, index: int, command_type: str, params: dict) -> None:
+        handler = self.handlers.get(command_type)
+        if handler is not None:
+            handler(index, params)
+        elif command_type not in HANDLING:
+            self._use(params)
+
+    def slot(self, location: object) -> str:
+        """The deck slot a location is in, through any stack of modules and labware."""
+        for _ in range(len(self.locations) + 1):
+            if not isinstance(location, dict):
+                return str(location or OFF_DECK)
+            if "slotName" in location:
+                return deck_slot(str(location["slotName"]), self.robot_type)
+            if "addressableAreaName" in location:
+                area = location["addressableAreaName"]
+                return AREAS.get(area, area)
+            location = self.locations.get(
+                location.get("moduleId") or location.get("labwareId")
+            )
+        return OFF_DECK
+
+    def _load_module(self, index: int, params: dict) -> None:
+        self.locations[params.get("moduleId", "")] = params.get("location")
+        self.models[params.get("moduleId", "")] = str(params.get("model", ""))
+
+    def _load_labware(self, index: int, params: dict) -> None:
+        self.locations[params.get("labwareId", "")] = params.get("location")
+
+    def _use(self, params: dict) -> None:
+        self.idle.pop(params.get("labwareId", ""), None)
+        module = params.get("moduleId")
+        for labware_id in list(self.idle) if module else []:
+            if self._on(labware_id, module):
+                del self.idle[labware_id]
+
+    def _on(self, labware_id: str, module_id: str) -> bool:
+        location = self.locations.get(labware_id)
+        while isinstance(location, dict) and "labwareId" in location:
+            location = self.locations.get(location["labwareId"])
+        return isinstance(location, dict) and location.get("moduleId") == module_id
+
+    def _delay(self, index: int, params: dict) -> None:
+        for labware_id in list(self.idle):
+            location = self.locations.get(labware_id)
+            module = location.get("moduleId") if isinstance(location, dict) else None
+            if self.models.get(str(module), "").startswith("magneticBlock"):
+                del self.idle[labware_id]
+
+    def _move(self, index: int, params: dict) -> None:
+        labware_id = params.get("labwareId", "")
+        source = self.slot(self.locations.get(labware_id))
+        self.locations[labware_id] = params.get("newLocation")
+        move = Move(
+            index,
+            labware_id,
+            source,
+            self.slot(params.get("newLocation")),
+            params.get("strategy") == "usingGripper",
+        )
+        self.plan.moves.append(move)
+        earlier = self.idle.pop(labware_id, None)
+        if earlier is not None and earlier.gripper and move.gripper:
+            # each move is skipped at most once, so back and forth shuffles pair up
+            self.plan.detours.append(_detour(earlier, move))
+        else:
+            self.idle[labware_id] = move
+
+
+def _detour(first: Move, second: Move) -> Detour:
+    direct = (
+        0.0
+        if first.source == second.destination
+        else trip_seconds(first.source, second.destination)
+    )
+    return Detour(
+        first.labware,
+        first.index,
+        second.index,
+        first.source,
+        first.destination,
+        second.destination,
+        first.seconds + second.seconds - direct,
+    )
+
+
+def plan(
+    protocol: str, commands: Iterable[dict], robot_type: str = OT2_ROBOT
+) -> GripperPlan:
+    """The moves and detours of one command stream."""
+    result = GripperPlan(protocol)
+    tracker = MoveTracker(result, robot_type)
+    for index, command in enumerate(commands):
+        tracker.command(
+            index, command.get("commandType", ""), command.get("params") or {}
+        )
+    return result
+
+
+def plan_analysis(protocol: str, analysis: Path) -> GripperPlan:
+    """The plan from an analysis JSON file written by either analyzer."""
+    loaded = json.loads(analysis.read_text(encoding="utf-8"))
+    return plan(protocol, analysis_commands(loaded), loaded.get("robotType", OT2_ROBOT))
+
+
+def gripper_table(plans: List[GripperPlan]) -> str:
+    """Protocols moving labware, the most gripper time to save first."""
+    shown = [result for result in plans if result.moves]
+    width = max([len(result.protocol) for result in shown] + [len("protocol")])
+    lines = [
+        f"{'protocol':<{width}}  {'moves':>5}  {'manual':>6}  {'gripper':>8}  "
+        f"{'detours':>7}  {'saved':>8}  busiest route"
+    ]
+    for result in sorted(shown, key=lambda r: (-r.saved, r.protocol)):
+        manual = len([move for move in result.moves if not move.gripper])
+        (source, destination), count = max(
+            result.edges().items(), key=lambda item: item[1]
+        )
+        lines.append(
+            f"{result.protocol:<{width}}  {len(result.moves):>5}  {manual:>6}  "
+            f"{duration(result.gripper_seconds):>8}  {len(result.detours):>7}  "
+            f"{duration(result.saved):>8}  {source} -> {destination} x{count}"
+        )
+    lines.append(
+        f"{len(shown)} protocols moving labware, "
+        f"{duration(sum(result.saved for result in shown))} of gripper time in detours"
+    )
+    return "\n".join(lines)
+
+
+def write_gripper(plans: List[GripperPlan], out_dir: Path) -> str:
+    """gripper.json, listing every detour, and gripper.txt in out_dir."""
+    (out_dir / "gripper.json").write_text(
+        json.dumps(
+            [
+                {
+                    "protocol": result.protocol,
+                    "moves": len(result.moves),
+                    "gripperSeconds": result.gripper_seconds,
+                    "savedSeconds": result.saved,
+                    "routes": [
+                        {"from": source, "to": destination, "count": count}
+                        for (source, destination), count in result.edges().items()
+                    ],
+                    "detours": [asdict(detour) for detour in result.detours],
+                }
+                for result in plans
+                if result.moves
+            ],
+            indent=2,
+        ),
+        encoding="utf-8",
+    )
+    table = gripper_table(plans)
+    (out_dir / "gripper.txt").write_text(table + "\n", encoding="utf-8")
+    return table
+
+
+def gripper_results(out_dir: Path) -> List[GripperPlan]:
+    """Plans for every protocol in a results directory's summary.json."""
+    summary = json.loads((out_dir / "summary.json").read_text(encoding="utf-8"))
+    return [
+        plan_analysis(result["protocol"], Path(result["output"]))
+        for result in summary
+        if result["status"] == "ok" and result["output"]
+    ]
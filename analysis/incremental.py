@@ -0,0 +1,68 @@
+"""Re-analyze only what changed since a git ref and fold it into the last report."""
+
+import json
+import subprocess
+from pathlib import Path
+from typing import List, Set
+
+from analysis.discover import Protocol
+from analysis.runner import AnalysisResult
+
+
+def changed_files(base: str, root: Path) -> Set[Path]:
+    """Files that differ from base, including uncommitted and untracked ones."""
+    commands = [
+        ["git", "diff", "--name-only", "-z", base],
+        ["git", "ls-files", "--others", "--exclude-standard", "-z"],
+    ]
+    top = subprocess.run(
+        ["git", "rev-parse", "--show-toplevel"],
+        cwd=root,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.strip()
+    changed = set()
+    for command in commands:
+        output = subprocess.run(
+            command, cwd=top, capture_output=True, text=True, check=True
+        ).stdout
+        changed.update(Path(top, name).resolve() for name in output.split("\0") if name)
+    return changed
+
+
+def affected(protocols: List[Protocol], changed: Set[Path]) -> List[Protocol]:
+    """Protocols that changed or read a custom labware or CSV file that did."""
+    return [
+        protocol
+        for protocol in protocols
+        if {
+            path.resolve()
+            for path in (protocol.path, *protocol.labware, *protocol.csv_files.values())
+        }
+        & changed
+    ]
+
+
+def previous_results(out_dir: Path) -> List[AnalysisResult]:
+    """The results of the last run written to out_dir, if there was one."""
+    summary = out_dir / "summary.json"
+    if not summary.exists():
+        return []
+    entries = json.loads(summary.read_text(encoding="utf-8"))
+    return [AnalysisResult(**entry) for entry in entries]
+
+
+def merge(
+    previous: List[AnalysisResult],
+    fresh: List[AnalysisResult],
+    protocols: List[Protocol],
+) -> List[AnalysisResult]:
+    """Fresh results replace previous ones; protocols that are gone drop out."""
+    existing = {protocol.relative for protocol in protocols}
+    merged = {result.protocol: result for result in previous}
+    merged.update((result.protocol, result) for result in fresh)
+    return sorted(
+        (result for name, result in merged.items() if name in existing),
+        key=lambda result: result.protocol,
+    )
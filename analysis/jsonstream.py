@@ -0,0 +1,225 @@
+"""Read JSON protocols (schema v3-v6) incrementally instead of all at once.
+
+Only the value being asked for is ever decoded. Commands are yielded one at
+a time from a fixed-size read buffer, and labware definitions are located
+by byte offset on the first pass and decoded only when looked up, so memory
+stays flat however long the command list is.
+"""
+
+import codecs
+import json
+import re
+from pathlib import Path
+from typing import IO, Any, Dict, Iterator, Optional, Tuple
+
+from analysis import labware_store
+from analysis.labware_store import LabwareStore
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+# the large top-level members, which are indexed or streamed rather than decoded
+STREAMED = ("commands", "labwareDefinitions", "commandAnnotations")
+
+WHITESPACE = re.compile(r"[ \t\r\n]*")
+
+
+class JSONStreamError(ValueError):
+    """The file is not a JSON object, or ends part way through one."""
+
+
+class _Reader:
+    """A read buffer over a binary file that knows its byte offset in the file.
+
+    Values are decoded by the C decoder; one that is cut off at the end of
+    the buffer is decoded again once the next chunk has been read.
+    """
+
+    def __init__(self, handle: IO[bytes], chunk_size: int) -> None:
+        self.handle = handle
+        self.chunk_size = chunk_size
+        self.text = codecs.getincrementaldecoder("utf-8")()
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.offset = handle.tell()
+        self.position = 0
+        self.final = False
+
+    def _more(self) -> None:
+        if self.final:
+            raise JSONStreamError(f"Unexpected end of file at byte {self.tell()}")
+        chunk = self.handle.read(self.chunk_size)
+        self.final = not chunk
+        self.offset = self.tell()
+        self.buffer = self.buffer[self.position :] + self.text.decode(chunk, self.final)
+        self.position = 0
+
+    def tell(self) -> int:
+        """The byte offset in the file of the next unread character."""
+        return self.offset + len(self.buffer[: self.position].encode())
+
+    def peek(self) -> str:
+        """The next non-whitespace character, without consuming it."""
+        while True:
+            self.position = WHITESPACE.match(self.buffer, self.position).end()
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            self._more()
+
+    def expect(self, token: str) -> None:
+        if self.peek() != token:
+            raise JSONStreamError(f"Expected {token!r} at byte {self.tell()}")
+        self.position += 1
+
+    def value(self) -> Any:
+        """Decode and consume the next value."""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+            except json.JSONDecodeError as error:
+                if self.final:
+                    raise JSONStreamError(str(error)) from error
+                self._more()
+                continue
+            # a number at the end of the buffer may continue in the next chunk
+            if end < len(self.buffer) or self.final:
+                self.position = end
+                return value
+            self._more()
+
+    def skip(self) -> Tuple[int, int]:
+        """Consume the next value a member at a time; its start and end offsets."""
+        opening = self.peek()
+        start = self.tell()
+        if opening in "[{":
+            self.position += 1
+            for _ in self.members("]" if opening == "[" else "}"):
+                self.value()
+        else:
+            self.value()
+        return start, self.tell()
+
+    def members(self, closing: str) -> Iterator[Optional[str]]:
+        """Step through an object's members or an array's items.
+
+        The reader is left at each value; object members yield their key.
+        """
+        if self.peek() == closing:
+            self.position += 1
+            return
+        while True:
+            key = None
+            if closing == "}":
+                key = self.value()
+                self.expect(":")
+            yield key
+            if self.peek() == closing:
+                self.position += 1
+                return
+            self.expect(",")
+
+
+class StreamingProtocol:
+    """A JSON protocol whose commands are read on demand.
+
+    Small top-level members (metadata, robot, pipettes, labware, modules,
+    liquids, ...) are decoded into header. labwareDefinitions is indexed,
+    not decoded, and commands are streamed. Definitions that are looked up
+    come from the labware store, so each distinct one is parsed only once.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        store: Optional[LabwareStore] = None,
+    ) -> None:
+        self.path = path
+        self.chunk_size = chunk_size
+        self.store = labware_store.shared if store is None else store
+        self._header: Dict[str, Any] = {}
+        self._definitions: Dict[str, Tuple[int, int]] = {}
+        self._commands: Optional[int] = None
+        self._complete = False
+        self._digests: Dict[str, str] = {}
+
+    def _seen(self, key: str) -> bool:
+        return key in self._header or (key == "commands" and self._commands is not None)
+
+    def _index(self, until: Optional[str] = None) -> None:
+        """Walk the top-level members, stopping early once until is found."""
+        if self._complete or (until is not None and self._seen(until)):
+            return
+        with self.path.open("rb") as handle:
+            reader = _Reader(handle, self.chunk_size)
+            reader.expect("{")
+            for key in reader.members("}"):
+                if key == "labwareDefinitions":
+                    self._index_definitions(reader)
+                elif key == "commands":
+                    reader.peek()
+                    self._commands = reader.tell()
+                    if until == key:
+                        return
+                    reader.skip()
+                elif key in STREAMED:
+                    reader.skip()
+                else:
+                    self._header[key] = reader.value()
+                if until is not None and key == until:
+                    return
+        self._complete = True
+
+    def _index_definitions(self, reader: _Reader) -> None:
+        reader.expect("{")
+        for key in reader.members("}"):
+            start, end = reader.skip()
+            self._definitions[key] = (start, end - start)
+
+    @property
+    def header(self) -> Dict[str, Any]:
+        """Every top-level member except commands and labware definitions."""
+        self._index()
+        return self._header
+
+    @property
+    def schema_version(self) -> int:
+        self._index("schemaVersion")
+        return int(self._header.get("schemaVersion", 0))
+
+    def commands(self) -> Iterator[dict]:
+        """Each command in order, decoded only when it is reached."""
+        self._index("commands")
+        if self._commands is None:
+            raise JSONStreamError(f"{self.path} has no commands")
+        with self.path.open("rb") as handle:
+            handle.seek(self._commands)
+            reader = _Reader(handle, self.chunk_size)
+            reader.expect("[")
+            for _ in reader.members("]"):
+                yield reader.value()
+
+    def definition_keys(self) -> Iterator[str]:
+        self._index()
+        return iter(self._definitions)
+
+    def labware_definition(self, uri: str) -> dict:
+        """A definition by URI, or by the definitionId schema v3-v5 refer to.
+
+        The definition is shared with every other protocol using it; do not
+        modify it.
+        """
+        if uri in self._digests:
+            return self.store.get(self._digests[uri])
+        self._index()
+        key = uri if uri in self._definitions else None
+        for candidate in self._definitions:
+            # schema v3-v5 keys are "<uuid>:<namespace>/<loadName>/<version>"
+            if key is None and candidate.rpartition(":")[2] == uri:
+                key = candidate
+        if key is None:
+            raise KeyError(uri)
+        start, length = self._definitions[key]
+        with self.path.open("rb") as handle:
+            handle.seek(start)
+            self._digests[uri] = self.store.add_raw(handle.read(length))
+        return self.store.get(self._digests[uri])
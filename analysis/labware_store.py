@@ -0,0 +1,120 @@
+"""One shared copy of each distinct labware definition, keyed by content.
+
+JSON protocols embed full labware definitions, mostly the same few over and
+over. A definition is parsed and validated the first time its bytes are
+seen; every later occurrence, in any protocol, gets the same dict back.
+Shared definitions must be treated as read-only.
+"""
+
+import hashlib
+import json
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Union
+
+# what analysis needs from a definition before it can place and use it
+REQUIRED = ("ordering", "wells", "parameters", "dimensions", "namespace", "version")
+
+
+class LabwareDefinitionError(ValueError):
+    """A labware definition is missing something analysis needs."""
+
+
+def canonical_hash(definition: dict) -> str:
+    """SHA-256 of the definition with keys sorted and whitespace removed."""
+    canonical = json.dumps(definition, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def validate(definition: dict) -> None:
+    missing = [key for key in REQUIRED if key not in definition]
+    if missing:
+        raise LabwareDefinitionError(
+            f"Labware definition is missing {', '.join(missing)}"
+        )
+    if "loadName" not in definition["parameters"]:
+        raise LabwareDefinitionError("Labware definition has no loadName")
+    unknown = {name for column in definition["ordering"] for name in column}
+    unknown -= set(definition["wells"])
+    if unknown:
+        raise LabwareDefinitionError(
+            f"Labware ordering names wells it does not define: {sorted(unknown)}"
+        )
+
+
+@dataclass
+class StoreStats:
+    """How much sharing the store has done."""
+
+    references: int = 0
+    distinct: int = 0
+    parsed: int = 0
+    bytes_shared: int = 0
+
+    def __str__(self) -> str:
+        return (
+            f"labware: {self.references} definitions referenced, "
+            f"{self.distinct} distinct, {self.parsed} parsed, "
+            f"{self.bytes_shared / 1024:.0f} KiB not held twice"
+        )
+
+
+class LabwareStore:
+    """Definitions by canonical hash, with the raw bytes already seen mapped to them."""
+
+    def __init__(self) -> None:
+        self._definitions: Dict[str, dict] = {}
+        self._raw: Dict[str, str] = {}
+        self._uris: Dict[str, List[str]] = {}
+        self.stats = StoreStats()
+
+    def add(self, definition: dict) -> str:
+        """Validate and keep a parsed definition; gives its canonical hash."""
+        digest = canonical_hash(definition)
+        self.stats.references += 1
+        if digest not in self._definitions:
+            validate(definition)
+            self._definitions[digest] = definition
+            self._uris.setdefault(uri(definition), []).append(digest)
+            self.stats.distinct += 1
+        return digest
+
+    def add_raw(self, raw: Union[bytes, str]) -> str:
+        """Like add(), but bytes seen before are neither parsed nor validated again."""
+        data = raw.encode() if isinstance(raw, str) else raw
+        raw_digest = hashlib.sha256(data).hexdigest()
+        if raw_digest in self._raw:
+            self.stats.references += 1
+            self.stats.bytes_shared += len(data)
+            return self._raw[raw_digest]
+        self.stats.parsed += 1
+        digest = self.add(json.loads(data))
+        self._raw[raw_digest] = digest
+        return digest
+
+    def add_file(self, path: Path) -> str:
+        return self.add_raw(path.read_bytes())
+
+    def get(self, digest: str) -> dict:
+        """The shared definition for a hash; do not modify it."""
+        return self._definitions[digest]
+
+    def by_uri(self, labware_uri: str) -> List[dict]:
+        """Every distinct definition with this namespace/loadName/version."""
+        return [self._definitions[digest] for digest in self._uris.get(labware_uri, [])]
+
+    def __len__(self) -> int:
+        return len(self._definitions)
+
+    def __contains__(self, digest: object) -> bool:
+        return digest in self._definitions
+
+
+def uri(definition: dict) -> str:
+    """namespace/loadName/version, how schema v6 keys labwareDefinitions."""
+    load_name = definition.get("parameters", {}).get("loadName")
+    return f"{definition.get('namespace')}/{load_name}/{definition.get('version')}"
+
+
+# one per process, so pool workers share definitions across the protocols they run
+shared = LabwareStore()
@@ -0,0 +1,402 @@
+"""Follow liquid volumes through a protocol, well by well.
+
+One pass over the command stream works out how much liquid each command
+moves into or out of which wells, following what each pipette holds.
+Volumes are then settled in bulk: every well's changes are ordered and
+summed at once, so a running volume for every well after every command
+comes from a single cumulative sum however long the protocol is.
+
+A well is only checked once its starting volume is known. Labware given
+liquid with load_liquid starts with exactly what was loaded, so drawing
+more than that is an underflow. Other labware may hold samples the
+protocol never declared; its wells are only checked for overflow, and
+only if they were dispensed into before anything was drawn from them.
+"""
+
+import json
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from analysis.diff import step_labels
+from analysis.geometry import WellIndex, index_for
+from analysis.recorder.instrument import pipette_spec
+from analysis.recorder.labware import synthesize_definition
+from analysis.runs import analysis_commands
+from analysis.tips import active_channels
+
+# microliters of rounding that do not count as an underflow or overflow
+TOLERANCE = 0.01
+NOZZLE_ROWS = 8
+NOZZLE_COLUMNS = 12
+LOAD, DISPENSE, ASPIRATE = 0, 1, 2
+
+
+def _nozzle_grid(channels: int) -> Tuple[int, int]:
+    """Rows and columns of nozzles for a number of active channels."""
+    if channels == NOZZLE_COLUMNS:
+        return 1, NOZZLE_COLUMNS
+    if channels <= NOZZLE_ROWS:
+        return channels, 1
+    return NOZZLE_ROWS, max(1, channels // NOZZLE_ROWS)
+
+
+def _spread(wells: np.ndarray, start: int, count: int, pitch: int) -> np.ndarray:
+    """The wells count nozzles reach along a row or column, from start.
+
+    A row or column with fewer wells than nozzles (a reservoir) takes every
+    nozzle in the one well; 384 well plates are reached every other well.
+    """
+    if len(wells) == 1:
+        return np.repeat(wells, count)
+    stride = max(1, len(wells) // pitch)
+    return wells[start::stride][:count]
+
+
+def nozzle_wells(index: WellIndex, well: str, channels: int) -> np.ndarray:
+    """The well each active nozzle lands in, repeated when several share one."""
+    number = index.positions[well]
+    if channels == 1:
+        return np.array([number])
+    rows, columns = _nozzle_grid(channels)
+    column, along = index.in_column[number]
+    down = _spread(index.columns[column], along, rows, NOZZLE_ROWS)
+    if columns == 1:
+        return down
+    reached = []
+    for top in down.tolist():
+        row, along = index.in_row[top]
+        reached.append(_spread(index.rows[row], along, columns, NOZZLE_COLUMNS))
+    return np.concatenate(reached)
+
+
+@dataclass
+class Flag:
+    """A well that ran dry or overflowed, at the first command it happened."""
+
+    kind: str
+    labware: str
+    well: str
+    index: int
+    step: str
+    volume: float
+
+
+@dataclass
+class LiquidReport:
+    """Everything the volume simulation found in one protocol."""
+
+    protocol: str
+    flags: List[Flag] = field(default_factory=list)
+    residuals: Dict[str, Dict[str, float]] = field(default_factory=dict)
+    loaded: float = 0.0
+    moved: float = 0.0
+    undeclared: int = 0
+
+    def count(self, kind: str) -> int:
+        return len([flag for flag in self.flags if flag.kind == kind])
+
+
+class _Labware:
+    """A loaded labware's wells, numbered from offset among all wells."""
+
+    def __init__(self, name: str, index: WellIndex, offset: int) -> None:
+        self.name = name
+        self.index = index
+        self.offset = offset
+
+
+class LiquidTracker:
+    """One pass over the commands, turning them into per-well volume changes."""
+
+    def __init__(self) -> None:
+        self.labware: Dict[str, _Labware] = {}
+        self.wells = 0
+        self.channels: Dict[str, int] = {}
+        self.active: Dict[str, int] = {}
+        self.held: Dict[str, float] = {}
+        self.location: Dict[str, Tuple[str, str]] = {}
+        self.events: List[Tuple[int, float, int, int]] = []
+        # liquid emptied into a trash bin or waste chute: (area, volume, command)
+        self.discarded: List[Tuple[str, float, int]] = []
+        # labware given liquid with loadLiquid, whose starting volumes are known
+        self.declared: Set[str] = set()
+        self.handlers: Dict[str, Callable[[int, dict], None]] = {
+            "loadPipette": self._load_pipette,
+            "configureNozzleLayout": self._configure_nozzles,
+            "loadLiquid": self._load_liquid,
+            "aspirate": self._aspirate,
+            "aspirateInPlace": self._aspirate,
+            "dispense": self._dispense,
+            "dispenseInPlace": self._dispense,
+            "blowout": self._blow_out,
+            "blowOutInPlace": self._blow_out,
+            "dropTip": self._drop,
+            "dropTipInPlace": self._drop,
+        }
+
+    def command(
+        self,
+        index: int,
+        command_type: str,
+        params: dict,
+        result: Optional[dict] = None,
+    ) -> None:
+        if command_type == "loadLabware":
+            self._load_labware(params, result or {})
+            return
+        pipette = params.get("pipetteId")
+        if pipette and "labwareId" in params and "wellName" in params:
+            self.location[pipette] = (params["labwareId"], params["wellName"])
+        elif pipette and params.get("addressableAreaName"):
+            # a trash bin or waste chute, which has no wells
+            self.location[pipette] = ("", params["addressableAreaName"])
+        handler = self.handlers.get(command_type)
+        if handler is not None:
+            handler(index, params)
+
+    def _load_labware(self, params: dict, result: dict) -> None:
+        load_name = str(params.get("loadName", ""))
+        definition = result.get("definition")
+        if definition is None:
+            # only recordings of standard labware leave the definition out
+            if not load_name:
+                return
+            definition = synthesize_definition(load_name, "adapter" in load_name)
+        well_index = index_for(definition)
+        if len(well_index):
+            name = params.get("displayName") or load_name
+            labware_id = params.get("labwareId") or result.get("labwareId", "")
+            self.labware[labware_id] = _Labware(str(name), well_index, self.wells)
+            self.wells += len(well_index)
+
+    def _load_pipette(self, index: int, params: dict) -> None:
+        channels = pipette_spec(str(params.get("pipetteName", "")))[0]
+        self.channels[params.get("pipetteId", "")] = channels
+        self.active[params.get("pipetteId", "")] = channels
+
+    def _configure_nozzles(self, index: int, params: dict) -> None:
+        pipette = params.get("pipetteId", "")
+        self.active[pipette] = active_channels(
+            self.channels.get(pipette, 1), params.get("configurationParams", {})
+        )
+
+    def _record(
+        self, index: int, kind: int, volume: float, labware_id: str, wells: np.ndarray
+    ) -> None:
+        labware = self.labware.get(labware_id)
+        if labware is None:
+            return
+        for well in wells:
+            self.events.append((labware.offset + int(well), volume, index, kind))
+
+    def _targets(self, pipette: str) -> Tuple[str, np.ndarray]:
+        """The labware and the well under each nozzle where the pipette is."""
+        labware_id, well = self.location.get(pipette, ("", ""))
+        labware = self.labware.get(labware_id)
+        if labware is None or well not in labware.index.positions:
+            return labware_id, np.array([], dtype=int)
+        return labware_id, nozzle_wells(
+            labware.index, well, self.active.get(pipette, 1)
+        )
+
+    def _load_liquid(self, index: int, params: dict) -> None:
+        labware = self.labware.get(params.get("labwareId", ""))
+        if labware is None:
+            return
+        self.declared.add(params["labwareId"])
+        for well, volume in (params.get("volumeByWell") or {}).items():
+            if well in labware.index.positions:
+                number = np.array([labware.index.positions[well]])
+                self._record(index, LOAD, float(volume), params["labwareId"], number)
+
+    def _aspirate(self, index: int, params: dict) -> None:
+        pipette = params.get("pipetteId", "")
+        volume = float(params.get("volume") or 0)
+        labware_id, wells = self._targets(pipette)
+        self._record(index, ASPIRATE, -volume, labware_id, wells)
+        self.held[pipette] = self.held.get(pipette, 0.0) + volume
+
+    def _discard(self, index: int, pipette: str, volume: float) -> None:
+        labware_id, area = self.location.get(pipette, ("", ""))
+        if not labware_id and area and volume > 0:
+            self.discarded.append((area, volume, index))
+
+    def _dispense(self, index: int, params: dict) -> None:
+        pipette = params.get("pipetteId", "")
+        # air gaps are dispensed too, but only the liquid held reaches the well
+        volume = min(float(params.get("volume") or 0), self.held.get(pipette, 0.0))
+        labware_id, wells = self._targets(pipette)
+        self._record(index, DISPENSE, volume, labware_id, wells)
+        self._discard(index, pipette, volume)
+        self.held[pipette] = self.held.get(pipette, 0.0) - volume
+
+    def _blow_out(self, index: int, params: dict) -> None:
+        pipette = params.get("pipetteId", "")
+        labware_id, wells = self._targets(pipette)
+        self._record(index, DISPENSE, self.held.get(pipette, 0.0), labware_id, wells)
+        self._discard(index, pipette, self.held.get(pipette, 0.0))
+        self.held[pipette] = 0.0
+
+    def _drop(self, index: int, params: dict) -> None:
+        pipette = params.get("pipetteId", "")
+        # whatever is still in the tip goes with it
+        self._discard(index, pipette, self.held.get(pipette, 0.0))
+        self.held[pipette] = 0.0
+
+
+def _settle(tracker: LiquidTracker) -> Tuple[np.ndarray, ...]:
+    """Each well's running volume after each of its events, in one pass.
+
+    Gives the events sorted by well then command, their running volumes,
+    whether each event's well was first dispensed into, and where each
+    well's events start.
+    """
+    events = np.array(tracker.events, dtype=float).reshape(-1, 4)
+    order = np.lexsort((events[:, 2], events[:, 0]))
+    events = events[order]
+    wells = events[:, 0].astype(int)
+    totals = np.cumsum(events[:, 1])
+    starts = np.flatnonzero(np.r_[True, wells[1:] != wells[:-1]])
+    before = np.r_[0.0, totals][starts]
+    lengths = np.diff(np.r_[starts, len(wells)])
+    running = totals - np.repeat(before, lengths)
+    started_empty = np.repeat(events[starts, 3] == DISPENSE, lengths)
+    return events, running, started_empty, starts
+
+
+def _per_well(tracker: LiquidTracker) -> Tuple[np.ndarray, np.ndarray]:
+    """Every well's maximum volume, and whether its labware's contents are declared."""
+    capacity = np.zeros(tracker.wells)
+    declared = np.zeros(tracker.wells, dtype=bool)
+    for labware_id, labware in tracker.labware.items():
+        end = labware.offset + len(labware.index)
+        capacity[labware.offset : end] = labware.index.max_volume
+        declared[labware.offset : end] = labware_id in tracker.declared
+    return capacity, declared
+
+
+def _well_names(tracker: LiquidTracker) -> List[Tuple[str, str]]:
+    names: List[Tuple[str, str]] = [("", "")] * tracker.wells
+    for labware in tracker.labware.values():
+        for number, well in enumerate(labware.index.names):
+            names[labware.offset + number] = (labware.name, well)
+    return names
+
+
+def _first(
+    kind: str, problems: np.ndarray, amounts: np.ndarray, events: np.ndarray
+) -> List[Tuple[str, int, int, float]]:
+    """The first problem in each well, as (kind, well, command, amount).
+
+    Events are sorted by well then command, so the first is the earliest.
+    """
+    wells = events[:, 0].astype(int)
+    flagged, first = np.unique(wells[problems], return_index=True)
+    positions = np.flatnonzero(problems)[first]
+    return [
+        (kind, int(well), int(events[position, 2]), float(amounts[position]))
+        for well, position in zip(flagged, positions)
+    ]
+
+
+def track(commands: List[dict]) -> LiquidTracker:
+    """A tracker that has seen every command in a stream."""
+    tracker = LiquidTracker()
+    for index, command in enumerate(commands):
+        tracker.command(
+            index,
+            command.get("commandType", ""),
+            command.get("params") or {},
+            command.get("result"),
+        )
+    return tracker
+
+
+def simulate(protocol: str, commands: Iterable[dict]) -> LiquidReport:
+    """Run every liquid handling command in a stream against per-well volumes."""
+    commands = list(commands)
+    tracker = track(commands)
+    report = LiquidReport(protocol)
+    if not tracker.events:
+        return report
+    events, running, started_empty, starts = _settle(tracker)
+    capacity, declared = _per_well(tracker)
+    wells, kinds = events[:, 0].astype(int), events[:, 3]
+    # declared labware starts with what was loaded; others only if first filled
+    known = declared[wells] | started_empty
+    limits = capacity[wells]
+    report.loaded = float(events[kinds == LOAD, 1].sum())
+    report.moved = float(-events[kinds == ASPIRATE, 1].sum())
+    report.undeclared = int(np.count_nonzero(~known[starts]))
+    problems = _first(
+        "underflow", declared[wells] & (running < -TOLERANCE), -running, events
+    ) + _first(
+        "overflow",
+        known & (limits > 0) & (running > limits + TOLERANCE),
+        running - limits,
+        events,
+    )
+    names = _well_names(tracker)
+    steps = step_labels(commands)
+    for kind, well, command, amount in sorted(problems, key=lambda p: p[2]):
+        labware, name = names[well]
+        report.flags.append(
+            Flag(kind, labware, name, command, steps[command], round(amount, 2))
+        )
+    ends = np.r_[starts[1:], len(wells)] - 1
+    for end in ends[known[ends] & (running[ends] > TOLERANCE)]:
+        labware, name = names[wells[end]]
+        report.residuals.setdefault(labware, {})[name] = round(float(running[end]), 2)
+    return report
+
+
+def simulate_analysis(protocol: str, analysis: Path) -> LiquidReport:
+    """The simulation of an analysis JSON file written by either analyzer."""
+    commands = analysis_commands(json.loads(analysis.read_text(encoding="utf-8")))
+    return simulate(protocol, commands)
+
+
+def liquids_table(reports: List[LiquidReport]) -> str:
+    """Protocols with problems first, then by volume moved."""
+    width = max([len(report.protocol) for report in reports] + [len("protocol")])
+    lines = [
+        f"{'protocol':<{width}}  {'loaded uL':>10}  {'moved uL':>10}  "
+        f"{'under':>5}  {'over':>5}  {'left uL':>9}"
+    ]
+    ranked = sorted(reports, key=lambda r: (-len(r.flags), -r.moved))
+    for report in ranked:
+        if not report.moved and not report.loaded:
+            continue
+        left = sum(sum(wells.values()) for wells in report.residuals.values())
+        lines.append(
+            f"{report.protocol:<{width}}  {report.loaded:>10.0f}  {report.moved:>10.0f}  "
+            f"{report.count('underflow'):>5}  {report.count('overflow'):>5}  {left:>9.0f}"
+        )
+    flagged = len([report for report in reports if report.flags])
+    lines.append(
+        f"{len(reports)} protocols, {flagged} with wells running dry or overflowing"
+    )
+    return "\n".join(lines)
+
+
+def write_liquids(reports: List[LiquidReport], out_dir: Path) -> str:
+    """Write each protocol's flags and residuals beside its analysis, then liquids.txt."""
+    for report in reports:
+        detail = out_dir / f"{report.protocol}.liquids.json"
+        detail.write_text(json.dumps(asdict(report)), encoding="utf-8")
+    table = liquids_table(reports)
+    (out_dir / "liquids.txt").write_text(table + "\n", encoding="utf-8")
+    return table
+
+
+def liquid_results(out_dir: Path) -> List[LiquidReport]:
+    """Simulations for every protocol in a results directory's summary.json."""
+    summary = json.loads((out_dir / "summary.json").read_text(encoding="utf-8"))
+    return [
+        simulate_analysis(result["protocol"], Path(result["output"]))
+        for result in summary
+        if result["status"] == "ok" and result["output"]
+    ]
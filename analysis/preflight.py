@@ -0,0 +1,230 @@
+"""Catch protocols that cannot analyze before running them.
+
+Some failures need no simulation to find: a Python protocol that does not
+compile, imports a module that is not installed at its top level, or
+declares no supported apiLevel, and a JSON protocol that does not parse or
+names labware or commands it does not have. Each is checked from the source alone,
+and a protocol failing one is reported with the error the analyzer would
+have reported, without starting it.
+
+Checks only fail a protocol where the analyzer would fail it the same way.
+Anything they cannot decide statically, such as metadata changed after it
+is assigned or an import inside a try, is left to full analysis. Metadata
+is read the way the metadata command reads it; see extract.py.
+"""
+
+import ast
+import importlib.util
+import json
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from analysis.discover import Protocol
+from analysis.extract import extract_source
+from analysis.jsonstream import StreamingProtocol
+from analysis.recorder import RecorderError, Recording
+from analysis.recorder.context import check_robot_version
+from analysis.recorder.execute import declared_api_version, declared_robot_type
+from analysis.runner import AnalysisResult, output_path
+
+# the checks each analyzer fails in the order it would meet them, and the
+# errorType it reports for each; None keeps the recorder's own
+ANALYZER_ERRORS: Dict[str, Dict[str, Optional[str]]] = {
+    "recorder": {
+        "syntax": None,
+        "import": None,
+        "api": None,
+        "json": None,
+        "labware": None,
+        "commands": None,
+    },
+    "opentrons": {
+        "syntax": "ClickException",
+        "json": "ClickException",
+        "api": "ClickException",
+        "import": "UnexpectedAnalysisError",
+    },
+}
+ANALYZER_ERRORS["recorder-realtime"] = ANALYZER_ERRORS["recorder"]
+# errors opentrons raises before analysis starts, reported as their repr
+RAISED = ("ClickException",)
+DECLARATIONS = ("metadata", "requirements")
+
+
+@dataclass
+class Problem:
+    """A reason a protocol cannot analyze, found without running it."""
+
+    check: str
+    error_type: str
+    detail: str
+    # the protocol line the error points at, if the analyzer names one
+    line: Optional[int] = None
+
+
+def _settled(tree: ast.Module) -> bool:
+    """Whether metadata and requirements are only bound by plain assignments.
+
+    Anything else at module level that touches them, like an update() or an
+    assignment to a key, leaves their value to running the protocol.
+    """
+    for statement in tree.body:
+        if isinstance(statement, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            continue
+        targets = statement.targets if isinstance(statement, ast.Assign) else []
+        if len(targets) == 1 and isinstance(targets[0], ast.Name):
+            nodes = ast.walk(statement.value)  # type: ignore[attr-defined]
+        else:
+            nodes = ast.walk(statement)
+        if any(
+            isinstance(node, ast.Name) and node.id in DECLARATIONS for node in nodes
+        ):
+            return False
+    return True
+
+
+def _missing_imports(tree: ast.Module) -> Iterator[Problem]:
+    """Top-level imports of modules that are not installed, in source order."""
+    for statement in tree.body:
+        if isinstance(statement, ast.Import):
+            names = [alias.name for alias in statement.names]
+        elif isinstance(statement, ast.ImportFrom) and not statement.level:
+            names = [str(statement.module)]
+        else:
+            continue
+        for name in names:
+            top = name.split(".")[0]
+            # the recorder serves every opentrons module; the real package's
+            # own dependencies are for full analysis to judge
+            if top == "opentrons" or importlib.util.find_spec(top) is not None:
+                continue
+            yield Problem(
+                "import",
+                "ModuleNotFoundError",
+                f"No module named '{top}'",
+                statement.lineno,
+            )
+            return
+
+
+def _api_problem(metadata: dict, requirements: dict) -> Optional[Problem]:
+    try:
+        version = declared_api_version(metadata, requirements)
+        check_robot_version(version, declared_robot_type(requirements))
+    except (RecorderError, ValueError) as error:
+        return Problem("api", type(error).__name__, str(error))
+    return None
+
+
+def check_python(path: Path) -> List[Problem]:
+    """What stops a Python protocol before its run() is reached."""
+    try:
+        tree = compile(path.read_bytes(), str(path), "exec", ast.PyCF_ONLY_AST)
+        compile(tree, str(path), "exec")
+    except (SyntaxError, ValueError) as error:
+        return [Problem("syntax", type(error).__name__, str(error))]
+    problems = list(_missing_imports(tree))
+    info = extract_source(path.read_text(encoding="utf-8", errors="replace"), str(path))
+    unresolved = [error for error in info.errors if error.startswith(DECLARATIONS)]
+    if _settled(tree) and not unresolved:
+        problem = _api_problem(info.metadata, info.requirements)
+        problems.extend([problem] if problem else [])
+    return problems
+
+
+def check_json(path: Path) -> List[Problem]:
+    """What stops a JSON protocol from being read, as the recorder reads it."""
+    protocol = StreamingProtocol(path)
+    try:
+        header = protocol.header
+    except (OSError, ValueError) as error:
+        return [Problem("json", type(error).__name__, str(error))]
+    try:
+        # only schema v3-v5 protocols have their labware looked up up front
+        if protocol.schema_version < 6:
+            for labware in header.get("labware", {}).values():
+                protocol.labware_definition(labware["definitionId"])
+    except (ValueError, KeyError, TypeError, AttributeError) as error:
+        return [Problem("labware", type(error).__name__, str(error))]
+    try:
+        next(protocol.commands(), None)
+    except (OSError, ValueError) as error:
+        return [Problem("commands", type(error).__name__, str(error))]
+    return []
+
+
+def triage(protocol: Protocol, analyzer: str = "recorder") -> Optional[Problem]:
+    """The first problem the analyzer would fail on, in its own terms."""
+    errors = ANALYZER_ERRORS.get(analyzer, {})
+    if protocol.kind == "json":
+        problems = check_json(protocol.path)
+    else:
+        problems = check_python(protocol.path)
+    found = {problem.check: problem for problem in reversed(problems)}
+    for check, error_type in errors.items():
+        if check in found:
+            problem = found[check]
+            if error_type is None:
+                return problem
+            # the opentrons analyzer names no line for these
+            return Problem(check, error_type, problem.detail)
+    return None
+
+
+def _detail(problem: Problem) -> str:
+    # as the recorder appends the protocol line an error was raised on
+    return problem.detail + (f" [line {problem.line}]" if problem.line else "")
+
+
+def triaged(
+    protocol: Protocol, out_dir: Path, analyzer: str = "recorder"
+) -> Optional[AnalysisResult]:
+    """The analyzer's result for a protocol pre-flight fails, or None to analyze it.
+
+    Only the recorder's analysis file is written, since pre-flight cannot
+    produce what another analyzer would; for the others only the error is
+    reported.
+    """
+    started = time.monotonic()
+    problem = triage(protocol, analyzer)
+    if problem is None:
+        return None
+    if problem.error_type in RAISED:
+        errors = [f"{problem.error_type}({problem.detail!r})"]
+    else:
+        errors = [f"{problem.error_type}: {_detail(problem)}"]
+    output = ""
+    if analyzer.startswith("recorder"):
+        recording = Recording(str(protocol.path))
+        recording.errors.append(
+            {"errorType": problem.error_type, "detail": _detail(problem)}
+        )
+        destination = output_path(protocol, out_dir)
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        destination.write_text(json.dumps(recording.as_analysis()), encoding="utf-8")
+        output = str(destination)
+    return AnalysisResult(
+        protocol.relative,
+        "error",
+        time.monotonic() - started,
+        errors=errors,
+        output=output,
+        preflight=True,
+    )
+
+
+def preflight_table(protocols: List[Protocol], analyzer: str = "recorder") -> str:
+    """Every protocol pre-flight fails and why, with a count."""
+    found = [(protocol, triage(protocol, analyzer)) for protocol in protocols]
+    failed = [(protocol, problem) for protocol, problem in found if problem]
+    width = max([len(protocol.relative) for protocol, _ in failed] + [len("protocol")])
+    lines = [f"{'protocol':<{width}}  {'check':<7}  error"]
+    for protocol, problem in failed:
+        lines.append(
+            f"{protocol.relative:<{width}}  {problem.check:<7}  "
+            f"{problem.error_type}: {_detail(problem)}"
+        )
+    lines.append(f"{len(protocols)} protocols, {len(failed)} failing pre-flight")
+    return "\n".join(lines)
@@ -0,0 +1,165 @@
+"""Compile thermocycler profiles once and cost them without expanding cycles.
+
+A profile is a cycle of (setpoint, hold) steps run some number of times.
+Its duration is the ramp into the first step, the cycle's own ramps and
+holds, and the ramp from the last step back to the first between cycles,
+each counted once and multiplied out. Identical profiles, which protocols
+and their API level copies share, compile to one object whose durations
+are remembered per starting temperature and ramp model.
+"""
+
+import json
+from dataclasses import dataclass, field
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from analysis.ramps import AMBIENT_CELSIUS, DEFAULT, RampModel
+from analysis.runs import analysis_commands
+
+BLOCK = "thermocycler/block"
+
+Key = Tuple[Tuple[Tuple[float, float], ...], int, float]
+
+
+def profile_key(params: dict) -> Key:
+    """Steps, repetitions and block volume of any runProfile command's shape."""
+    steps = params.get("steps") or params.get("profile") or []
+    pairs = tuple(
+        (
+            float(step.get("celsius", step.get("temperature", AMBIENT_CELSIUS))),
+            float(step.get("holdSeconds", step.get("holdTime", 0))),
+        )
+        for step in steps
+    )
+    volume = float(params.get("blockMaxVolumeUl") or 0)
+    return pairs, int(params.get("repetitions", 1)), volume
+
+
+@dataclass(eq=False)
+class Profile:
+    """One cycle's setpoints and holds, how often it repeats, and in what volume."""
+
+    setpoints: np.ndarray
+    holds: np.ndarray
+    repetitions: int
+    volume: float
+    _seconds: Dict[Tuple[float, RampModel], float] = field(
+        default_factory=dict, repr=False
+    )
+
+    @property
+    def steps(self) -> int:
+        """Steps run in all, as if every cycle were expanded."""
+        return len(self.setpoints) * self.repetitions
+
+    @property
+    def end(self) -> Optional[float]:
+        """Where the block is left, or None for an empty profile."""
+        return float(self.setpoints[-1]) if len(self.setpoints) else None
+
+    def seconds(self, start: float, ramps: RampModel = DEFAULT) -> float:
+        """Total duration from a block at start degrees, ramps included."""
+        if not len(self.setpoints) or self.repetitions < 1:
+            return 0.0
+        known = self._seconds.get((start, ramps))
+        if known is None:
+            known = self._seconds[(start, ramps)] = self._cost(start, ramps)
+        return known
+
+    def _cost(self, start: float, ramps: RampModel) -> float:
+        curve = ramps.curves[BLOCK]
+        points = self.setpoints
+        within = sum(
+            curve.seconds(a, b, self.volume) for a, b in zip(points[:-1], points[1:])
+        )
+        cycle = within + float(self.holds.sum())
+        into = curve.seconds(start, float(points[0]), self.volume)
+        back = curve.seconds(float(points[-1]), float(points[0]), self.volume)
+        return into + cycle * self.repetitions + back * (self.repetitions - 1)
+
+
+@lru_cache(maxsize=None)
+def _compiled(key: Key) -> Profile:
+    pairs, repetitions, volume = key
+    table = np.array(pairs, dtype=float).reshape(-1, 2)
+    return Profile(table[:, 0].copy(), table[:, 1].copy(), repetitions, volume)
+
+
+def compile_profile(params: dict) -> Profile:
+    """The compiled profile for a runProfile command, shared by identical ones."""
+    return _compiled(profile_key(params))
+
+
+def _commands(analysis: Path) -> Iterable[dict]:
+    return analysis_commands(json.loads(analysis.read_text(encoding="utf-8")))
+
+
+@dataclass
+class ProfileUse:
+    """One distinct profile and every protocol that runs it."""
+
+    profile: Profile
+    protocols: List[str] = field(default_factory=list)
+
+
+def profile_results(out_dir: Path) -> Dict[Key, ProfileUse]:
+    """Every distinct profile run by a protocol in a results directory."""
+    summary = json.loads((out_dir / "summary.json").read_text(encoding="utf-8"))
+    uses: Dict[Key, ProfileUse] = {}
+    for result in summary:
+        if result["status"] != "ok" or not result["output"]:
+            continue
+        for command in _commands(Path(result["output"])):
+            if command.get("commandType") == "thermocycler/runProfile":
+                key = profile_key(command.get("params") or {})
+                use = uses.setdefault(key, ProfileUse(_compiled(key)))
+                use.protocols.append(result["protocol"])
+    return uses
+
+
+def profiles_table(uses: Dict[Key, ProfileUse], ramps: RampModel = DEFAULT) -> str:
+    """Distinct profiles, most used first, with their cost from a block at 25 C."""
+    lines = [
+        f"{'runs':>4}  {'steps':>5}  {'x':>3}  {'uL':>4}  {'duration':>9}  profile"
+    ]
+    for key, use in sorted(uses.items(), key=lambda item: -len(item[1].protocols)):
+        profile = use.profile
+        steps = " ".join(f"{c:g}C/{h:g}s" for c, h in key[0])
+        minutes, seconds = divmod(
+            int(round(profile.seconds(AMBIENT_CELSIUS, ramps))), 60
+        )
+        lines.append(
+            f"{len(use.protocols):>4}  {profile.steps:>5}  {profile.repetitions:>3}  "
+            f"{profile.volume:>4g}  {minutes:>6}:{seconds:02d}  {steps}"
+        )
+    runs = sum(len(use.protocols) for use in uses.values())
+    lines.append(f"{runs} profiles run, {len(uses)} distinct")
+    return "\n".join(lines)
+
+
+def write_profiles(
+    uses: Dict[Key, ProfileUse], out_dir: Path, ramps: RampModel = DEFAULT
+) -> str:
+    """profiles.json and profiles.txt in out_dir."""
+    (out_dir / "profiles.json").write_text(
+        json.dumps(
+            [
+                {
+                    "steps": [list(step) for step in key[0]],
+                    "repetitions": key[1],
+                    "blockMaxVolumeUl": key[2],
+                    "seconds": use.profile.seconds(AMBIENT_CELSIUS, ramps),
+                    "protocols": use.protocols,
+                }
+                for key, use in uses.items()
+            ],
+            indent=2,
+        ),
+        encoding="utf-8",
+    )
+    table = profiles_table(uses, ramps)
+    (out_dir / "profiles.txt").write_text(table + "\n", encoding="utf-8")
+    return table
@@ -0,0 +1,241 @@
+"""How long modules take to heat and cool, from defaults or measured logs.
+
+A curve holds a module's heating and cooling rate at each temperature on a
+grid, and the time to reach each grid temperature from the bottom of it.
+The time from A to B is then the difference of two interpolated lookups,
+whatever the curve's shape. Liquid in the block slows a ramp down by a
+factor of (1 + coefficient * volume), fitted per direction.
+
+Logs are CSV files with seconds and celsius columns, as recorded while
+running the protocols in abr_testing/ramp_rate_protocols. A module column
+names the curve (thermocycler/block, thermocycler/lid, temperatureModule
+or heaterShaker); without one the file name decides. An optional volume
+column gives the microliters in the block.
+"""
+
+import csv
+import json
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+AMBIENT_CELSIUS = 25.0
+# degrees per second while heating and while cooling, until measured
+RAMP_RATES: Dict[str, Tuple[float, float]] = {
+    "thermocycler/block": (4.4, 2.2),
+    "thermocycler/lid": (0.5, 0.25),
+    "temperatureModule": (0.3, 0.1),
+    "heaterShaker": (0.2, 0.05),
+}
+# module names as the ramp rate protocols and their logs spell them
+FILE_NAMES = {
+    "thermocycler": "thermocycler/block",
+    "temperaturemodule": "temperatureModule",
+    "heatershaker": "heaterShaker",
+}
+GRID = np.arange(-10.0, 121.0, 5.0)
+# degrees per second below which a module counts as holding, not ramping
+HOLDING_RATE = 0.01
+
+
+@dataclass
+class RampCurve:
+    """One module's heating and cooling rates across temperatures."""
+
+    celsius: np.ndarray
+    heating: np.ndarray
+    cooling: np.ndarray
+    heating_volume: float = 0.0
+    cooling_volume: float = 0.0
+    samples: int = 0
+
+    def __post_init__(self) -> None:
+        # seconds from the bottom of the grid to each point, along each direction
+        self._up = _elapsed(self.celsius, self.heating)
+        self._down = _elapsed(self.celsius, self.cooling)
+
+    def seconds(self, start: float, end: float, volume: float = 0.0) -> float:
+        """Seconds from start to end degrees with volume microliters in the block."""
+        if end >= start:
+            elapsed, coefficient = self._up, self.heating_volume
+        else:
+            elapsed, coefficient = self._down, self.cooling_volume
+        low, high = sorted((start, end))
+        span = np.interp([low, high], self.celsius, elapsed)
+        # beyond either end of the grid the edge rates carry on
+        rates = self.heating if end >= start else self.cooling
+        below = max(0.0, min(high, self.celsius[0]) - low) / rates[0]
+        above = max(0.0, high - max(low, self.celsius[-1])) / rates[-1]
+        seconds = float(span[1] - span[0]) + below + above
+        return seconds * (1 + coefficient * volume)
+
+    def as_dict(self) -> dict:
+        return {
+            "celsius": self.celsius.tolist(),
+            "heating": self.heating.tolist(),
+            "cooling": self.cooling.tolist(),
+            "heatingVolume": self.heating_volume,
+            "coolingVolume": self.cooling_volume,
+            "samples": self.samples,
+        }
+
+
+def _elapsed(celsius: np.ndarray, rates: np.ndarray) -> np.ndarray:
+    """Trapezoidal integral of 1 / rate over temperature."""
+    per_degree = 1.0 / rates
+    steps = np.diff(celsius) * (per_degree[1:] + per_degree[:-1]) / 2
+    return np.concatenate(([0.0], np.cumsum(steps)))
+
+
+def constant(heating: float, cooling: float) -> RampCurve:
+    return RampCurve(GRID, np.full(len(GRID), heating), np.full(len(GRID), cooling))
+
+
+class RampModel:
+    """Ramp curves by module, falling back to the defaults for unmeasured ones."""
+
+    def __init__(self, curves: Optional[Dict[str, RampCurve]] = None) -> None:
+        self.curves = {key: constant(*rates) for key, rates in RAMP_RATES.items()}
+        self.curves.update(curves or {})
+
+    def seconds(self, key: str, start: float, end: float, volume: float = 0.0) -> float:
+        return self.curves[key].seconds(start, end, volume)
+
+    def as_dict(self) -> dict:
+        return {key: curve.as_dict() for key, curve in self.curves.items()}
+
+
+DEFAULT = RampModel()
+
+
+def load_model(path: Path) -> RampModel:
+    """A model written by write_model."""
+    loaded = json.loads(path.read_text(encoding="utf-8"))
+    return RampModel(
+        {
+            key: RampCurve(
+                np.array(curve["celsius"]),
+                np.array(curve["heating"]),
+                np.array(curve["cooling"]),
+                curve.get("heatingVolume", 0.0),
+                curve.get("coolingVolume", 0.0),
+                curve.get("samples", 0),
+            )
+            for key, curve in loaded.items()
+        }
+    )
+
+
+def write_model(model: RampModel, path: Path) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(model.as_dict(), indent=2), encoding="utf-8")
+
+
+def read_log(path: Path) -> Dict[str, np.ndarray]:
+    """Per module, an array of (seconds, celsius, volume) rows from one log."""
+    fallback = next(
+        (key for name, key in FILE_NAMES.items() if name in path.stem.lower()), ""
+    )
+    rows: Dict[str, List[Tuple[float, float, float]]] = {}
+    with path.open(newline="", encoding="utf-8") as handle:
+        for row in csv.DictReader(handle):
+            key = row.get("module") or fallback
+            if key not in RAMP_RATES:
+                continue
+            rows.setdefault(key, []).append(
+                (
+                    float(row["seconds"]),
+                    float(row["celsius"]),
+                    float(row.get("volume") or 0),
+                )
+            )
+    # runs at different volumes may share a log; keep each run's rows together
+    return {
+        key: np.array(sorted(values, key=lambda row: (row[2], row[0])))
+        for key, values in rows.items()
+    }
+
+
+def _rates(log: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Midpoint temperature, rate and volume of every interval spent ramping."""
+    seconds, celsius, volume = log[:, 0], log[:, 1], log[:, 2]
+    elapsed = np.diff(seconds)
+    moving = elapsed > 0
+    rate = np.zeros(len(elapsed))
+    rate[moving] = np.diff(celsius)[moving] / elapsed[moving]
+    ramping = moving & (np.abs(rate) > HOLDING_RATE) & (volume[1:] == volume[:-1])
+    midpoint = (celsius[1:] + celsius[:-1]) / 2
+    return midpoint[ramping], rate[ramping], volume[1:][ramping]
+
+
+def _volume_coefficient(rate: np.ndarray, volume: np.ndarray) -> float:
+    """k in rate = r0 / (1 + k * volume), from runs at different volumes.
+
+    1 / rate is linear in volume, so a straight-line fit gives both r0 and k.
+    """
+    volumes = np.unique(volume)
+    if len(volumes) < 2:
+        return 0.0
+    inverse = [np.mean(1.0 / rate[volume == v]) for v in volumes]
+    slope, intercept = np.polyfit(volumes, inverse, 1)
+    return max(0.0, float(slope / intercept)) if intercept > 0 else 0.0
+
+
+def _curve(midpoint: np.ndarray, rate: np.ndarray, default: float) -> np.ndarray:
+    """The median rate at each grid temperature, interpolated where unmeasured."""
+    if not len(rate):
+        return np.full(len(GRID), default)
+    nearest = np.rint((midpoint - GRID[0]) / (GRID[1] - GRID[0])).astype(int)
+    bins = np.clip(nearest, 0, len(GRID) - 1)
+    measured = np.unique(bins)
+    medians = np.array([np.median(rate[bins == b]) for b in measured])
+    return np.interp(GRID, GRID[measured], medians)
+
+
+def fit(logs: Iterable[np.ndarray], key: str) -> RampCurve:
+    """A curve from every log of one module, each run's volume accounted for."""
+    parts = [_rates(log) for log in logs if len(log) > 1]
+    midpoint = np.concatenate([part[0] for part in parts] or [np.empty(0)])
+    rate = np.concatenate([part[1] for part in parts] or [np.empty(0)])
+    volume = np.concatenate([part[2] for part in parts] or [np.empty(0)])
+    heating, cooling = RAMP_RATES[key]
+    up, down = rate > 0, rate < 0
+    up_volume = _volume_coefficient(rate[up], volume[up])
+    down_volume = _volume_coefficient(-rate[down], volume[down])
+    # rates measured with liquid in the block, as if it were empty
+    up_rates = rate[up] * (1 + up_volume * volume[up])
+    down_rates = -rate[down] * (1 + down_volume * volume[down])
+    return RampCurve(
+        GRID,
+        _curve(midpoint[up], up_rates, heating),
+        _curve(midpoint[down], down_rates, cooling),
+        up_volume,
+        down_volume,
+        len(rate),
+    )
+
+
+def calibrate(paths: Iterable[Path]) -> RampModel:
+    """Fit a curve for every module any of the logs measured."""
+    logs: Dict[str, List[np.ndarray]] = {}
+    for path in paths:
+        for key, log in read_log(path).items():
+            logs.setdefault(key, []).append(log)
+    return RampModel({key: fit(found, key) for key, found in logs.items()})
+
+
+def ramps_table(model: RampModel) -> str:
+    """Each curve's rates at a few temperatures and the time for common ramps."""
+    lines = [
+        f"{'module':<20}  {'samples':>7}  {'up 25-95':>8}  {'down 95-4':>9}  "
+        f"{'per 100 uL':>10}"
+    ]
+    for key, curve in model.curves.items():
+        lines.append(
+            f"{key:<20}  {curve.samples:>7}  {curve.seconds(25, 95):>7.0f}s  "
+            f"{curve.seconds(95, 4):>8.0f}s  "
+            f"{100 * curve.heating_volume:>9.0%}"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,26 @@
+"""An offline stand-in for the opentrons ProtocolContext.
+
+Protocols run against recording contexts instead of the hardware-control
+stack: nothing moves and nothing from `opentrons` is imported. Each call is
+recorded as a Protocol Engine style command, `{"commandType", "params"}`,
+so recordings and real analysis output can be inspected the same way.
+Locations that are not wells, such as trash bins and the waste chute, are
+recorded by addressableAreaName. A run of delays counting a timer down is
+recorded as one waitForDuration with a countdown; see countdown.py. Time,
+sleeps and the protocol's own threads run on a virtual clock; see clock.py.
+"""
+
+from analysis.recorder.execute import Recording, record, record_json
+from analysis.recorder.types import OutOfTipsError, RecorderError
+
+# bump when recordings of unchanged protocols would come out differently
+RECORDER_VERSION = 8
+
+__all__ = [
+    "RECORDER_VERSION",
+    "OutOfTipsError",
+    "RecorderError",
+    "Recording",
+    "record",
+    "record_json",
+]
@@ -0,0 +1,314 @@
+"""A virtual clock for protocols that time themselves.
+
+Protocols written for the robot read time.time() or time.monotonic(),
+sleep, wait on a threading.Event with a timeout, and join threads with a
+deadline. While recording, a protocol importing `time` or `threading` gets
+stand-ins driven by a virtual clock instead. The clock advances by each
+recorded command's modeled duration, from the runtime Estimator, and by
+every sleep or timed wait, so waiting costs nothing real while the times a
+protocol reads are the ones it would read on the robot.
+
+Threads the protocol starts take turns with it: one runs at a time, each
+until it sleeps, waits or ends. A sleeping thread runs again once the
+protocol's commands carry the clock past its wake-up time, so the same
+protocol always records the same commands. Threads still running when the
+protocol returns are stopped. Locks and other primitives are the real
+ones; only sleeps, events and joins yield a turn.
+"""
+
+import builtins
+import heapq
+import itertools
+import math
+import threading
+import time
+import types
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from analysis.recorder.types import RecorderError
+from analysis.runtime import Estimator
+
+# what time.time() reads when a recording starts
+EPOCH = 1_700_000_000.0
+# a wait without a timeout still waiting this long after it began never ends
+FOREVER_SECONDS = 7 * 24 * 3600.0
+
+
+class _Stopped(BaseException):
+    """Unwinds a thread still running when the recording ends."""
+
+
+class _Turn:
+    """One thread of the protocol's and the gate it waits at for its turn."""
+
+    def __init__(self) -> None:
+        self.gate = threading.Semaphore(0)
+        self.resumer: Optional["_Turn"] = None
+        # the newest wake-up scheduled; older ones left in the queue are stale
+        self.token = -1
+        self.finished = False
+        self.stopped = False
+        self.joiners: List["_Turn"] = []
+
+
+class VirtualClock:
+    """Seconds since the recording started, and the threads waiting on them."""
+
+    def __init__(self, estimator: Optional[Estimator] = None) -> None:
+        self.now = 0.0
+        self.estimator = estimator or Estimator()
+        self._main = _Turn()
+        self._local = threading.local()
+        self._started: List[_Turn] = []
+        self._queue: List[Tuple[float, int, _Turn]] = []
+        self._order = itertools.count()
+        self.names = itertools.count(1)
+
+    @property
+    def _current(self) -> _Turn:
+        return getattr(self._local, "turn", self._main)
+
+    def command(self, command_type: str, params: dict) -> None:
+        """Advance past a command just recorded."""
+        self.advance(self.estimator.seconds(command_type, params))
+
+    def advance(self, seconds: float) -> None:
+        """Move the clock on, letting the protocol's threads due meanwhile run.
+
+        Commands a started thread records move the clock without running
+        anything else; the protocol catches its threads up on its next step.
+        """
+        if self._current is self._main:
+            self._run_until(lambda: False, self.now + max(seconds, 0.0))
+        else:
+            self.now += max(seconds, 0.0)
+
+    def sleep(self, seconds: float) -> None:
+        self.block(lambda: False, seconds, [])
+
+    def block(
+        self, done: Callable[[], bool], timeout: Optional[float], waiters: List[_Turn]
+    ) -> bool:
+        """Wait until done() or the timeout passes; whether done() in the end.
+
+        A started thread gives up its turn, listed in waiters so whatever it
+        waits on can wake it. The protocol itself runs its threads instead.
+        """
+        turn = self._current
+        if turn is self._main:
+            deadline = math.inf if timeout is None else self.now + max(timeout, 0.0)
+            return self._run_until(done, deadline)
+        if turn.stopped:
+            raise _Stopped()
+        if done():
+            return True
+        waiters.append(turn)
+        if timeout is not None:
+            self._schedule(turn, self.now + max(timeout, 0.0))
+        self._yield(turn)
+        if turn in waiters:
+            waiters.remove(turn)
+        return done()
+
+    def wake(self, waiters: List[_Turn]) -> None:
+        """Let every waiting thread run again at the current time."""
+        for turn in waiters:
+            self._schedule(turn, self.now)
+        waiters.clear()
+
+    def start(self, run: Callable[[], None]) -> _Turn:
+        """A thread running run(), taking its first turn as soon as one is free."""
+        turn = _Turn()
+        worker = threading.Thread(target=self._bootstrap, args=(turn, run))
+        worker.daemon = True
+        worker.start()
+        self._started.append(turn)
+        self._schedule(turn, self.now)
+        return turn
+
+    def close(self) -> None:
+        """Stop every thread that has not finished."""
+        for turn in self._started:
+            if not turn.finished:
+                turn.stopped = True
+                self._resume(turn)
+        self._started.clear()
+
+    def _run_until(self, done: Callable[[], bool], deadline: float) -> bool:
+        limit = min(deadline, self.now + FOREVER_SECONDS)
+        while not done() and self._queue and self._queue[0][0] <= limit:
+            wake, token, turn = heapq.heappop(self._queue)
+            if token == turn.token and not turn.finished:
+                self.now = max(self.now, wake)
+                self._resume(turn)
+        if done():
+            return True
+        if deadline == math.inf:
+            raise RecorderError(
+                "the protocol waits without a timeout on an event nothing sets "
+                "or a thread that never ends"
+            )
+        self.now = max(self.now, deadline)
+        return False
+
+    def _schedule(self, turn: _Turn, wake: float) -> None:
+        turn.token = next(self._order)
+        heapq.heappush(self._queue, (wake, turn.token, turn))
+
+    def _resume(self, turn: _Turn) -> None:
+        """Hand the turn to a waiting thread and wait until it gives it back."""
+        turn.resumer = self._current
+        turn.gate.release()
+        turn.resumer.gate.acquire()
+
+    def _yield(self, turn: _Turn) -> None:
+        assert turn.resumer is not None
+        turn.resumer.gate.release()
+        turn.gate.acquire()
+        if turn.stopped:
+            raise _Stopped()
+
+    def _bootstrap(self, turn: _Turn, run: Callable[[], None]) -> None:
+        self._local.turn = turn
+        turn.gate.acquire()
+        try:
+            if not turn.stopped:
+                run()
+        except _Stopped:
+            pass
+        finally:
+            turn.finished = True
+            self.wake(turn.joiners)
+            assert turn.resumer is not None
+            turn.resumer.gate.release()
+
+
+class Thread:
+    """threading.Thread, taking turns on the virtual clock."""
+
+    clock: VirtualClock
+
+    def __init__(
+        self,
+        group: None = None,
+        target: Optional[Callable[..., Any]] = None,
+        name: Optional[str] = None,
+        args: tuple = (),
+        kwargs: Optional[dict] = None,
+        *,
+        daemon: Optional[bool] = None,
+    ) -> None:
+        self._target = target
+        self._args = args
+        self._kwargs = kwargs or {}
+        self.name = name or f"Thread-{next(self.clock.names)}"
+        self.daemon = bool(daemon)
+        self._turn: Optional[_Turn] = None
+
+    def start(self) -> None:
+        if self._turn is not None:
+            raise RuntimeError("threads can only be started once")
+        self._turn = self.clock.start(self.run)
+
+    def run(self) -> None:
+        if self._target is not None:
+            self._target(*self._args, **self._kwargs)
+
+    def join(self, timeout: Optional[float] = None) -> None:
+        turn = self._turn
+        if turn is None:
+            raise RuntimeError("cannot join thread before it is started")
+        self.clock.block(lambda: turn.finished, timeout, turn.joiners)
+
+    def is_alive(self) -> bool:
+        return self._turn is not None and not self._turn.finished
+
+
+class Event:
+    """threading.Event, waited on in virtual time."""
+
+    clock: VirtualClock
+
+    def __init__(self) -> None:
+        self._flag = False
+        self._waiters: List[_Turn] = []
+
+    def is_set(self) -> bool:
+        return self._flag
+
+    isSet = is_set
+
+    def set(self) -> None:
+        self._flag = True
+        self.clock.wake(self._waiters)
+
+    def clear(self) -> None:
+        self._flag = False
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self.clock.block(self.is_set, timeout, self._waiters)
+
+
+def _module(real: types.ModuleType, **attributes: object) -> types.ModuleType:
+    """A copy of a standard module with some of its names replaced."""
+    module = types.ModuleType(real.__name__, real.__doc__)
+    module.__dict__.update(
+        (name, value) for name, value in vars(real).items() if not name.startswith("__")
+    )
+    module.__dict__.update(attributes)
+    return module
+
+
+def time_module(clock: VirtualClock) -> types.ModuleType:
+    """`time`, reading and sleeping on the virtual clock."""
+
+    def now(seconds: Optional[float] = None) -> float:
+        return EPOCH + clock.now if seconds is None else seconds
+
+    return _module(
+        time,
+        time=lambda: EPOCH + clock.now,
+        time_ns=lambda: int((EPOCH + clock.now) * 1e9),
+        monotonic=lambda: clock.now,
+        monotonic_ns=lambda: int(clock.now * 1e9),
+        perf_counter=lambda: clock.now,
+        perf_counter_ns=lambda: int(clock.now * 1e9),
+        sleep=clock.sleep,
+        localtime=lambda seconds=None: time.localtime(now(seconds)),
+        gmtime=lambda seconds=None: time.gmtime(now(seconds)),
+        ctime=lambda seconds=None: time.ctime(now(seconds)),
+        strftime=lambda pattern, moment=None: time.strftime(
+            pattern, moment or time.localtime(now())
+        ),
+    )
+
+
+def threading_module(clock: VirtualClock) -> types.ModuleType:
+    """`threading`, with threads and events on the virtual clock."""
+    return _module(
+        threading,
+        Thread=type("Thread", (Thread,), {"clock": clock}),
+        Event=type("Event", (Event,), {"clock": clock}),
+    )
+
+
+def protocol_builtins(clock: VirtualClock) -> Dict[str, Any]:
+    """Builtins for a protocol's namespace, importing the virtual modules.
+
+    Only import statements in the protocol's own code see them; modules it
+    imports keep the real ones.
+    """
+    stand_ins = {"time": time_module(clock), "threading": threading_module(clock)}
+
+    def protocol_import(
+        name: str,
+        globals: Optional[dict] = None,
+        locals: Optional[dict] = None,
+        fromlist: Any = (),
+        level: int = 0,
+    ) -> types.ModuleType:
+        if level == 0 and name in stand_ins:
+            return stand_ins[name]
+        return builtins.__import__(name, globals, locals, fromlist, level)
+
+    return {**vars(builtins), "__import__": protocol_import}
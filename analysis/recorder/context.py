@@ -0,0 +1,359 @@
+"""The recording ProtocolContext handed to a protocol's run()."""
+
+import itertools
+from typing import Any, Dict, List, Optional, Union
+
+from analysis.recorder import countdown
+from analysis.recorder.clock import VirtualClock
+from analysis.recorder.instrument import InstrumentContext
+from analysis.recorder.labware import (
+    Labware,
+    TrashBin,
+    WasteChute,
+    synthesize_definition,
+)
+from analysis.recorder.modules import ModuleContext, ThermocyclerContext, module_type
+from analysis.recorder.parameters import ParameterValues
+from analysis.recorder.types import (
+    APIVersion,
+    Location,
+    Mount,
+    Point,
+    RecorderError,
+    Unmodeled,
+)
+from analysis.runs import RunLog
+
+OFF_DECK = "offDeck"
+FLEX = "OT-3 Standard"
+OT2 = "OT-2 Standard"
+# trash bins became explicit on the Flex at this version
+EXPLICIT_TRASH_VERSION = APIVersion(2, 16)
+FLEX_MIN_VERSION = APIVersion(2, 15)
+
+
+def check_robot_version(api_version: APIVersion, robot_type: str) -> None:
+    if robot_type == FLEX and api_version < FLEX_MIN_VERSION:
+        raise RecorderError(
+            f"The Opentrons Flex only supports apiLevel {FLEX_MIN_VERSION} or newer."
+        )
+
+
+class CommandLog:
+    """Commands in the order the protocol issued them, repeated blocks as runs."""
+
+    def __init__(self, clock: Optional[VirtualClock] = None) -> None:
+        self.commands = RunLog()
+        self.clock = clock
+
+    def add(
+        self, command_type: str, result: Optional[dict] = None, **params: Any
+    ) -> dict:
+        command = {"commandType": command_type, "params": params}
+        if result is not None:
+            command["result"] = result
+        last = self.commands.last
+        folded = (
+            last is not None
+            and command_type == "waitForDuration"
+            and countdown.extend(last, command)
+        )
+        if folded:
+            self.commands.changed()
+        else:
+            self.commands.append(command)
+        if self.clock is not None:
+            self.clock.command(command_type, params)
+        return last if folded else command
+
+
+class Liquid:
+    def __init__(
+        self, liquid_id: str, name: str, description: str, display_color: str
+    ) -> None:
+        self.liquid_id = liquid_id
+        self.name = name
+        self.description = description
+        self.display_color = display_color
+
+
+class Deck(dict):
+    """Slot name to whatever occupies it; empty slots read as None."""
+
+    def __getitem__(self, slot: Union[str, int]) -> Any:
+        return self.get(str(slot))
+
+    def position_for(self, slot: Union[str, int]) -> Location:
+        return Location(Point(), str(slot))
+
+
+class MaxSpeeds(dict):
+    """Per-axis speed limits; unset axes read as the default gantry speed."""
+
+    def __missing__(self, axis: str) -> float:
+        return 400.0
+
+
+class ProtocolContext:
+    """Records each call in Protocol Engine terms instead of moving hardware."""
+
+    def __init__(
+        self,
+        api_version: APIVersion,
+        robot_type: str,
+        params: ParameterValues,
+        clock: Optional[VirtualClock] = None,
+    ) -> None:
+        check_robot_version(api_version, robot_type)
+        self.api_version = api_version
+        self.robot_type = robot_type
+        self.params = params
+        self.deck = Deck()
+        # keyed by slot, as numbers where the slot has one
+        self.loaded_labwares: Dict[Union[str, int], Any] = {}
+        self.loaded_instruments: Dict[str, InstrumentContext] = {}
+        self.loaded_modules: Dict[str, ModuleContext] = {}
+        self.liquids: List[Liquid] = []
+        self.max_speeds = MaxSpeeds()
+        self.rail_lights_on = False
+        self.door_closed = True
+        # cleared to run the branches protocols keep for the robot
+        self.simulating = True
+        self.bundled_data: Dict[str, bytes] = {}
+        self.custom_labware: Dict[str, dict] = {}
+        self._log = CommandLog(clock)
+        self._ids = itertools.count()
+        self._trash: List[TrashBin] = []
+        if robot_type == OT2:
+            self._trash.append(TrashBin("12", "fixedTrash"))
+            self.loaded_labwares[12] = self._trash[0]
+        elif api_version < EXPLICIT_TRASH_VERSION:
+            self._trash.append(TrashBin("A3", "fixedTrash"))
+
+    @property
+    def commands(self) -> RunLog:
+        return self._log.commands
+
+    @property
+    def fixed_trash(self) -> Optional[TrashBin]:
+        return self._trash[0] if self._trash else None
+
+    def _id(self, kind: str) -> str:
+        return f"{kind}-{next(self._ids)}"
+
+    def is_simulating(self) -> bool:
+        return self.simulating
+
+    def _location(self, location: Any) -> Any:
+        if location == OFF_DECK:
+            return OFF_DECK
+        if isinstance(location, ModuleContext):
+            return {"moduleId": location.module_id}
+        if isinstance(location, Labware):
+            return {"labwareId": location.labware_id}
+        if isinstance(location, TrashBin):
+            area = (
+                "gripperWasteChute"
+                if isinstance(location, WasteChute)
+                else location.area
+            )
+            return {"addressableAreaName": area}
+        return {"slotName": str(location)}
+
+    def _place(self, labware: Labware, location: Any) -> None:
+        labware.parent = location
+        if isinstance(location, ModuleContext):
+            location.labware = labware
+        elif isinstance(location, (str, int)) and location != OFF_DECK:
+            self.deck[str(location)] = labware
+
+    def _load(
+        self,
+        definition: dict,
+        location: Any,
+        label: Optional[str],
+        command: str,
+        custom: bool = True,
+    ) -> Labware:
+        """Load labware, recording a definition that is not synthesized with it."""
+        if location is None:
+            raise RecorderError(
+                f"No location given for {definition['parameters']['loadName']}"
+            )
+        labware = Labware(self, self._id("labware"), definition, location, label)
+        # as the robot reports it, so readers need not synthesize it again
+        result = {"labwareId": labware.labware_id, "definition": definition}
+        self._log.add(
+            command,
+            result if custom else None,
+            labwareId=labware.labware_id,
+            loadName=labware.load_name,
+            namespace=definition.get("namespace"),
+            version=definition.get("version"),
+            location=self._location(location),
+            displayName=label,
+        )
+        self._place(labware, location)
+        if isinstance(location, (str, int)) and location != OFF_DECK:
+            slot = str(location)
+            self.loaded_labwares[int(slot) if slot.isdigit() else slot] = labware
+        return labware
+
+    def load_labware(
+        self,
+        load_name: str,
+        location: Any = None,
+        label: Optional[str] = None,
+        namespace: Optional[str] = None,
+        version: Optional[int] = None,
+        adapter: Optional[str] = None,
+        lid: Optional[str] = None,
+    ) -> Labware:
+        if adapter is not None:
+            location = self.load_adapter(adapter, location)
+        custom = load_name in self.custom_labware
+        definition = self.custom_labware.get(load_name) or synthesize_definition(
+            load_name
+        )
+        labware = self._load(definition, location, label, "loadLabware", custom)
+        if lid is not None:
+            self.load_labware(lid, labware)
+        return labware
+
+    load_labware_by_name = load_labware
+
+    def load_labware_from_definition(
+        self, labware_def: dict, location: Any, label: Optional[str] = None
+    ) -> Labware:
+        return self._load(labware_def, location, label, "loadLabware")
+
+    def load_adapter(
+        self,
+        load_name: str,
+        location: Any,
+        namespace: Optional[str] = None,
+        version: Optional[int] = None,
+    ) -> Labware:
+        custom = load_name in self.custom_labware
+        definition = self.custom_labware.get(load_name) or synthesize_definition(
+            load_name, adapter=True
+        )
+        return self._load(definition, location, None, "loadLabware", custom)
+
+    def load_module(
+        self,
+        module_name: str,
+        location: Optional[Union[str, int]] = None,
+        configuration: Optional[str] = None,
+    ) -> ModuleContext:
+        context, model = module_type(module_name, self.robot_type == FLEX)
+        if location is None:
+            if context is not ThermocyclerContext:
+                raise RecorderError(f"No location given for {module_name}")
+            location = "B1" if self.robot_type == FLEX else "7"
+        module = context(self, self._id("module"), model, str(location))
+        self._log.add(
+            "loadModule",
+            moduleId=module.module_id,
+            model=model,
+            location={"slotName": str(location)},
+        )
+        self.deck[str(location)] = module
+        self.loaded_modules[module.module_id] = module
+        return module
+
+    def load_instrument(
+        self,
+        instrument_name: str,
+        mount: Union[str, Mount],
+        tip_racks: Optional[List[Labware]] = None,
+        replace: bool = False,
+        liquid_presence_detection: bool = False,
+    ) -> InstrumentContext:
+        mount = Mount.of(mount)
+        pipette = InstrumentContext(
+            self, self._id("pipette"), instrument_name, mount, tip_racks
+        )
+        self._log.add(
+            "loadPipette",
+            pipetteId=pipette.pipette_id,
+            pipetteName=instrument_name,
+            mount=mount.value,
+        )
+        self.loaded_instruments[mount.value] = pipette
+        return pipette
+
+    def load_trash_bin(self, location: Union[str, int]) -> TrashBin:
+        trash = TrashBin(str(location))
+        self._trash.append(trash)
+        self.deck[str(location)] = trash
+        return trash
+
+    def load_waste_chute(self) -> WasteChute:
+        chute = WasteChute()
+        self._trash.append(chute)
+        return chute
+
+    def move_labware(
+        self,
+        labware: Labware,
+        new_location: Any,
+        use_gripper: bool = False,
+        pick_up_offset: Optional[dict] = None,
+        drop_offset: Optional[dict] = None,
+    ) -> None:
+        if not isinstance(labware, Labware):
+            raise RecorderError(f"{labware!r} is not labware that can be moved")
+        old = labware.parent
+        if isinstance(old, ModuleContext):
+            old.labware = None
+        elif self.deck.get(str(old)) is labware:
+            del self.deck[str(old)]
+        self._log.add(
+            "moveLabware",
+            labwareId=labware.labware_id,
+            newLocation=self._location(new_location),
+            strategy="usingGripper" if use_gripper else "manualMoveWithPause",
+        )
+        self._place(labware, new_location)
+
+    def delay(
+        self, seconds: float = 0, minutes: float = 0, msg: Optional[str] = None
+    ) -> None:
+        self._log.add("waitForDuration", seconds=minutes * 60 + seconds, message=msg)
+
+    def pause(self, msg: Optional[str] = None) -> None:
+        self._log.add("waitForResume", message=msg)
+
+    def comment(self, msg: Any) -> None:
+        self._log.add("comment", message=str(msg))
+
+    def home(self) -> None:
+        self._log.add("home")
+
+    def set_rail_lights(self, on: bool) -> None:
+        self.rail_lights_on = on
+        self._log.add("setRailLights", on=on)
+
+    def define_liquid(
+        self,
+        name: str,
+        description: Optional[str] = None,
+        display_color: Optional[str] = None,
+    ) -> Liquid:
+        liquid = Liquid(
+            self._id("liquid"), name, description or "", display_color or ""
+        )
+        self.liquids.append(liquid)
+        return liquid
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith("__"):
+            raise AttributeError(name)
+        if name.startswith("_"):
+            return Unmodeled()
+
+        def unmodeled(*args: Any, **kwargs: Any) -> None:
+            self._log.add("custom", legacyCommandType=name)
+
+        return unmodeled
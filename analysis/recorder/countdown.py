@@ -0,0 +1,94 @@
+"""Countdown delays: one waitForDuration standing for a loop of equal delays.
+
+Protocols show a settling timer by delaying in short steps, each with a
+message naming the time left:
+
+    for bindi in np.arange(settling_time, 0, -0.5):
+        ctx.delay(minutes=0.5, msg="There are " + str(bindi) + " minutes left")
+
+Equal delays whose messages differ only in one number, counting down by
+the same step each time, are folded into the delay before them. The
+folded command keeps the first message's text as a template, so the
+message for any moment of the wait can be rendered from the time elapsed.
+"""
+
+import math
+import re
+from typing import Optional
+
+NUMBER = re.compile(r"-?\d+(?:\.\d+)?")
+PLACEHOLDER = "{remaining}"
+
+
+def _format(value: float, integers: bool) -> str:
+    # as str() of the int or float a protocol counted down with
+    return str(int(round(value))) if integers else str(round(value, 6))
+
+
+def _shown(template: str, message: object) -> Optional[float]:
+    """The number a message shows where the template has its placeholder."""
+    prefix, _, suffix = template.partition(PLACEHOLDER)
+    if not isinstance(message, str) or len(message) <= len(prefix) + len(suffix):
+        return None
+    if not message.startswith(prefix) or not message.endswith(suffix):
+        return None
+    middle = message[len(prefix) : len(message) - len(suffix)]
+    return float(middle) if NUMBER.fullmatch(middle) else None
+
+
+def _start(previous: dict, command: dict) -> Optional[dict]:
+    """The countdown two plain delays make, if they make one."""
+    message = previous["params"].get("message")
+    for match in NUMBER.finditer(message if isinstance(message, str) else ""):
+        template = message[: match.start()] + PLACEHOLDER + message[match.end() :]
+        shown = _shown(template, command["params"].get("message"))
+        if shown is not None and shown < float(match.group()):
+            return {
+                "template": template,
+                "from": float(match.group()),
+                "step": float(match.group()) - shown,
+                "integers": "." not in match.group(),
+                "interval": previous["params"]["seconds"],
+                "ticks": 1,
+            }
+    return None
+
+
+def _continues(countdown: dict, command: dict) -> bool:
+    shown = _shown(countdown["template"], command["params"].get("message"))
+    remaining = countdown["from"] - countdown["step"] * countdown["ticks"]
+    return shown is not None and math.isclose(shown, remaining, abs_tol=1e-6)
+
+
+def extend(previous: dict, command: dict) -> bool:
+    """Fold a delay into the delay before it, if it carries its countdown on."""
+    if previous.get("commandType") != "waitForDuration":
+        return False
+    params = previous["params"]
+    countdown = params.get("countdown")
+    interval = countdown["interval"] if countdown else params.get("seconds")
+    if command["params"].get("seconds") != interval or not interval:
+        return False
+    if countdown is None:
+        countdown = _start(previous, command)
+        if countdown is None:
+            return False
+    elif not _continues(countdown, command):
+        return False
+    countdown["ticks"] += 1
+    params["countdown"] = countdown
+    params["seconds"] = interval * countdown["ticks"]
+    return True
+
+
+def progress(command: dict, elapsed: float) -> Optional[str]:
+    """The message a delay shows once elapsed seconds of it have passed."""
+    params = command.get("params") or {}
+    countdown = params.get("countdown")
+    if not countdown:
+        return params.get("message")
+    tick = min(max(int(elapsed // countdown["interval"]), 0), countdown["ticks"] - 1)
+    remaining = countdown["from"] - countdown["step"] * tick
+    return countdown["template"].replace(
+        PLACEHOLDER, _format(remaining, countdown["integers"])
+    )
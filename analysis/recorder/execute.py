@@ -0,0 +1,276 @@
+"""Run a protocol against the recording context and collect what it did."""
+
+import sys
+import time
+import traceback
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+from analysis import labware_store
+from analysis.jsonstream import StreamingProtocol
+from analysis.recorder import shim
+from analysis.recorder.clock import VirtualClock, protocol_builtins
+from analysis.recorder.context import FLEX, OT2, ProtocolContext
+from analysis.recorder.parameters import Parameters
+from analysis.recorder.types import APIVersion, RecorderError
+from analysis.runs import RunLog
+
+MIN_API_VERSION = APIVersion(2, 0)
+MAX_API_VERSION = APIVersion(2, 22)
+# schema v3-v5 commands name their targets without the Id/Name suffixes
+LEGACY_PARAMS = {
+    "pipette": "pipetteId",
+    "labware": "labwareId",
+    "module": "moduleId",
+    "well": "wellName",
+}
+
+
+@dataclass
+class Recording:
+    """A protocol's metadata, declared parameters and recorded commands."""
+
+    protocol: str
+    metadata: dict = field(default_factory=dict)
+    robot_type: str = OT2
+    api_level: str = ""
+    parameters: List[dict] = field(default_factory=list)
+    commands: RunLog = field(default_factory=RunLog)
+    liquids: List[dict] = field(default_factory=list)
+    errors: List[dict] = field(default_factory=list)
+    seconds: float = 0.0
+
+    def as_analysis(self) -> dict:
+        """The same top-level shape `opentrons analyze --json-output` writes."""
+        return {
+            "files": [{"name": Path(self.protocol).name, "role": "main"}],
+            "metadata": self.metadata,
+            "robotType": self.robot_type,
+            "config": {"apiVersion": self.api_level, "analyzer": "recorder"},
+            "runTimeParameters": self.parameters,
+            "commandRuns": [run.as_dict() for run in self.commands.as_runs()],
+            "liquids": self.liquids,
+            "errors": self.errors,
+        }
+
+
+def _error(error: BaseException, path: Path) -> dict:
+    """Name the line of the protocol that raised, like analysis does."""
+    lines = [
+        frame.lineno
+        for frame in traceback.extract_tb(error.__traceback__)
+        if frame.filename == str(path)
+    ]
+    where = f" [line {lines[-1]}]" if lines else ""
+    return {"errorType": type(error).__name__, "detail": f"{error}{where}"}
+
+
+def declared_api_version(metadata: dict, requirements: dict) -> APIVersion:
+    """The supported API version a protocol declares, or a RecorderError."""
+    level = requirements.get("apiLevel") or metadata.get("apiLevel")
+    if level is None:
+        raise RecorderError("apiLevel is not declared in metadata or requirements")
+    version = APIVersion.parse(level)
+    if not MIN_API_VERSION <= version <= MAX_API_VERSION:
+        raise RecorderError(f"API version {version} is not supported")
+    return version
+
+
+def declared_robot_type(requirements: dict) -> str:
+    return FLEX if requirements.get("robotType") in ("OT-3", "Flex") else OT2
+
+
+def _load_custom_labware(paths: Iterable[Path]) -> Dict[str, dict]:
+    definitions = {}
+    for path in paths:
+        definition = labware_store.shared.get(labware_store.shared.add_file(path))
+        definitions[definition["parameters"]["loadName"]] = definition
+    return definitions
+
+
+def _run(
+    recording: Recording,
+    namespace: dict,
+    overrides: Dict[str, Any],
+    csv_files: Dict[str, Path],
+    labware: Iterable[Path],
+    clock: VirtualClock,
+    real_time: bool,
+) -> None:
+    metadata = namespace.get("metadata", {})
+    requirements = namespace.get("requirements", {})
+    recording.metadata = metadata
+    recording.robot_type = declared_robot_type(requirements)
+    version = declared_api_version(metadata, requirements)
+    recording.api_level = str(version)
+    parameters = Parameters()
+    if "add_parameters" in namespace:
+        namespace["add_parameters"](parameters)
+    recording.parameters = parameters.definitions
+    values = parameters.resolve(overrides, csv_files)
+    context = ProtocolContext(version, recording.robot_type, values, clock)
+    context.simulating = not real_time
+    context.custom_labware = _load_custom_labware(labware)
+    try:
+        namespace["run"](context)
+    finally:
+        recording.commands = context.commands
+        recording.liquids = [
+            {
+                "id": liquid.liquid_id,
+                "displayName": liquid.name,
+                "description": liquid.description,
+                "displayColor": liquid.display_color,
+            }
+            for liquid in context.liquids
+        ]
+
+
+def record(
+    path: Path,
+    overrides: Optional[Dict[str, Any]] = None,
+    csv_files: Optional[Dict[str, Path]] = None,
+    labware: Iterable[Path] = (),
+    real_time: bool = False,
+) -> Recording:
+    """Execute a Python protocol's run() offline and record every command.
+
+    The protocol's time and threads run on a virtual clock; see clock.py.
+    With real_time, is_simulating() is False, so the branches a protocol
+    keeps for the robot run too.
+    """
+    started = time.perf_counter()
+    recording = Recording(str(path))
+    clock = VirtualClock()
+    namespace: Dict[str, Any] = {
+        "__name__": "__protocol__",
+        "__file__": str(path),
+        "__builtins__": protocol_builtins(clock),
+    }
+    try:
+        code = compile(path.read_bytes(), str(path), "exec")
+        with shim.installed():
+            exec(code, namespace)
+            _run(
+                recording,
+                namespace,
+                overrides or {},
+                csv_files or {},
+                labware,
+                clock,
+                real_time,
+            )
+    except Exception as error:
+        recording.errors.append(_error(error, path))
+    finally:
+        clock.close()
+        sys.modules.pop("__protocol__", None)
+    recording.seconds = time.perf_counter() - started
+    return recording
+
+
+def _legacy_loads(protocol: StreamingProtocol) -> List[dict]:
+    """Schema v3-v5 declare equipment up front rather than with load commands."""
+    header = protocol.header
+    commands = []
+    for pipette_id, pipette in header.get("pipettes", {}).items():
+        params = {"pipetteId": pipette_id, "pipetteName": pipette.get("name")}
+        commands.append(
+            {
+                "commandType": "loadPipette",
+                "params": {**params, "mount": pipette.get("mount")},
+            }
+        )
+    for module_id, module in header.get("modules", {}).items():
+        location = {"slotName": str(module.get("slot"))}
+        params = {
+            "moduleId": module_id,
+            "model": module.get("model"),
+            "location": location,
+        }
+        commands.append({"commandType": "loadModule", "params": params})
+    for labware_id, labware in header.get("labware", {}).items():
+        slot = str(labware.get("slot"))
+        location = (
+            {"moduleId": slot}
+            if slot in header.get("modules", {})
+            else {"slotName": slot}
+        )
+        definition = protocol.labware_definition(labware["definitionId"])
+        params = {
+            "labwareId": labware_id,
+            "loadName": definition.get("parameters", {}).get("loadName"),
+            "location": location,
+            "displayName": labware.get("displayName"),
+        }
+        commands.append(
+            {
+                "commandType": "loadLabware",
+                "params": params,
+                "result": {"labwareId": labware_id, "definition": definition},
+            }
+        )
+    return commands
+
+
+def _from_header(protocol: StreamingProtocol, command: dict) -> dict:
+    """Fill a schema v6 load command in from the header declaring what it loads."""
+    header = protocol.header
+    declared = header.get("labware", {})
+    params = dict(command["params"])
+    command_type = command["commandType"]
+    if command_type == "loadPipette":
+        pipette = header.get("pipettes", {}).get(params.get("pipetteId"), {})
+        params.setdefault("pipetteName", pipette.get("name"))
+    elif command_type == "loadModule":
+        module = header.get("modules", {}).get(params.get("moduleId"), {})
+        params.setdefault("model", module.get("model"))
+    elif command_type == "loadLabware" and params.get("labwareId") in declared:
+        labware = declared[params["labwareId"]]
+        definition = protocol.labware_definition(labware["definitionId"])
+        params.setdefault("loadName", definition.get("parameters", {}).get("loadName"))
+        params.setdefault("namespace", definition.get("namespace"))
+        params.setdefault("version", definition.get("version"))
+        params.setdefault("displayName", labware.get("displayName"))
+        result = {"labwareId": params["labwareId"], "definition": definition}
+        return {**command, "params": params, "result": result}
+    return {**command, "params": params}
+
+
+def _command(command: dict) -> dict:
+    params = command.get("params", {})
+    if "commandType" in command:
+        return {"commandType": command["commandType"], "params": params}
+    return {
+        "commandType": command.get("command"),
+        "params": {
+            LEGACY_PARAMS.get(name, name): value for name, value in params.items()
+        },
+    }
+
+
+def record_json(path: Path) -> Recording:
+    """Read a JSON protocol's commands; they are already a command stream."""
+    started = time.perf_counter()
+    recording = Recording(str(path))
+    try:
+        protocol = StreamingProtocol(path)
+        header = protocol.header
+        recording.metadata = header.get("metadata", {})
+        recording.robot_type = header.get("robot", {}).get("model", OT2)
+        recording.api_level = str(protocol.schema_version)
+        if protocol.schema_version < 6:
+            recording.commands.extend(_legacy_loads(protocol))
+        commands = (_command(command) for command in protocol.commands())
+        if protocol.schema_version == 6:
+            commands = (_from_header(protocol, command) for command in commands)
+        recording.commands.extend(commands)
+        recording.liquids = [
+            {"id": liquid_id, **liquid}
+            for liquid_id, liquid in header.get("liquids", {}).items()
+        ]
+    except (OSError, ValueError, KeyError, TypeError, AttributeError) as error:
+        recording.errors.append(_error(error, path))
+    recording.seconds = time.perf_counter() - started
+    return recording
@@ -0,0 +1,464 @@
+"""Pipettes that record liquid handling instead of moving a plunger."""
+
+import math
+import re
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from analysis.recorder.labware import Labware, TrashBin, Well
+from analysis.recorder.types import (
+    Location,
+    Mount,
+    OutOfTipsError,
+    RecorderError,
+    Unmodeled,
+)
+
+# (flex, max volume) -> default aspirate, dispense and blow out rates in uL/s
+FLOW_RATES = {
+    (False, 10): (5.0, 10.0, 1000.0),
+    (False, 20): (7.56, 7.56, 7.56),
+    (False, 50): (25.0, 50.0, 1000.0),
+    (False, 300): (92.86, 92.86, 92.86),
+    (False, 1000): (274.7, 274.7, 274.7),
+    (True, 50): (35.0, 57.0, 57.0),
+    (True, 200): (160.0, 160.0, 80.0),
+    (True, 1000): (160.0, 160.0, 80.0),
+}
+MIN_VOLUMES = {10: 1.0, 20: 1.0, 50: 1.0, 300: 20.0, 1000: 5.0}
+NOZZLE_CHANNELS = {"SINGLE": 1, "COLUMN": 8, "ROW": 12}
+
+
+class FlowRates:
+    def __init__(self, aspirate: float, dispense: float, blow_out: float) -> None:
+        self.aspirate = aspirate
+        self.dispense = dispense
+        self.blow_out = blow_out
+
+
+class Clearances:
+    def __init__(self) -> None:
+        self.aspirate = 1.0
+        self.dispense = 1.0
+
+
+def pipette_spec(name: str) -> Tuple[int, float, bool]:
+    """Channels, max volume and whether it is a Flex pipette, from its name."""
+    flex = name.startswith("flex") or name.endswith("flex")
+    channels = 96 if "96" in name else 8 if "multi" in name or "8channel" in name else 1
+    volume = re.match(r"p(\d+)", name) or re.search(r"(\d+)$", name)
+    return channels, float(volume.group(1)) if volume else 1000.0, flex
+
+
+def _flatten(targets: Any, channels: int) -> list:
+    """Wells from a well, a list of wells, or columns for a multichannel pipette."""
+    if not isinstance(targets, (list, tuple)):
+        return [targets]
+    flat: list = []
+    for target in targets:
+        if isinstance(target, (list, tuple)):
+            flat.extend(target[:1] if channels > 1 else target)
+        else:
+            flat.append(target)
+    return flat
+
+
+def _pairs(volume: Any, source: Any, dest: Any, channels: int) -> list:
+    sources, dests = _flatten(source, channels), _flatten(dest, channels)
+    count = max(len(sources), len(dests))
+    sources = sources * count if len(sources) == 1 else sources
+    dests = dests * count if len(dests) == 1 else dests
+    if len(sources) != len(dests):
+        raise RecorderError("Source and destination lists must be the same length")
+    volumes = list(volume) if isinstance(volume, (list, tuple)) else [volume] * count
+    if len(volumes) == 2 and count != 2:
+        start, end = volumes
+        step = (end - start) / max(count - 1, 1)
+        volumes = [start + step * index for index in range(count)]
+    return list(zip(volumes, sources, dests))
+
+
+def _chunks(volume: float, capacity: float) -> List[float]:
+    """Split a volume into the fewest equal parts that each fit the tip."""
+    parts = max(1, math.ceil(volume / capacity - 1e-9))
+    return [volume / parts] * parts
+
+
+class InstrumentContext:
+    """A loaded pipette. Volumes and tips are tracked like the real API does."""
+
+    def __init__(
+        self,
+        context: Any,
+        pipette_id: str,
+        name: str,
+        mount: Mount,
+        tip_racks: Optional[List[Labware]] = None,
+    ) -> None:
+        self._context = context
+        self.pipette_id = pipette_id
+        self.name = name
+        self.mount = mount.value
+        self.channels, self.max_volume, flex = pipette_spec(name)
+        self.min_volume = MIN_VOLUMES.get(int(self.max_volume), 1.0)
+        rates = FLOW_RATES.get((flex, int(self.max_volume)), (92.86, 92.86, 92.86))
+        self.flow_rate = FlowRates(*rates)
+        self.well_bottom_clearance = Clearances()
+        self.default_speed = 400.0
+        self.tip_racks = list(tip_racks or [])
+        self.current_volume = 0.0
+        self.active_channels = self.channels
+        self.tip: Optional[Well] = None
+        self._trash: Optional[TrashBin] = None
+        self._location: Optional[Any] = None
+
+    @property
+    def has_tip(self) -> bool:
+        return self.tip is not None
+
+    @property
+    def type(self) -> str:
+        return "multi" if self.channels > 1 else "single"
+
+    @property
+    def trash_container(self) -> Any:
+        return self._trash or self._context.fixed_trash
+
+    @trash_container.setter
+    def trash_container(self, trash: Any) -> None:
+        self._trash = trash
+
+    @property
+    def starting_tip(self) -> Optional[Well]:
+        return None
+
+    @starting_tip.setter
+    def starting_tip(self, well: Well) -> None:
+        """Tips before the starting tip are treated as already used."""
+        rack = well.parent
+        for earlier in rack.wells()[: rack.wells().index(well)]:
+            rack.used_tips.add(earlier.well_name)
+
+    @property
+    def capacity(self) -> float:
+        """What can be held right now: the pipette or the attached tip, if smaller."""
+        if self.tip is not None and self.tip.max_volume:
+            return min(self.max_volume, self.tip.max_volume)
+        return self.max_volume
+
+    def _record(self, command_type: str, **params: Any) -> None:
+        self._context._log.add(command_type, pipetteId=self.pipette_id, **params)
+
+    def _target(self, location: Any, clearance: Optional[float] = None) -> dict:
+        """Command parameters for where the pipette acts, remembering it."""
+        location = self._location if location is None else location
+        if location is None:
+            raise RecorderError(f"{self.name} has no location to act on")
+        self._location = location
+        if isinstance(location, TrashBin):
+            return {"addressableAreaName": location.area}
+        if isinstance(location, Labware):
+            location = location.wells()[0]
+        if isinstance(location, Well):
+            location = (
+                location.top() if clearance is None else location.bottom(clearance)
+            )
+        if isinstance(location.labware, Labware):
+            location = Location(location.point, location.labware.wells()[0])
+        if isinstance(location.labware, Well):
+            return {
+                "labwareId": location.labware.parent.labware_id,
+                "wellName": location.labware.well_name,
+                "wellLocation": location.well_location(),
+            }
+        return {"position": location.point.as_dict()}
+
+    def _require_tip(self, action: str) -> None:
+        if self.tip is None:
+            raise RecorderError(f"Cannot {action} without a tip attached")
+
+    def aspirate(
+        self, volume: Optional[float] = None, location: Any = None, rate: float = 1.0
+    ) -> "InstrumentContext":
+        self._require_tip("aspirate")
+        if not volume:
+            volume = self.capacity - self.current_volume
+        if self.current_volume + volume > self.capacity + 1e-6:
+            raise RecorderError(
+                f"Cannot aspirate {volume} uL: {self.name} already holds "
+                f"{self.current_volume} of {self.capacity} uL"
+            )
+        target = self._target(location, self.well_bottom_clearance.aspirate)
+        self._record(
+            "aspirate", volume=volume, flowRate=self.flow_rate.aspirate * rate, **target
+        )
+        self.current_volume += volume
+        return self
+
+    def dispense(
+        self,
+        volume: Optional[float] = None,
+        location: Any = None,
+        rate: float = 1.0,
+        push_out: Optional[float] = None,
+    ) -> "InstrumentContext":
+        self._require_tip("dispense")
+        volume = self.current_volume if not volume else min(volume, self.current_volume)
+        target = self._target(location, self.well_bottom_clearance.dispense)
+        self._record(
+            "dispense", volume=volume, flowRate=self.flow_rate.dispense * rate, **target
+        )
+        self.current_volume -= volume
+        return self
+
+    def blow_out(self, location: Any = None) -> "InstrumentContext":
+        self._require_tip("blow out")
+        if location is None and self._location is None:
+            location = self.trash_container
+        target = self._target(location)
+        self._record("blowout", flowRate=self.flow_rate.blow_out, **target)
+        self.current_volume = 0.0
+        return self
+
+    def mix(
+        self,
+        repetitions: int = 1,
+        volume: Optional[float] = None,
+        location: Any = None,
+        rate: float = 1.0,
+    ) -> "InstrumentContext":
+        volume = volume or self.capacity
+        for _ in range(repetitions):
+            self.aspirate(volume, location, rate)
+            self.dispense(volume, None, rate)
+        return self
+
+    def air_gap(
+        self, volume: Optional[float] = None, height: Optional[float] = None
+    ) -> "InstrumentContext":
+        self._require_tip("air gap")
+        volume = volume or self.capacity - self.current_volume
+        self._record("airGapInPlace", volume=volume, flowRate=self.flow_rate.aspirate)
+        self.current_volume += volume
+        return self
+
+    def touch_tip(
+        self,
+        location: Any = None,
+        radius: float = 1.0,
+        v_offset: float = -1.0,
+        speed: float = 60.0,
+    ) -> "InstrumentContext":
+        self._require_tip("touch tip")
+        self._record("touchTip", radius=radius, speed=speed, **self._target(location))
+        return self
+
+    def move_to(
+        self,
+        location: Any,
+        force_direct: bool = False,
+        minimum_z_height: Optional[float] = None,
+        speed: Optional[float] = None,
+        publish: bool = True,
+    ) -> "InstrumentContext":
+        target = self._target(location)
+        command = "moveToWell" if "wellName" in target else "moveToCoordinates"
+        if "addressableAreaName" in target:
+            command = "moveToAddressableArea"
+        self._record(command, speed=speed or self.default_speed, **target)
+        return self
+
+    def pick_up_tip(self, location: Any = None, *args: Any, **kwargs: Any) -> Any:
+        if self.tip is not None:
+            raise RecorderError(f"{self.name} already has a tip attached")
+        tips = self._tips_at(location)
+        for tip in tips:
+            tip.parent.used_tips.add(tip.well_name)
+        self.tip = tips[0]
+        self._record(
+            "pickUpTip", labwareId=tips[0].parent.labware_id, wellName=tips[0].well_name
+        )
+        return self
+
+    def _tips_at(self, location: Any) -> List[Well]:
+        if isinstance(location, Location):
+            location = location.labware
+        if isinstance(location, Well):
+            return location.parent.tips_from(location, self.active_channels)
+        racks = [location] if isinstance(location, Labware) else self.tip_racks
+        for rack in racks:
+            tips = rack.free_tips(self.active_channels)
+            if tips:
+                return tips
+        raise OutOfTipsError(
+            f"{self.name} has no tip rack with {self.active_channels} unused tips"
+        )
+
+    def drop_tip(self, location: Any = None, home_after: Any = None) -> Any:
+        self._require_tip("drop tip")
+        target = self._target(self.trash_container if location is None else location)
+        target.pop("wellLocation", None)
+        self._record("dropTip", **target)
+        self.tip = None
+        self.current_volume = 0.0
+        return self
+
+    def return_tip(self, home_after: Any = None) -> Any:
+        self._require_tip("return tip")
+        return self.drop_tip(self.tip)
+
+    def home(self) -> "InstrumentContext":
+        self._record("home", axes=[self.mount])
+        return self
+
+    def home_plunger(self) -> "InstrumentContext":
+        return self.home()
+
+    def reset_tipracks(self) -> None:
+        for rack in self.tip_racks:
+            rack.reset()
+
+    def configure_for_volume(self, volume: float) -> None:
+        self._record("configureForVolume", volume=volume)
+
+    def prepare_to_aspirate(self) -> None:
+        self._record("prepareToAspirate")
+
+    def configure_nozzle_layout(
+        self,
+        style: Any = "ALL",
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        front_right: Optional[str] = None,
+        back_left: Optional[str] = None,
+        tip_racks: Optional[List[Labware]] = None,
+    ) -> None:
+        style = str(style)
+        self.active_channels = self.channels
+        if style not in ("ALL", "EMPTY") and self.channels > 1:
+            self.active_channels = NOZZLE_CHANNELS.get(style, self.channels)
+        if style == "PARTIAL_COLUMN" and start and end:
+            self.active_channels = abs(ord(end[0]) - ord(start[0])) + 1
+        if tip_racks is not None:
+            self.tip_racks = list(tip_racks)
+        self._record(
+            "configureNozzleLayout",
+            configurationParams={"style": style, "primaryNozzle": start, "end": end},
+        )
+
+    def require_liquid_presence(self, well: Well) -> None:
+        self._record("liquidProbe", **self._target(well.top()))
+
+    def detect_liquid_presence(self, well: Well) -> bool:
+        self._record("tryLiquidProbe", **self._target(well.top()))
+        return True
+
+    def transfer(
+        self, volume: Any, source: Any, dest: Any, **options: Any
+    ) -> "InstrumentContext":
+        """Aspirate from each source and dispense into its destination."""
+        pairs = _pairs(volume, source, dest, self.channels)
+        steps = [
+            ([(part, src)], [(part, dst)])
+            for amount, src, dst in pairs
+            for part in _chunks(amount, self.capacity - options.get("air_gap", 0))
+        ]
+        return self._run_steps(steps, options)
+
+    def distribute(
+        self, volume: Any, source: Any, dest: Any, **options: Any
+    ) -> "InstrumentContext":
+        """Aspirate once for as many destinations as the tip holds."""
+        options.setdefault("disposal_volume", self.min_volume)
+        pairs = _pairs(volume, source, dest, self.channels)
+        capacity = self.capacity - options["disposal_volume"]
+        dispenses = [
+            (part, dst) for v, _, dst in pairs for part in _chunks(v, capacity)
+        ]
+        steps = [
+            ([(sum(v for v, _ in group), pairs[0][1])], group)
+            for group in self._group(dispenses, capacity)
+        ]
+        return self._run_steps(steps, options)
+
+    def consolidate(
+        self, volume: Any, source: Any, dest: Any, **options: Any
+    ) -> "InstrumentContext":
+        """Aspirate from several sources before one dispense."""
+        pairs = _pairs(volume, source, dest, self.channels)
+        aspirates = [
+            (part, src) for v, src, _ in pairs for part in _chunks(v, self.capacity)
+        ]
+        steps = [
+            (group, [(sum(v for v, _ in group), pairs[0][2])])
+            for group in self._group(aspirates, self.capacity)
+        ]
+        return self._run_steps(steps, options)
+
+    @staticmethod
+    def _group(volumes: list, capacity: float) -> List[list]:
+        groups: List[list] = [[]]
+        for volume, target in volumes:
+            if groups[-1] and sum(v for v, _ in groups[-1]) + volume > capacity:
+                groups.append([])
+            groups[-1].append((volume, target))
+        return [group for group in groups if group]
+
+    def _run_steps(self, steps: Sequence[tuple], options: Dict[str, Any]) -> Any:
+        new_tip = options.get("new_tip", "once")
+        if new_tip == "once" and self.tip is None:
+            self.pick_up_tip()
+        for aspirates, dispenses in steps:
+            if new_tip == "always":
+                self.pick_up_tip()
+            self._aspirate_all(aspirates, options)
+            self._dispense_all(dispenses, options)
+            if new_tip == "always":
+                self._finish(options)
+        if new_tip == "once":
+            self._finish(options)
+        return self
+
+    def _aspirate_all(self, aspirates: list, options: Dict[str, Any]) -> None:
+        disposal = options.get("disposal_volume", 0)
+        for index, (volume, source) in enumerate(aspirates):
+            self._mix(options.get("mix_before"), source)
+            extra = disposal if index == 0 else 0
+            self.aspirate(volume + extra, source)
+            if options.get("touch_tip"):
+                self.touch_tip()
+        if options.get("air_gap"):
+            self.air_gap(options["air_gap"])
+
+    def _dispense_all(self, dispenses: list, options: Dict[str, Any]) -> None:
+        for volume, dest in dispenses:
+            self.dispense(volume + options.get("air_gap", 0), dest)
+            self._mix(options.get("mix_after"), dest)
+            if options.get("touch_tip"):
+                self.touch_tip()
+        if options.get("blow_out") or self.current_volume > 0:
+            blowout = options.get("blowout_location")
+            self.blow_out(
+                None if blowout == "destination well" else self.trash_container
+            )
+
+    def _mix(self, mix: Optional[tuple], location: Any) -> None:
+        if mix:
+            repetitions, volume = mix
+            self.mix(repetitions, volume, location)
+
+    def _finish(self, options: Dict[str, Any]) -> None:
+        finish: Callable[[], Any] = (
+            self.drop_tip if options.get("trash", True) else self.return_tip
+        )
+        finish()
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith("__"):
+            raise AttributeError(name)
+        if name.startswith("_"):
+            return Unmodeled()
+
+        def unmodeled(*args: Any, **kwargs: Any) -> None:
+            self._record("custom", legacyCommandType=name)
+
+        return unmodeled
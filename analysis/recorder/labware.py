@@ -0,0 +1,340 @@
+"""Labware and wells, built from real definitions or synthesized from load names."""
+
+import functools
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from analysis.geometry import MAX_INDEXES, WellIndex, index_for
+from analysis.recorder.types import Location, Point
+
+# wells per labware -> (rows, columns) on a standard SBS footprint
+GRIDS = {
+    1: (1, 1),
+    2: (1, 2),
+    4: (2, 2),
+    6: (2, 3),
+    8: (2, 4),
+    10: (3, 4),
+    12: (3, 4),
+    15: (3, 5),
+    24: (4, 6),
+    48: (6, 8),
+    96: (8, 12),
+    384: (16, 24),
+}
+WELL_COUNT = re.compile(r"_(\d+)_")
+WELL_VOLUME = re.compile(r"(\d+(?:\.\d+)?)(ul|ml)", re.IGNORECASE)
+# SBS plate A1 centre and the 96 well pitch, in mm from the labware origin
+A1_X, A1_Y, PITCH = 14.38, 74.24, 9.0
+
+
+def _well_volume(load_name: str) -> float:
+    """The last volume in a load name, e.g. 15000 for nest_12_reservoir_15ml."""
+    found = WELL_VOLUME.findall(load_name)
+    if not found:
+        return 0.0
+    amount, unit = found[-1]
+    return float(amount) * (1000 if unit.lower() == "ml" else 1)
+
+
+def _grid(load_name: str) -> tuple:
+    found = WELL_COUNT.search(f"_{load_name}_")
+    count = int(found.group(1)) if found else 0
+    if "reservoir" in load_name and count < 96:
+        return 1, count, count
+    rows, columns = GRIDS.get(count, (1, count))
+    return rows, columns, count
+
+
+@functools.lru_cache(maxsize=None)
+def synthesize_definition(load_name: str, adapter: bool = False) -> dict:
+    """A labware definition shaped like the real one, with approximate geometry.
+
+    Well counts and volumes come from the load name (nest_96_wellplate_2ml_deep
+    is 8 x 12 wells of 2 mL); positions follow the SBS footprint. Adapters and
+    lids have no wells. The result is cached and shared, so do not modify it.
+    """
+    rows, columns, count = (0, 0, 0) if adapter else _grid(load_name)
+    volume = _well_volume(load_name)
+    pitch_x = PITCH * 12 / columns if columns else PITCH
+    pitch_y = PITCH * 8 / rows if rows else PITCH
+    x_size, y_size = pitch_x * 0.9, pitch_y * 0.9
+    depth = volume / (x_size * y_size) if volume else 10.0
+    # plates have round wells unless they are deep well or 384 well plates
+    round_wells = "plate" in load_name and "deep" not in load_name and count < 384
+    shape = (
+        {"shape": "circular", "diameter": x_size}
+        if round_wells
+        else {"shape": "rectangular", "xDimension": x_size, "yDimension": y_size}
+    )
+    wells: Dict[str, dict] = {}
+    ordering: List[List[str]] = []
+    for column in range(columns):
+        ordering.append([])
+        for row in range(rows):
+            if len(wells) == count:
+                break
+            name = f"{chr(ord('A') + row)}{column + 1}"
+            ordering[-1].append(name)
+            wells[name] = {
+                "x": A1_X - PITCH / 2 + pitch_x * (column + 0.5),
+                "y": A1_Y + PITCH / 2 - pitch_y * (row + 0.5),
+                "z": 2.0,
+                "depth": depth,
+                **shape,
+                "totalLiquidVolume": volume,
+            }
+    return {
+        "ordering": [column for column in ordering if column],
+        "wells": wells,
+        "parameters": {"loadName": load_name, "isTiprack": "tiprack" in load_name},
+        "metadata": {"displayName": load_name},
+        "dimensions": {"zDimension": depth + 2.0},
+        "namespace": "opentrons",
+        "version": 1,
+    }
+
+
+@dataclass(frozen=True)
+class WellGeometry:
+    """What Well.geometry tells a protocol about a well's shape."""
+
+    max_volume: float
+    depth: float
+    diameter: Optional[float]
+    width: Optional[float]
+    length: Optional[float]
+
+
+@functools.lru_cache(maxsize=MAX_INDEXES)
+def _well_geometry(index: WellIndex) -> List[Tuple[Point, Point, WellGeometry]]:
+    """Each well's bottom, top and shape, built once per index for all its labware."""
+    return [
+        (Point(*bottom), Point(*top), WellGeometry(*dimensions))
+        for bottom, top, dimensions in zip(
+            index.bottom_list, index.top_list, index.dimensions
+        )
+    ]
+
+
+class Well:
+    """One well of a labware; its geometry comes from the definition's WellIndex."""
+
+    def __init__(
+        self,
+        parent: "Labware",
+        name: str,
+        number: int,
+        geometry: Tuple[Point, Point, WellGeometry],
+    ) -> None:
+        self.parent = parent
+        self.well_name = name
+        self.number = number
+        self._bottom, self._top, self.geometry = geometry
+        self.max_volume = self.geometry.max_volume
+        self.depth = self.geometry.depth
+        self.diameter = self.geometry.diameter
+        self.width = self.geometry.width
+        self.length = self.geometry.length
+
+    @property
+    def has_tip(self) -> bool:
+        return self.parent.is_tiprack and self.well_name not in self.parent.used_tips
+
+    def top(self, z: float = 0.0) -> Location:
+        offset = Point(0, 0, z)
+        return Location(self._top + offset, self, "top", offset)
+
+    def bottom(self, z: float = 0.0) -> Location:
+        offset = Point(0, 0, z)
+        return Location(self._bottom + offset, self, "bottom", offset)
+
+    def center(self) -> Location:
+        return Location(self._bottom + Point(0, 0, self.depth / 2), self, "center")
+
+    def from_center_cartesian(self, x: float, y: float, z: float) -> Point:
+        width = self.diameter or self.width or 0
+        length = self.diameter or self.length or 0
+        center = self.center().point
+        return center + Point(x * width / 2, y * length / 2, z * self.depth / 2)
+
+    def load_liquid(self, liquid: Any, volume: float) -> None:
+        self.parent.context._log.add(
+            "loadLiquid",
+            liquidId=liquid.liquid_id,
+            labwareId=self.parent.labware_id,
+            volumeByWell={self.well_name: volume},
+        )
+
+    def __repr__(self) -> str:
+        return f"{self.well_name} of {self.parent!r}"
+
+
+class Labware:
+    """A loaded labware; wells are ordered column by column like the real API."""
+
+    def __init__(
+        self,
+        context: Any,
+        labware_id: str,
+        definition: dict,
+        parent: Any,
+        label: Optional[str] = None,
+    ) -> None:
+        self.context = context
+        self.labware_id = labware_id
+        self.definition = definition
+        self.parent = parent
+        self.load_name = definition["parameters"]["loadName"]
+        self.name = self.load_name
+        self.label = label or definition.get("metadata", {}).get("displayName")
+        self.is_tiprack = bool(definition["parameters"].get("isTiprack"))
+        self.is_adapter = not definition.get("wells")
+        self.used_tips: set = set()
+        self.index = index_for(definition)
+        self._well_list = [
+            Well(self, name, number, geometry)
+            for number, (name, geometry) in enumerate(
+                zip(self.index.names, _well_geometry(self.index))
+            )
+        ]
+        self._wells = {well.well_name: well for well in self._well_list}
+        self._columns = [
+            [self._well_list[number] for number in column]
+            for column in self.index.columns
+        ]
+
+    @property
+    def uri(self) -> str:
+        namespace = self.definition.get("namespace", "custom_beta")
+        return f"{namespace}/{self.load_name}/{self.definition.get('version', 1)}"
+
+    @property
+    def highest_z(self) -> float:
+        return float(self.definition.get("dimensions", {}).get("zDimension", 0))
+
+    def wells(self, *names: Union[str, int]) -> List[Well]:
+        if not names:
+            return list(self._well_list)
+        return [self.well(name) for name in names]
+
+    def well(self, index: Union[str, int]) -> Well:
+        if isinstance(index, int):
+            return self._well_list[index]
+        return self._wells[index]
+
+    def __getitem__(self, name: str) -> Well:
+        return self._wells[name]
+
+    def wells_by_name(self) -> Dict[str, Well]:
+        return dict(self._wells)
+
+    def columns(self, *indices: Union[str, int]) -> List[List[Well]]:
+        columns = [list(column) for column in self._columns]
+        if not indices:
+            return columns
+        return [
+            columns[int(index) - 1 if isinstance(index, str) else index]
+            for index in indices
+        ]
+
+    def rows(self, *indices: Union[str, int]) -> List[List[Well]]:
+        rows = list(self.rows_by_name().values())
+        if not indices:
+            return rows
+        names = list(self.rows_by_name())
+        return [
+            rows[names.index(index) if isinstance(index, str) else index]
+            for index in indices
+        ]
+
+    def columns_by_name(self) -> Dict[str, List[Well]]:
+        return {str(number + 1): column for number, column in enumerate(self.columns())}
+
+    def rows_by_name(self) -> Dict[str, List[Well]]:
+        return {
+            name: [self._well_list[number] for number in row]
+            for name, row in self.index.rows.items()
+        }
+
+    def load_labware(
+        self, name: str, label: Optional[str] = None, *args: Any, **kwargs: Any
+    ) -> "Labware":
+        return self.context.load_labware(name, self, label, *args, **kwargs)
+
+    def load_labware_from_definition(
+        self, definition: dict, label: Optional[str] = None
+    ) -> "Labware":
+        return self.context.load_labware_from_definition(definition, self, label)
+
+    def set_offset(self, x: float, y: float, z: float) -> None:
+        """Labware position check offsets do not affect a recording."""
+
+    def reset(self) -> None:
+        self.used_tips.clear()
+
+    def free_tips(self, count: int) -> List[Well]:
+        """The first run of count unused tips the real tip tracker would pick."""
+        for group in self._tip_groups(count):
+            if not any(well.well_name in self.used_tips for well in group):
+                return group
+        return []
+
+    def tips_from(self, well: Well, count: int) -> List[Well]:
+        """The tips a pipette picking up count tips at well would take."""
+        for group in self._tip_groups(count):
+            if group[0] is well:
+                return group
+        return [well]
+
+    def _tip_groups(self, count: int) -> List[List[Well]]:
+        wells = self.wells()
+        if count == 1:
+            return [[well] for well in wells]
+        if count == len(wells):
+            return [wells]
+        if self._columns and count <= len(self._columns[0]):
+            return [
+                column[start : start + count]
+                for column in self._columns
+                for start in range(len(column) - count + 1)
+            ]
+        return [row for row in self.rows() if len(row) == count]
+
+    def __repr__(self) -> str:
+        return f"{self.label} on {getattr(self.parent, 'display_name', self.parent)}"
+
+
+class TrashBin:
+    """A trash bin or the OT-2 fixed trash, addressed by area rather than well."""
+
+    def __init__(self, location: str, area: Optional[str] = None) -> None:
+        self.location = location
+        self.area = area or f"movableTrash{location}"
+
+    def top(self, x: float = 0, y: float = 0, z: float = 0) -> "TrashBin":
+        return self
+
+    def move(self, point: Point) -> "TrashBin":
+        return self
+
+    def wells(self) -> List["TrashBin"]:
+        # the fixed trash was labware with a single well before API 2.16
+        return [self]
+
+    def __getitem__(self, name: str) -> "TrashBin":
+        return self
+
+    def __repr__(self) -> str:
+        return f"Trash Bin in {self.location}"
+
+
+class WasteChute(TrashBin):
+    """The Flex waste chute; labware and tips dropped here leave the deck."""
+
+    def __init__(self) -> None:
+        super().__init__("D3", "wasteChute")
+
+    def __repr__(self) -> str:
+        return "Waste Chute"
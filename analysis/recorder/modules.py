@@ -0,0 +1,315 @@
+"""Module contexts that record commands under their Protocol Engine names."""
+
+import re
+from typing import Any, List, Optional, Tuple, Type
+
+from analysis.recorder.labware import Labware
+from analysis.recorder.types import RecorderError, Unmodeled
+
+
+class ModuleContext:
+    """Commands are recorded as "<prefix>/<command>" with the module's id."""
+
+    prefix = ""
+
+    def __init__(self, context: Any, module_id: str, model: str, location: str) -> None:
+        self._context = context
+        self.module_id = module_id
+        self.model = model
+        self.parent = location
+        self.labware: Optional[Labware] = None
+
+    @property
+    def api_version(self) -> Any:
+        return self._context.api_version
+
+    def _record(self, command: str, **params: Any) -> None:
+        self._context._log.add(
+            f"{self.prefix}/{command}", moduleId=self.module_id, **params
+        )
+
+    def load_labware(
+        self, name: str, label: Optional[str] = None, *args: Any, **kwargs: Any
+    ) -> Labware:
+        return self._context.load_labware(name, self, label, *args, **kwargs)
+
+    def load_adapter(self, name: str, *args: Any, **kwargs: Any) -> Labware:
+        return self._context.load_adapter(name, self, *args, **kwargs)
+
+    def load_labware_from_definition(
+        self, definition: dict, label: Optional[str] = None
+    ) -> Labware:
+        return self._context.load_labware_from_definition(definition, self, label)
+
+    load_labware_by_name = load_labware
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith("__"):
+            raise AttributeError(name)
+        if name.startswith("_"):
+            return Unmodeled()
+
+        def unmodeled(*args: Any, **kwargs: Any) -> None:
+            self._record(name)
+
+        return unmodeled
+
+    def __repr__(self) -> str:
+        return f"{self.model} in {self.parent}"
+
+
+class TemperatureModuleContext(ModuleContext):
+    prefix = "temperatureModule"
+
+    def __init__(self, *args: Any) -> None:
+        super().__init__(*args)
+        self.target: Optional[float] = None
+        self.temperature = 25.0
+        self.status = "idle"
+
+    def start_set_temperature(self, celsius: float) -> None:
+        self.target = celsius
+        self.status = "holding at target"
+        self._record("setTargetTemperature", celsius=celsius)
+
+    def await_temperature(self, celsius: Optional[float] = None) -> None:
+        self.temperature = celsius if celsius is not None else self.target
+        self._record("waitForTemperature", celsius=celsius)
+
+    def set_temperature(self, celsius: float) -> None:
+        self.start_set_temperature(celsius)
+        self.await_temperature()
+
+    def deactivate(self) -> None:
+        self.target, self.status = None, "idle"
+        self._record("deactivate")
+
+
+class ThermocyclerContext(ModuleContext):
+    prefix = "thermocycler"
+
+    def __init__(self, *args: Any) -> None:
+        super().__init__(*args)
+        self.lid_position = "open"
+        self.block_target_temperature: Optional[float] = None
+        self.lid_target_temperature: Optional[float] = None
+        # simulated modules read as having reached their targets
+        self.block_temperature: Optional[float] = None
+        self.lid_temperature: Optional[float] = None
+        self.block_temperature_status = "idle"
+        self.lid_temperature_status = "idle"
+
+    def open_lid(self) -> str:
+        self.lid_position = "open"
+        self._record("openLid")
+        return self.lid_position
+
+    def close_lid(self) -> str:
+        self.lid_position = "closed"
+        self._record("closeLid")
+        return self.lid_position
+
+    def set_block_temperature(
+        self,
+        temperature: float,
+        hold_time_seconds: Optional[float] = None,
+        hold_time_minutes: Optional[float] = None,
+        ramp_rate: Optional[float] = None,
+        block_max_volume: Optional[float] = None,
+    ) -> None:
+        hold = (hold_time_seconds or 0) + (hold_time_minutes or 0) * 60
+        self.block_target_temperature = self.block_temperature = temperature
+        self.block_temperature_status = "holding at target"
+        self._record(
+            "setTargetBlockTemperature",
+            celsius=temperature,
+            holdTimeSeconds=hold or None,
+            blockMaxVolumeUl=block_max_volume,
+        )
+        self._record("waitForBlockTemperature")
+
+    def set_lid_temperature(self, temperature: float) -> None:
+        self.lid_target_temperature = self.lid_temperature = temperature
+        self.lid_temperature_status = "holding at target"
+        self._record("setTargetLidTemperature", celsius=temperature)
+        self._record("waitForLidTemperature")
+
+    def execute_profile(
+        self,
+        steps: List[dict],
+        repetitions: int,
+        block_max_volume: Optional[float] = None,
+    ) -> None:
+        """Recorded once, unexpanded: the steps and how many times they repeat."""
+        if repetitions < 1:
+            raise RecorderError("repetitions must be a positive integer")
+        self._record(
+            "runProfile",
+            steps=[
+                {
+                    "celsius": step["temperature"],
+                    "holdSeconds": step.get("hold_time_seconds", 0)
+                    + step.get("hold_time_minutes", 0) * 60,
+                }
+                for step in steps
+            ],
+            repetitions=repetitions,
+            blockMaxVolumeUl=block_max_volume,
+        )
+        if steps:
+            self.block_target_temperature = steps[-1]["temperature"]
+            self.block_temperature = self.block_target_temperature
+            self.block_temperature_status = "holding at target"
+
+    def deactivate_lid(self) -> None:
+        self.lid_target_temperature = self.lid_temperature = None
+        self.lid_temperature_status = "idle"
+        self._record("deactivateLid")
+
+    def deactivate_block(self) -> None:
+        self.block_target_temperature = self.block_temperature = None
+        self.block_temperature_status = "idle"
+        self._record("deactivateBlock")
+
+    def deactivate(self) -> None:
+        self.deactivate_lid()
+        self.deactivate_block()
+
+
+class HeaterShakerContext(ModuleContext):
+    prefix = "heaterShaker"
+
+    def __init__(self, *args: Any) -> None:
+        super().__init__(*args)
+        self.target_temperature: Optional[float] = None
+        self.current_speed = 0
+        self.labware_latch_status = "idle_unknown"
+
+    def set_target_temperature(self, celsius: float) -> None:
+        self.target_temperature = celsius
+        self._record("setTargetTemperature", celsius=celsius)
+
+    def wait_for_temperature(self) -> None:
+        self._record("waitForTemperature")
+
+    def set_and_wait_for_temperature(self, celsius: float) -> None:
+        self.set_target_temperature(celsius)
+        self.wait_for_temperature()
+
+    def set_and_wait_for_shake_speed(self, rpm: int) -> None:
+        if self.labware_latch_status == "idle_open":
+            raise RecorderError("Cannot shake while the labware latch is open")
+        self.current_speed = rpm
+        self._record("setAndWaitForShakeSpeed", rpm=rpm)
+
+    def deactivate_shaker(self) -> None:
+        self.current_speed = 0
+        self._record("deactivateShaker")
+
+    def deactivate_heater(self) -> None:
+        self.target_temperature = None
+        self._record("deactivateHeater")
+
+    def open_labware_latch(self) -> None:
+        if self.current_speed:
+            raise RecorderError("Cannot open the labware latch while shaking")
+        self.labware_latch_status = "idle_open"
+        self._record("openLabwareLatch")
+
+    def close_labware_latch(self) -> None:
+        self.labware_latch_status = "idle_closed"
+        self._record("closeLabwareLatch")
+
+
+class MagneticModuleContext(ModuleContext):
+    prefix = "magneticModule"
+
+    def __init__(self, *args: Any) -> None:
+        super().__init__(*args)
+        self.status = "disengaged"
+
+    def engage(
+        self,
+        height: Optional[float] = None,
+        offset: Optional[float] = None,
+        height_from_base: Optional[float] = None,
+    ) -> None:
+        self.status = "engaged"
+        self._record("engage", height=height_from_base or height or offset)
+
+    def disengage(self) -> None:
+        self.status = "disengaged"
+        self._record("disengage")
+
+
+class MagneticBlockContext(ModuleContext):
+    """Unpowered: it only holds labware, so it records nothing of its own."""
+
+    prefix = "magneticBlock"
+
+
+class AbsorbanceReaderContext(ModuleContext):
+    prefix = "absorbanceReader"
+
+    def initialize(
+        self, mode: str, wavelengths: List[int], *args: Any, **kwargs: Any
+    ) -> None:
+        self._wavelengths = list(wavelengths)
+        self._record("initialize", measureMode=mode, sampleWavelengths=wavelengths)
+
+    def open_lid(self) -> None:
+        self._record("openLid")
+
+    def close_lid(self) -> None:
+        self._record("closeLid")
+
+    def read(self, export_filename: Optional[str] = None) -> dict:
+        self._record("read", fileName=export_filename)
+        wells = [f"{row}{column}" for row in "ABCDEFGH" for column in range(1, 13)]
+        return {
+            wavelength: {well: 0.0 for well in wells}
+            for wavelength in getattr(self, "_wavelengths", [])
+        }
+
+
+# normalized load name pattern -> (context, model, model when "gen2" or "v2")
+MODULES: List[Tuple[str, Type[ModuleContext], str, str]] = [
+    (
+        "temperature|tempdeck",
+        TemperatureModuleContext,
+        "temperatureModuleV1",
+        "temperatureModuleV2",
+    ),
+    ("magneticblock", MagneticBlockContext, "magneticBlockV1", "magneticBlockV1"),
+    ("magnetic|magdeck", MagneticModuleContext, "magneticModuleV1", "magneticModuleV2"),
+    (
+        "thermocycler",
+        ThermocyclerContext,
+        "thermocyclerModuleV1",
+        "thermocyclerModuleV2",
+    ),
+    (
+        "heatershaker",
+        HeaterShakerContext,
+        "heaterShakerModuleV1",
+        "heaterShakerModuleV1",
+    ),
+    (
+        "absorbancereader",
+        AbsorbanceReaderContext,
+        "absorbanceReaderV1",
+        "absorbanceReaderV1",
+    ),
+]
+
+
+def module_type(name: str, flex: bool) -> Tuple[Type[ModuleContext], str]:
+    """The context class and Protocol Engine model for a load_module name."""
+    normalized = re.sub(r"[^a-z0-9]", "", name.lower())
+    second_generation = "gen2" in normalized or normalized.endswith("v2")
+    for pattern, context, first, second in MODULES:
+        if re.match(pattern, normalized):
+            # the Flex only supports the newest thermocycler
+            newest = second_generation or (flex and context is ThermocyclerContext)
+            return context, second if newest else first
+    raise RecorderError(f"{name} is not a valid module load name")
@@ -0,0 +1,179 @@
+"""Runtime parameters declared by add_parameters(), resolved to values."""
+
+import csv
+import io
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from analysis.recorder.types import RecorderError
+
+
+class CSVParameter:
+    """The value of an add_csv_file() parameter."""
+
+    def __init__(self, name: str, path: Optional[Path]) -> None:
+        self.name = name
+        self.path = path
+
+    @property
+    def contents(self) -> str:
+        if self.path is None:
+            raise RecorderError(f"No CSV file was given for parameter {self.name}")
+        return self.path.read_text(encoding="utf-8")
+
+    @property
+    def file(self) -> io.StringIO:
+        return io.StringIO(self.contents)
+
+    def parse_as_csv(self, detect_dialect: bool = True) -> List[List[str]]:
+        contents = self.contents
+        dialect = csv.excel
+        if detect_dialect:
+            try:
+                dialect = csv.Sniffer().sniff(contents)
+            except csv.Error:
+                pass
+        return list(csv.reader(io.StringIO(contents), dialect))
+
+
+class ParameterValues:
+    """ctx.params: one attribute per declared parameter."""
+
+    def __init__(self, values: Dict[str, Any]) -> None:
+        self.__dict__.update(values)
+
+    def get_all(self) -> Dict[str, Any]:
+        return dict(self.__dict__)
+
+
+class Parameters:
+    """Collects declarations in the shape analysis reports runTimeParameters."""
+
+    def __init__(self) -> None:
+        self.definitions: List[dict] = []
+
+    def _add(
+        self, kind: str, variable_name: str, display_name: str, **fields: Any
+    ) -> None:
+        choices = fields.pop("choices", None)
+        definition = {
+            "type": kind,
+            "variableName": variable_name,
+            "displayName": display_name,
+            **{key: value for key, value in fields.items() if value is not None},
+        }
+        if choices:
+            definition["choices"] = [
+                {"displayName": choice["display_name"], "value": choice["value"]}
+                for choice in choices
+            ]
+        self.definitions.append(definition)
+
+    def add_int(
+        self,
+        variable_name: str,
+        display_name: str,
+        default: int,
+        minimum: Optional[int] = None,
+        maximum: Optional[int] = None,
+        choices: Optional[List[dict]] = None,
+        description: Optional[str] = None,
+        unit: Optional[str] = None,
+    ) -> None:
+        self._add(
+            "int",
+            variable_name,
+            display_name,
+            default=default,
+            min=minimum,
+            max=maximum,
+            choices=choices,
+            description=description,
+            suffix=unit,
+        )
+
+    def add_float(
+        self,
+        variable_name: str,
+        display_name: str,
+        default: float,
+        minimum: Optional[float] = None,
+        maximum: Optional[float] = None,
+        choices: Optional[List[dict]] = None,
+        description: Optional[str] = None,
+        unit: Optional[str] = None,
+    ) -> None:
+        self._add(
+            "float",
+            variable_name,
+            display_name,
+            default=default,
+            min=minimum,
+            max=maximum,
+            choices=choices,
+            description=description,
+            suffix=unit,
+        )
+
+    def add_bool(
+        self,
+        variable_name: str,
+        display_name: str,
+        default: bool,
+        description: Optional[str] = None,
+    ) -> None:
+        self._add(
+            "bool",
+            variable_name,
+            display_name,
+            default=default,
+            description=description,
+        )
+
+    def add_str(
+        self,
+        variable_name: str,
+        display_name: str,
+        default: str,
+        choices: Optional[List[dict]] = None,
+        description: Optional[str] = None,
+    ) -> None:
+        self._add(
+            "str",
+            variable_name,
+            display_name,
+            default=default,
+            choices=choices,
+            description=description,
+        )
+
+    def add_csv_file(
+        self, variable_name: str, display_name: str, description: Optional[str] = None
+    ) -> None:
+        self._add("csv_file", variable_name, display_name, description=description)
+
+    def resolve(
+        self, overrides: Dict[str, Any], csv_files: Dict[str, Path]
+    ) -> ParameterValues:
+        """Values for ctx.params, recording each one's value on its definition."""
+        values: Dict[str, Any] = {}
+        for definition in self.definitions:
+            name = definition["variableName"]
+            if definition["type"] == "csv_file":
+                values[name] = CSVParameter(name, csv_files.get(name))
+                definition["file"] = str(csv_files.get(name) or "") or None
+                continue
+            value = overrides.get(name, definition["default"])
+            _validate(definition, value)
+            definition["value"] = values[name] = value
+        return ParameterValues(values)
+
+
+def _validate(definition: dict, value: Any) -> None:
+    name = definition["variableName"]
+    choices = [choice["value"] for choice in definition.get("choices", [])]
+    if choices and value not in choices:
+        raise RecorderError(f"{value!r} is not a choice for parameter {name}")
+    low, high = definition.get("min"), definition.get("max")
+    if low is not None and high is not None and not low <= value <= high:
+        raise RecorderError(f"{value!r} is outside {low}-{high} for parameter {name}")
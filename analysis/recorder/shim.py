@@ -0,0 +1,110 @@
+"""Stand-in `opentrons` modules so protocols import the recorder instead."""
+
+import contextlib
+import importlib.abc
+import importlib.machinery
+import sys
+import types
+from typing import Dict, Iterator, Optional, Sequence
+
+from analysis.recorder import context, instrument, labware, modules, parameters
+from analysis.recorder import types as recorder_types
+
+NOZZLE_STYLES = ("ALL", "COLUMN", "ROW", "SINGLE", "PARTIAL_COLUMN", "EMPTY")
+
+
+def _module(name: str, **attributes: object) -> types.ModuleType:
+    module = types.ModuleType(name)
+    module.__path__ = []  # type: ignore[attr-defined]
+    module.__dict__.update(attributes)
+    return module
+
+
+def _unmodeled_module(name: str) -> types.ModuleType:
+    """Any other opentrons module; each name in it is a stand-in class."""
+
+    def stand_in(attribute: str) -> type:
+        if attribute.startswith("__"):
+            raise AttributeError(attribute)
+        return type(attribute, (recorder_types.Unmodeled,), {})
+
+    return _module(name, __getattr__=stand_in)
+
+
+class _Finder(importlib.abc.MetaPathFinder, importlib.abc.Loader):
+    """Serves opentrons submodules the stand-ins do not define."""
+
+    def find_spec(
+        self,
+        fullname: str,
+        path: Optional[Sequence[str]],
+        target: Optional[types.ModuleType] = None,
+    ) -> Optional[importlib.machinery.ModuleSpec]:
+        if not fullname.startswith("opentrons."):
+            return None
+        return importlib.machinery.ModuleSpec(fullname, self, is_package=True)
+
+    def create_module(self, spec: importlib.machinery.ModuleSpec) -> types.ModuleType:
+        return _unmodeled_module(spec.name)
+
+    def exec_module(self, module: types.ModuleType) -> None:
+        pass
+
+
+def build() -> Dict[str, types.ModuleType]:
+    """The subset of the opentrons package the protocols in this repo import."""
+    shared = {
+        "Labware": labware.Labware,
+        "Well": labware.Well,
+        "TrashBin": labware.TrashBin,
+        "WasteChute": labware.WasteChute,
+        "InstrumentContext": instrument.InstrumentContext,
+        "ModuleContext": modules.ModuleContext,
+        "ProtocolContext": context.ProtocolContext,
+    }
+    opentrons_types = _module(
+        "opentrons.types",
+        Point=recorder_types.Point,
+        Location=recorder_types.Location,
+        Mount=recorder_types.Mount,
+    )
+    protocol_api = _module(
+        "opentrons.protocol_api",
+        **shared,
+        **{style: style for style in NOZZLE_STYLES},
+        OFF_DECK=context.OFF_DECK,
+        Parameters=parameters.Parameters,
+        labware=_module("opentrons.protocol_api.labware", **shared),
+        contexts=_module("opentrons.protocol_api.contexts", **shared),
+    )
+    opentrons = _module("opentrons", protocol_api=protocol_api, types=opentrons_types)
+    return {
+        "opentrons": opentrons,
+        "opentrons.types": opentrons_types,
+        "opentrons.protocol_api": protocol_api,
+        "opentrons.protocol_api.labware": protocol_api.labware,
+        "opentrons.protocol_api.contexts": protocol_api.contexts,
+    }
+
+
+def _opentrons(name: str) -> bool:
+    # not opentrons_shared_data and other packages sharing the prefix
+    return name == "opentrons" or name.startswith("opentrons.")
+
+
+@contextlib.contextmanager
+def installed() -> Iterator[None]:
+    """Swap the stand-ins into sys.modules, restoring any real opentrons after."""
+    saved = {name: module for name, module in sys.modules.items() if _opentrons(name)}
+    for name in saved:
+        del sys.modules[name]
+    sys.modules.update(build())
+    finder = _Finder()
+    sys.meta_path.insert(0, finder)
+    try:
+        yield
+    finally:
+        sys.meta_path.remove(finder)
+        for name in [name for name in sys.modules if _opentrons(name)]:
+            del sys.modules[name]
+        sys.modules.update(saved)
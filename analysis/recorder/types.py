@@ -0,0 +1,131 @@
+"""Values shared by the recording contexts, mirroring opentrons.types."""
+
+import enum
+import math
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, NamedTuple, Optional
+
+
+class RecorderError(Exception):
+    """The protocol asked for something the robot would refuse to do."""
+
+
+class OutOfTipsError(RecorderError):
+    """No tip rack assigned to the pipette has the tips it needs."""
+
+
+class Unmodeled(Exception):
+    """Stands in for opentrons internals the recorder does not model.
+
+    Attributes, calls and items all give another stand-in, so a protocol
+    reaching into private APIs keeps running. It is an exception so that
+    stand-in error classes can be named in `except` clauses. It also passes
+    for a dataclass, so dataclasses.replace() on one gives another.
+    """
+
+    __dataclass_fields__: Dict[str, Any] = {}
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args)
+
+    def __getattr__(self, name: str) -> "Unmodeled":
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return Unmodeled()
+
+    def __call__(self, *args: Any, **kwargs: Any) -> "Unmodeled":
+        return Unmodeled()
+
+    def __getitem__(self, key: Any) -> "Unmodeled":
+        return Unmodeled()
+
+
+@dataclass(frozen=True)
+class Point:
+    """A position in mm, like opentrons.types.Point."""
+
+    x: float = 0.0
+    y: float = 0.0
+    z: float = 0.0
+
+    def __add__(self, other: Any) -> "Point":
+        if not isinstance(other, Point):
+            return NotImplemented
+        return Point(self.x + other.x, self.y + other.y, self.z + other.z)
+
+    def __sub__(self, other: Any) -> "Point":
+        if not isinstance(other, Point):
+            return NotImplemented
+        return Point(self.x - other.x, self.y - other.y, self.z - other.z)
+
+    def __mul__(self, other: Any) -> "Point":
+        if not isinstance(other, (float, int)):
+            return NotImplemented
+        return Point(self.x * other, self.y * other, self.z * other)
+
+    __rmul__ = __mul__
+
+    def __iter__(self) -> Iterator[float]:
+        # protocols unpack points into x, y and z
+        return iter((self.x, self.y, self.z))
+
+    def magnitude_to(self, other: "Point") -> float:
+        return math.dist(self, other)
+
+    def as_dict(self) -> Dict[str, float]:
+        return {"x": self.x, "y": self.y, "z": self.z}
+
+
+class Location:
+    """A point, optionally tied to the well or labware it was derived from.
+
+    Unlike opentrons.types.Location this remembers which edge of the well
+    the point was measured from, so commands can be recorded the way the
+    Protocol Engine reports them.
+    """
+
+    def __init__(
+        self,
+        point: Point,
+        labware: Any = None,
+        origin: str = "top",
+        offset: Optional[Point] = None,
+    ) -> None:
+        self.point = point
+        self.labware = labware
+        self.origin = origin
+        self.offset = offset or Point()
+
+    def move(self, point: Point) -> "Location":
+        return Location(
+            self.point + point, self.labware, self.origin, self.offset + point
+        )
+
+    def well_location(self) -> dict:
+        return {"origin": self.origin, "offset": self.offset.as_dict()}
+
+    def __repr__(self) -> str:
+        return f"Location(point={self.point!r}, labware={self.labware!r})"
+
+
+class Mount(enum.Enum):
+    LEFT = "left"
+    RIGHT = "right"
+    EXTENSION = "extension"
+
+    @classmethod
+    def of(cls, mount: Any) -> "Mount":
+        return mount if isinstance(mount, Mount) else cls(str(mount).lower())
+
+
+class APIVersion(NamedTuple):
+    major: int
+    minor: int
+
+    @classmethod
+    def parse(cls, value: str) -> "APIVersion":
+        major, minor = str(value).split(".")[:2]
+        return cls(int(major), int(minor))
+
+    def __str__(self) -> str:
+        return f"{self.major}.{self.minor}"
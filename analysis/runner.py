@@ -0,0 +1,276 @@
+"""Analyze many protocols at once across a pool of worker processes."""
+
+import contextlib
+import functools
+import io
+import json
+import os
+import time
+from collections import Counter
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from analysis.cache import AnalysisCache
+from analysis.discover import Protocol
+from analysis.runs import command_count
+
+if TYPE_CHECKING:
+    from analysis.sandbox import Limits
+
+# statuses an analyzer reports itself, as opposed to a sandbox verdict
+ANALYZED = ("ok", "error")
+
+
+@dataclass
+class AnalysisResult:
+    """What one protocol's analysis produced."""
+
+    protocol: str
+    status: str
+    seconds: float
+    commands: int = 0
+    errors: List[str] = field(default_factory=list)
+    output: str = ""
+    cached: bool = False
+    # failed pre-flight without being analyzed
+    preflight: bool = False
+
+
+def output_path(protocol: Protocol, out_dir: Path) -> Path:
+    """Results mirror the repository layout, so spaces in paths are kept as-is."""
+    return out_dir / f"{protocol.relative}.json"
+
+
+def _opentrons_args(
+    protocol: Protocol, destination: Path, values: Optional[Dict[str, Any]] = None
+) -> List[str]:
+    args = [
+        "--json-output",
+        str(destination),
+        "--log-output",
+        str(destination.with_suffix(".log")),
+        "--log-level",
+        "ERROR",
+        str(protocol.path),
+        *[str(labware) for labware in protocol.labware],
+    ]
+    if protocol.csv_files:
+        files = {name: str(path) for name, path in protocol.csv_files.items()}
+        args[:0] = ["--rtp-files", json.dumps(files)]
+    if values:
+        args[:0] = ["--rtp-values", json.dumps(values)]
+    return args
+
+
+def _summarize(protocol: Protocol, destination: Path, seconds: float) -> AnalysisResult:
+    try:
+        analysis = json.loads(destination.read_text(encoding="utf-8"))
+    except (OSError, ValueError) as error:
+        return AnalysisResult(protocol.relative, "error", seconds, errors=[str(error)])
+    errors = [
+        f"{error.get('errorType')}: {error.get('detail')}"
+        for error in analysis.get("errors", [])
+    ]
+    return AnalysisResult(
+        protocol.relative,
+        "error" if errors else "ok",
+        seconds,
+        command_count(analysis),
+        errors,
+        str(destination),
+    )
+
+
+def analyze_protocol(
+    protocol: Protocol, out_dir: Path, values: Optional[Dict[str, Any]] = None
+) -> AnalysisResult:
+    """Run `opentrons analyze` in this process and summarize its JSON output.
+
+    values override runtime parameter defaults.
+    """
+    from opentrons.cli.analyze import analyze
+
+    destination = output_path(protocol, out_dir)
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    started = time.monotonic()
+    # protocols print freely; keep that out of the runner's own output
+    with contextlib.redirect_stdout(io.StringIO()):
+        try:
+            analyze.main(
+                _opentrons_args(protocol, destination, values), standalone_mode=False
+            )
+        except SystemExit:
+            pass
+        except Exception as error:
+            seconds = time.monotonic() - started
+            return AnalysisResult(
+                protocol.relative, "error", seconds, errors=[repr(error)]
+            )
+    return _summarize(protocol, destination, time.monotonic() - started)
+
+
+def record_protocol(
+    protocol: Protocol,
+    out_dir: Path,
+    values: Optional[Dict[str, Any]] = None,
+    real_time: bool = False,
+) -> AnalysisResult:
+    """Run the protocol against the offline recorder instead of opentrons.
+
+    With real_time, the protocol is told it is not simulating; its clock is
+    still virtual.
+    """
+    from analysis.recorder import record, record_json
+
+    destination = output_path(protocol, out_dir)
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    started = time.monotonic()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if protocol.kind == "json":
+            recording = record_json(protocol.path)
+        else:
+            recording = record(
+                protocol.path, values, protocol.csv_files, protocol.labware, real_time
+            )
+    destination.write_text(json.dumps(recording.as_analysis()), encoding="utf-8")
+    return _summarize(protocol, destination, time.monotonic() - started)
+
+
+ANALYZERS: Dict[str, Callable[..., AnalysisResult]] = {
+    "opentrons": analyze_protocol,
+    "recorder": record_protocol,
+    "recorder-realtime": functools.partial(record_protocol, real_time=True),
+}
+
+
+def _pool(
+    workers: Optional[int], analyzer: str, limits: Optional["Limits"]
+) -> Tuple[Executor, Callable[..., AnalysisResult]]:
+    """Where to analyze the protocols, and how to analyze each one."""
+    if limits is None:
+        return (
+            ProcessPoolExecutor(max_workers=workers or os.cpu_count()),
+            ANALYZERS[analyzer],
+        )
+    from analysis.sandbox import analyze_sandboxed
+
+    # each thread supervises one sandboxed worker process at a time
+    return ThreadPoolExecutor(max_workers=workers or os.cpu_count()), functools.partial(
+        analyze_sandboxed, analyzer=analyzer, limits=limits
+    )
+
+
+def _preflight(
+    protocols: List[Protocol], out_dir: Path, analyzer: str
+) -> Tuple[List[AnalysisResult], List[Protocol]]:
+    """Results for protocols failing pre-flight, and the protocols to analyze."""
+    from analysis.preflight import triaged
+
+    failed: List[AnalysisResult] = []
+    passed: List[Protocol] = []
+    for protocol in protocols:
+        result = triaged(protocol, out_dir, analyzer)
+        if result is None:
+            passed.append(protocol)
+        else:
+            failed.append(result)
+    return failed, passed
+
+
+def _from_cache(
+    protocols: List[Protocol], out_dir: Path, cache: AnalysisCache
+) -> Tuple[List[AnalysisResult], Dict[str, str]]:
+    """Results for cache hits, and the keys of the protocols that missed."""
+    hits: List[AnalysisResult] = []
+    missed: Dict[str, str] = {}
+    for protocol in protocols:
+        key = cache.key(protocol)
+        destination = output_path(protocol, out_dir)
+        if cache.fetch(key, destination):
+            result = _summarize(protocol, destination, 0.0)
+            result.cached = True
+            hits.append(result)
+        else:
+            missed[protocol.relative] = key
+    return hits, missed
+
+
+def run_all(
+    protocols: Iterable[Protocol],
+    out_dir: Path,
+    workers: Optional[int] = None,
+    cache: Optional[AnalysisCache] = None,
+    analyzer: str = "opentrons",
+    limits: Optional["Limits"] = None,
+    preflight: bool = True,
+) -> List[AnalysisResult]:
+    """Analyze every protocol with one worker per core unless told otherwise.
+
+    With a cache, only protocols whose content changed are analyzed. The
+    cache must have been created for the same analyzer and limits. With
+    limits, each protocol runs sandboxed in a process of its own; see
+    sandbox.py. With preflight, protocols that fail its checks are reported
+    without being analyzed; see preflight.py.
+    """
+    protocols = list(protocols)
+    results: List[AnalysisResult] = []
+    missed = {protocol.relative: "" for protocol in protocols}
+    if cache is not None:
+        results, missed = _from_cache(protocols, out_dir, cache)
+    pending = [protocol for protocol in protocols if protocol.relative in missed]
+    if pending and preflight:
+        triaged, pending = _preflight(pending, out_dir, analyzer)
+        results.extend(triaged)
+    if pending:
+        pool, analyze = _pool(workers, analyzer, limits)
+        with pool:
+            analyzed = list(
+                pool.map(analyze, pending, [out_dir] * len(pending), chunksize=1)
+            )
+        results.extend(analyzed)
+    if cache is not None:
+        for result in results:
+            # a protocol stopped by a sandbox limit or failing pre-flight is
+            # analyzed again next run
+            fresh = not (result.cached or result.preflight)
+            if result.output and fresh and result.status in ANALYZED:
+                cache.store(missed[result.protocol], Path(result.output))
+        cache.evict()
+    return sorted(results, key=lambda result: result.protocol)
+
+
+def summary_table(results: List[AnalysisResult]) -> str:
+    """A fixed-width table with one row per protocol and a totals line."""
+    width = max([len(result.protocol) for result in results] + [len("protocol")])
+    lines = [f"{'protocol':<{width}}  {'status':<7}  {'commands':>8}  {'seconds':>7}"]
+    for result in results:
+        lines.append(
+            f"{result.protocol:<{width}}  {result.status:<7}  "
+            f"{result.commands:>8}  {result.seconds:>7.2f}"
+        )
+    failed = len([result for result in results if result.status != "ok"])
+    verdicts = Counter(
+        result.status for result in results if result.status not in ("ok", "error")
+    )
+    stopped = ", ".join(
+        f"{count} {status}" for status, count in sorted(verdicts.items())
+    )
+    lines.append(
+        f"{len(results)} protocols, {failed} with errors"
+        + (f" ({stopped} stopped by limits)" if stopped else "")
+    )
+    return "\n".join(lines)
+
+
+def write_summary(results: List[AnalysisResult], out_dir: Path) -> str:
+    """Write summary.json and summary.txt next to the per-protocol results."""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    (out_dir / "summary.json").write_text(
+        json.dumps([asdict(result) for result in results], indent=2),
+        encoding="utf-8",
+    )
+    table = summary_table(results)
+    (out_dir / "summary.txt").write_text(table + "\n", encoding="utf-8")
+    return table
@@ -0,0 +1,156 @@
+"""Command streams stored as runs of repeated blocks.
+
+Soak tests and loops over racks record the same few commands over and
+over. A RunLog notices a block repeating as commands arrive and keeps it
+once with a count, so a stream is a list of runs: stretches of commands
+seen once (count 1) and blocks repeated count times. The recorder writes
+these runs as "commandRuns" in place of "commands"; readers go through
+analysis_commands, which expands them lazily, or analysis_runs, to work
+on the runs themselves.
+
+A block repeats once its last MAX_PERIOD commands or fewer come round
+twice in a row. The shortest period is taken, so a loop of identical
+delays is one command repeated, not a pair of them.
+"""
+
+import json
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Optional
+
+MAX_PERIOD = 256
+
+
+@dataclass
+class Run:
+    """A block of commands and how many times in a row it runs."""
+
+    block: List[dict]
+    count: int = 1
+
+    def __len__(self) -> int:
+        return len(self.block) * self.count
+
+    def as_dict(self) -> dict:
+        return {"block": self.block, "count": self.count}
+
+
+def _key(command: dict) -> str:
+    return json.dumps(command, sort_keys=True)
+
+
+@dataclass
+class RunLog:
+    """Commands appended one at a time, folded into runs as blocks repeat."""
+
+    max_period: int = MAX_PERIOD
+    runs: List[Run] = field(default_factory=list)
+    # the commands after the last repeat, with their keys and where each key is
+    _tail: List[dict] = field(default_factory=list, repr=False)
+    _keys: List[str] = field(default_factory=list, repr=False)
+    _seen: Dict[str, List[int]] = field(default_factory=dict, repr=False)
+    # while set, the tail is another copy of the last repeat's block so far
+    _matching: List[str] = field(default_factory=list, repr=False)
+
+    def __len__(self) -> int:
+        return sum(len(run) for run in self.runs) + len(self._tail)
+
+    def __iter__(self) -> Iterator[dict]:
+        return expand(self.as_runs())
+
+    def as_runs(self) -> List[Run]:
+        return self.runs + ([Run(list(self._tail))] if self._tail else [])
+
+    @property
+    def last(self) -> Optional[dict]:
+        """The last command, if it is stored on its own and may be changed."""
+        return None if self._matching or not self._tail else self._tail[-1]
+
+    def changed(self) -> None:
+        """Re-key the last command after it was changed in place."""
+        self._seen[self._keys[-1]].pop()
+        self._keys[-1] = _key(self._tail[-1])
+        self._seen.setdefault(self._keys[-1], []).append(len(self._tail) - 1)
+
+    def extend(self, commands: Iterable[dict]) -> None:
+        for command in commands:
+            self.append(command)
+
+    def append(self, command: dict) -> None:
+        key = _key(command)
+        if self._matching:
+            if self._matching[len(self._tail)] == key:
+                self._tail.append(command)
+                if len(self._tail) == len(self._matching):
+                    self.runs[-1].count += 1
+                    self._tail = []
+                return
+            # the repeat ends; what matched so far is an ordinary tail
+            self._keys = self._matching[: len(self._tail)]
+            self._matching, self._seen = [], {}
+            for position, other in enumerate(self._keys):
+                self._seen.setdefault(other, []).append(position)
+        self._tail.append(command)
+        self._keys.append(key)
+        positions = self._seen.setdefault(key, [])
+        positions.append(len(self._tail) - 1)
+        self._fold(positions)
+
+    def _fold(self, positions: List[int]) -> None:
+        """Turn the tail's end into a repeat if it is two copies of a block."""
+        end = len(self._keys)
+        for earlier in reversed(positions[:-1]):
+            period = end - 1 - earlier
+            if period > self.max_period or 2 * period > end:
+                return
+            if (
+                self._keys[end - period :]
+                == self._keys[end - 2 * period : end - period]
+            ):
+                if end > 2 * period:
+                    self.runs.append(Run(self._tail[: end - 2 * period]))
+                self.runs.append(Run(self._tail[end - period :], 2))
+                self._matching = self._keys[end - period :]
+                self._tail, self._keys, self._seen = [], [], {}
+                return
+
+
+def compress(commands: Iterable[dict], max_period: int = MAX_PERIOD) -> List[Run]:
+    """A flat command stream as runs."""
+    log = RunLog(max_period)
+    log.extend(commands)
+    return log.as_runs()
+
+
+def as_runs(commands: Iterable[dict]) -> List[Run]:
+    """The runs a RunLog keeps, or any other stream compressed into runs."""
+    return commands.as_runs() if isinstance(commands, RunLog) else compress(commands)
+
+
+def expand(runs: Iterable[Run]) -> Iterator[dict]:
+    """Every command of the runs, in order, one at a time."""
+    for run in runs:
+        for _ in range(run.count):
+            yield from run.block
+
+
+def analysis_runs(analysis: dict) -> List[Run]:
+    """An analysis file's commands as runs, whichever form it stores them in."""
+    if "commandRuns" in analysis:
+        return [
+            Run(run.get("block", []), run.get("count", 1))
+            for run in analysis["commandRuns"]
+        ]
+    return compress(analysis.get("commands", []))
+
+
+def analysis_commands(analysis: dict) -> Iterable[dict]:
+    """An analysis file's commands, expanded lazily if it stores runs."""
+    if "commandRuns" in analysis:
+        return expand(analysis_runs(analysis))
+    return analysis.get("commands", [])
+
+
+def command_count(analysis: dict) -> int:
+    if "commandRuns" in analysis:
+        return sum(len(run) for run in analysis_runs(analysis))
+    return len(analysis.get("commands", []))
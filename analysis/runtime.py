@@ -0,0 +1,324 @@
+"""Estimate how long a protocol occupies a robot from its command stream.
+
+Each command is given a modeled duration and the durations are summed in
+order. Module temperatures are followed through the stream so waits cost
+the ramp from wherever the module last was. Pauses and manual labware moves
+wait on a person, so they are counted rather than timed.
+"""
+
+import json
+import re
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional
+
+from analysis.profiles import compile_profile
+from analysis.ramps import AMBIENT_CELSIUS, DEFAULT, RampModel
+from analysis.runs import analysis_commands
+
+SHAKE_ACCELERATION_RPM = 500.0
+# gantry travel to a well, a trash or a coordinate, as an average
+MOVE_SECONDS = 2.0
+GRIPPER_MOVE_SECONDS = 16.0
+# commands whose duration does not depend on their parameters
+FIXED_SECONDS: Dict[str, float] = {
+    "home": 15.0,
+    "pickUpTip": 5.0,
+    "dropTip": 4.0,
+    "dropTipInPlace": 2.0,
+    "touchTip": 3.0,
+    "moveToWell": MOVE_SECONDS,
+    "moveToCoordinates": MOVE_SECONDS,
+    "moveToAddressableArea": MOVE_SECONDS,
+    "moveToAddressableAreaForDropTip": MOVE_SECONDS,
+    "liquidProbe": 8.0,
+    "tryLiquidProbe": 8.0,
+    "thermocycler/openLid": 20.0,
+    "thermocycler/closeLid": 20.0,
+    "heaterShaker/openLabwareLatch": 2.0,
+    "heaterShaker/closeLabwareLatch": 2.0,
+    "magneticModule/engage": 4.0,
+    "magneticModule/disengage": 4.0,
+    "absorbanceReader/initialize": 5.0,
+    "absorbanceReader/openLid": 5.0,
+    "absorbanceReader/closeLid": 5.0,
+    "absorbanceReader/read": 15.0,
+}
+# JSON protocol schema v3-v5 names for the same commands
+LEGACY_COMMANDS = {
+    "delay": "waitForDuration",
+    "airGap": "aspirate",
+    "moveToSlot": "moveToCoordinates",
+    "magneticModule/engageMagnet": "magneticModule/engage",
+    "magneticModule/disengageMagnet": "magneticModule/disengage",
+    "temperatureModule/awaitTemperature": "temperatureModule/waitForTemperature",
+    "thermocycler/awaitBlockTemperature": "thermocycler/waitForBlockTemperature",
+    "thermocycler/awaitLidTemperature": "thermocycler/waitForLidTemperature",
+    "thermocycler/awaitProfileComplete": "comment",
+}
+# delays from protocols below API 2.14, which analysis reports as custom commands
+LEGACY_DELAY = re.compile(r"(\d+(?:\.\d+)?) minutes and (\d+(?:\.\d+)?) seconds")
+
+
+@dataclass
+class Step:
+    """One command's modeled duration and when it would start."""
+
+    index: int
+    command_type: str
+    seconds: float
+    start: float
+
+
+@dataclass
+class Estimate:
+    """The modeled runtime of one protocol."""
+
+    protocol: str
+    seconds: float = 0.0
+    pauses: int = 0
+    steps: List[Step] = field(default_factory=list)
+
+    def by_type(self) -> Dict[str, float]:
+        """Total seconds per command type, longest first."""
+        totals: Dict[str, float] = {}
+        for step in self.steps:
+            totals[step.command_type] = totals.get(step.command_type, 0) + step.seconds
+        return dict(sorted(totals.items(), key=lambda item: -item[1]))
+
+
+class Estimator:
+    """Walks one command stream, keeping the module state durations depend on."""
+
+    def __init__(self, ramps: RampModel = DEFAULT) -> None:
+        self.ramps = ramps
+        self.temperatures: Dict[str, float] = {}
+        self.targets: Dict[str, float] = {}
+        self.holds: Dict[str, float] = {}
+        # microliters in each block, which slow its ramps
+        self.volumes: Dict[str, float] = {}
+        self.speeds: Dict[str, float] = {}
+        self.models: Dict[str, str] = {}
+        self.pauses = 0
+        self.handlers: Dict[str, Callable[[dict], float]] = {
+            "aspirate": self._liquid,
+            "dispense": self._liquid,
+            "airGapInPlace": self._liquid,
+            "aspirateInPlace": self._liquid,
+            "dispenseInPlace": self._liquid,
+            "blowout": self._blowout,
+            "blowOutInPlace": self._blowout,
+            "waitForDuration": self._delay,
+            "waitForResume": self._pause,
+            "custom": self._custom,
+            "moveLabware": self._move_labware,
+            "loadModule": self._load_module,
+            "thermocycler/setTargetBlockTemperature": self._set_block,
+            "thermocycler/waitForBlockTemperature": self._wait_block,
+            "thermocycler/setTargetLidTemperature": self._set_lid,
+            "thermocycler/waitForLidTemperature": self._wait_lid,
+            "thermocycler/runProfile": self._run_profile,
+            "temperatureModule/setTargetTemperature": self._set_target,
+            "temperatureModule/waitForTemperature": self._wait_module,
+            "heaterShaker/setTargetTemperature": self._set_target,
+            "heaterShaker/waitForTemperature": self._wait_module,
+            "heaterShaker/setAndWaitForShakeSpeed": self._shake,
+            "heaterShaker/deactivateShaker": self._stop_shaking,
+        }
+
+    def seconds(self, command_type: str, params: dict) -> float:
+        handler = self.handlers.get(command_type)
+        if handler is not None:
+            return handler(params)
+        return FIXED_SECONDS.get(command_type, 0.0)
+
+    def _liquid(self, params: dict) -> float:
+        flow_rate = params.get("flowRate") or 0
+        plunger = float(params.get("volume") or 0) / flow_rate if flow_rate else 0.0
+        return plunger + self._travel(params)
+
+    def _blowout(self, params: dict) -> float:
+        return 1.0 + self._travel(params)
+
+    @staticmethod
+    def _travel(params: dict) -> float:
+        moves = ("wellName", "well", "addressableAreaName", "position")
+        return MOVE_SECONDS if any(key in params for key in moves) else 0.0
+
+    def _delay(self, params: dict) -> float:
+        if params.get("wait") is True:
+            return self._pause(params)
+        return float(params.get("seconds", params.get("wait", 0)) or 0)
+
+    def _pause(self, params: dict) -> float:
+        self.pauses += 1
+        return 0.0
+
+    def _custom(self, params: dict) -> float:
+        if params.get("legacyCommandType") != "command.DELAY":
+            return 0.0
+        found = LEGACY_DELAY.search(params.get("legacyCommandText", ""))
+        return float(found.group(1)) * 60 + float(found.group(2)) if found else 0.0
+
+    def _load_module(self, params: dict) -> float:
+        self.models[self._module(params)] = str(params.get("model"))
+        return 0.0
+
+    def _move_labware(self, params: dict) -> float:
+        if params.get("strategy") == "usingGripper":
+            return GRIPPER_MOVE_SECONDS
+        return self._pause(params)
+
+    @staticmethod
+    def _module(params: dict) -> str:
+        return str(params.get("moduleId", params.get("module")))
+
+    def _set(self, key: str, params: dict) -> float:
+        celsius = params.get("celsius", params.get("temperature"))
+        self.targets[key] = float(celsius if celsius is not None else AMBIENT_CELSIUS)
+        self.holds[key] = float(params.get("holdTimeSeconds") or 0)
+        self.volumes[key] = float(params.get("blockMaxVolumeUl") or 0)
+        return 0.0
+
+    def _wait(self, key: str, rates: str, celsius: Optional[float] = None) -> float:
+        target = celsius if celsius is not None else self.targets.get(key)
+        if target is None:
+            return 0.0
+        seconds = self.ramps.seconds(
+            rates,
+            self.temperatures.get(key, AMBIENT_CELSIUS),
+            target,
+            self.volumes.get(key, 0.0),
+        )
+        self.temperatures[key] = target
+        return seconds + self.holds.pop(key, 0.0)
+
+    def _set_block(self, params: dict) -> float:
+        return self._set(self._module(params), params)
+
+    def _wait_block(self, params: dict) -> float:
+        return self._wait(self._module(params), "thermocycler/block")
+
+    def _set_lid(self, params: dict) -> float:
+        return self._set(self._module(params) + "/lid", params)
+
+    def _wait_lid(self, params: dict) -> float:
+        return self._wait(self._module(params) + "/lid", "thermocycler/lid")
+
+    def _run_profile(self, params: dict) -> float:
+        key = self._module(params)
+        # compiled once per distinct profile, and costed without expanding cycles
+        profile = compile_profile(params)
+        start = self.temperatures.get(key, AMBIENT_CELSIUS)
+        if profile.end is None:
+            return 0.0
+        self.temperatures[key] = profile.end
+        return profile.seconds(start, self.ramps) + self.holds.pop(key, 0.0)
+
+    def _set_target(self, params: dict) -> float:
+        return self._set(self._module(params), params)
+
+    def _wait_module(self, params: dict) -> float:
+        key = self._module(params)
+        model = self.models.get(key, "")
+        prefix = (
+            "heaterShaker" if model.startswith("heaterShaker") else "temperatureModule"
+        )
+        return self._wait(key, prefix, params.get("celsius", params.get("temperature")))
+
+    def _shake(self, params: dict) -> float:
+        key = self._module(params)
+        rpm = float(params.get("rpm", 0))
+        seconds = abs(rpm - self.speeds.get(key, 0)) / SHAKE_ACCELERATION_RPM
+        self.speeds[key] = rpm
+        return seconds
+
+    def _stop_shaking(self, params: dict) -> float:
+        return self._shake({**params, "rpm": 0})
+
+
+def estimate(
+    protocol: str, commands: Iterable[dict], ramps: RampModel = DEFAULT
+) -> Estimate:
+    """Sum modeled durations over a command stream in the order it runs."""
+    estimator = Estimator(ramps)
+    result = Estimate(protocol)
+    for index, command in enumerate(commands):
+        command_type = command.get("commandType") or command.get("command", "")
+        command_type = LEGACY_COMMANDS.get(command_type, command_type)
+        seconds = estimator.seconds(command_type, command.get("params") or {})
+        result.steps.append(Step(index, command_type, seconds, result.seconds))
+        result.seconds += seconds
+    result.pauses = estimator.pauses
+    return result
+
+
+def estimate_analysis(
+    protocol: str, analysis: Path, ramps: RampModel = DEFAULT
+) -> Estimate:
+    """Estimate from an analysis JSON file written by either analyzer."""
+    commands = analysis_commands(json.loads(analysis.read_text(encoding="utf-8")))
+    return estimate(protocol, commands, ramps)
+
+
+def duration(seconds: float) -> str:
+    """Seconds as h:mm:ss."""
+    minutes, secs = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{secs:02d}"
+
+
+def runtime_table(estimates: List[Estimate]) -> str:
+    """Protocols longest first, with their pauses and where the time goes."""
+    width = max([len(e.protocol) for e in estimates] + [len("protocol")])
+    lines = [f"{'protocol':<{width}}  {'runtime':>9}  {'pauses':>6}  longest steps"]
+    for result in sorted(estimates, key=lambda e: -e.seconds):
+        longest = ", ".join(
+            f"{command_type} {duration(seconds)}"
+            for command_type, seconds in list(result.by_type().items())[:3]
+            if seconds
+        )
+        lines.append(
+            f"{result.protocol:<{width}}  {duration(result.seconds):>9}  "
+            f"{result.pauses:>6}  {longest}"
+        )
+    total = sum(result.seconds for result in estimates)
+    lines.append(f"{len(estimates)} protocols, {duration(total)} in total")
+    return "\n".join(lines)
+
+
+def write_runtimes(estimates: List[Estimate], out_dir: Path) -> str:
+    """Write each protocol's steps beside its analysis, then runtime.json/.txt."""
+    for result in estimates:
+        steps = out_dir / f"{result.protocol}.runtime.json"
+        steps.write_text(
+            json.dumps([asdict(step) for step in result.steps]), encoding="utf-8"
+        )
+    (out_dir / "runtime.json").write_text(
+        json.dumps(
+            [
+                {
+                    "protocol": result.protocol,
+                    "seconds": result.seconds,
+                    "pauses": result.pauses,
+                    "byType": result.by_type(),
+                }
+                for result in estimates
+            ],
+            indent=2,
+        ),
+        encoding="utf-8",
+    )
+    table = runtime_table(estimates)
+    (out_dir / "runtime.txt").write_text(table + "\n", encoding="utf-8")
+    return table
+
+
+def estimate_results(out_dir: Path, ramps: RampModel = DEFAULT) -> List[Estimate]:
+    """Estimates for every protocol in a results directory's summary.json."""
+    summary = json.loads((out_dir / "summary.json").read_text(encoding="utf-8"))
+    return [
+        estimate_analysis(result["protocol"], Path(result["output"]), ramps)
+        for result in summary
+        if result["status"] == "ok" and result["output"]
+    ]
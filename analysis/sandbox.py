@@ -0,0 +1,157 @@
+"""Analyze each protocol in a process of its own, under enforced limits.
+
+Every protocol gets a fresh worker process, so nothing one protocol leaks
+reaches the next. The worker's address space and CPU seconds are capped
+with setrlimit; address space is the closest limit to resident memory that
+Linux enforces. The supervising thread kills the worker's whole process
+group, and anything the protocol shelled out to, at a wall-clock deadline.
+Sockets refuse to resolve names or connect unless the network is allowed.
+
+A protocol stopped by a limit gets a verdict as its status instead of ok or
+error:
+
+- timeout: the wall-clock deadline passed or the CPU limit ran out
+- oom: an allocation failed under the memory limit
+- network: the protocol tried to reach the network
+"""
+
+import contextlib
+import multiprocessing
+import os
+import resource
+import signal
+import socket
+import time
+from dataclasses import dataclass
+from multiprocessing.connection import Connection
+from pathlib import Path
+from typing import Any, Callable, List
+
+from analysis.discover import Protocol
+from analysis.runner import ANALYZERS, AnalysisResult
+
+TIMEOUT = "timeout"
+OOM = "oom"
+NETWORK = "network"
+# workers fork from a server that has already imported the analyzers
+PRELOAD = ["analysis.runner", "analysis.recorder"]
+
+
+@dataclass
+class Limits:
+    """What one protocol's analysis may use."""
+
+    memory_mb: int = 4096
+    cpu_seconds: int = 120
+    wall_seconds: float = 300.0
+    network: bool = False
+
+
+class NetworkDisabled(OSError):
+    """Raised by sockets in a worker without network access."""
+
+
+def _disable_network(attempts: List[str]) -> None:
+    """Make name lookups and internet connections fail, noting each attempt."""
+
+    def refuse(target: Any) -> None:
+        attempts.append(str(target))
+        raise NetworkDisabled(f"network access is disabled: {target}")
+
+    def getaddrinfo(host: Any, port: Any, *args: Any, **kwargs: Any) -> Any:
+        refuse(f"{host}:{port}")
+
+    connect = socket.socket.connect
+    connect_ex = socket.socket.connect_ex
+
+    def guarded(original: Callable[..., Any]) -> Callable[..., Any]:
+        def call(self: socket.socket, address: Any) -> Any:
+            if self.family in (socket.AF_INET, socket.AF_INET6):
+                refuse(address)
+            return original(self, address)
+
+        return call
+
+    socket.getaddrinfo = getaddrinfo  # type: ignore[assignment]
+    socket.socket.connect = guarded(connect)  # type: ignore[method-assign]
+    socket.socket.connect_ex = guarded(connect_ex)  # type: ignore[method-assign]
+
+
+def _verdict(result: AnalysisResult, attempts: List[str]) -> AnalysisResult:
+    if attempts:
+        result.status = NETWORK
+        result.errors = [f"NetworkDisabled: {attempt}" for attempt in attempts] + [
+            error for error in result.errors if "NetworkDisabled" not in error
+        ]
+    elif any(error.startswith("MemoryError") for error in result.errors):
+        result.status = OOM
+    return result
+
+
+def _worker(
+    analyzer: str, protocol: Protocol, out_dir: Path, limits: Limits, sender: Connection
+) -> None:
+    os.setpgrp()
+    memory = limits.memory_mb * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+    # past the soft limit SIGXCPU ends the worker; the hard limit is a backstop
+    resource.setrlimit(
+        resource.RLIMIT_CPU, (limits.cpu_seconds, limits.cpu_seconds + 1)
+    )
+    attempts: List[str] = []
+    if not limits.network:
+        _disable_network(attempts)
+    started = time.monotonic()
+    try:
+        result = ANALYZERS[analyzer](protocol, out_dir)
+    except MemoryError:
+        result = AnalysisResult(protocol.relative, OOM, time.monotonic() - started)
+        result.errors = ["MemoryError: the memory limit was reached"]
+    sender.send(_verdict(result, attempts))
+
+
+def _exited(protocol: Protocol, exitcode: int, seconds: float) -> AnalysisResult:
+    """The result for a worker that died without sending one."""
+    if exitcode == -signal.SIGXCPU:
+        return AnalysisResult(
+            protocol.relative, TIMEOUT, seconds, errors=["the CPU limit was reached"]
+        )
+    return AnalysisResult(
+        protocol.relative,
+        "error",
+        seconds,
+        errors=[f"the worker exited with code {exitcode}"],
+    )
+
+
+def analyze_sandboxed(
+    protocol: Protocol, out_dir: Path, analyzer: str, limits: Limits
+) -> AnalysisResult:
+    """Analyze one protocol in a new worker process and wait for it within limits."""
+    context = multiprocessing.get_context("forkserver")
+    context.set_forkserver_preload(PRELOAD)
+    receiver, sender = context.Pipe(duplex=False)
+    worker = context.Process(
+        target=_worker, args=(analyzer, protocol, out_dir, limits, sender)
+    )
+    started = time.monotonic()
+    worker.start()
+    sender.close()
+    try:
+        if receiver.poll(limits.wall_seconds):
+            return receiver.recv()
+        return AnalysisResult(
+            protocol.relative,
+            TIMEOUT,
+            time.monotonic() - started,
+            errors=[f"the {limits.wall_seconds:g} s wall-clock limit was reached"],
+        )
+    except EOFError:
+        worker.join()
+        return _exited(protocol, worker.exitcode or 0, time.monotonic() - started)
+    finally:
+        receiver.close()
+        # the worker and whatever it left running in the background
+        with contextlib.suppress(ProcessLookupError):
+            os.killpg(worker.pid, signal.SIGKILL)
+        worker.join()
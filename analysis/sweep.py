@@ -0,0 +1,353 @@
+"""Analyze protocols across combinations of their runtime parameter values.
+
+Each parameter contributes the values worth trying: every declared choice,
+both booleans, or a range's minimum, default and maximum. Combinations are
+either the full product of those or a smaller set that still covers every
+pair of values. Combinations that produce the same command stream are
+grouped, and only one analysis per distinct stream is kept.
+"""
+
+import hashlib
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field, replace
+from itertools import combinations, product
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from analysis import extract, runner
+from analysis.discover import Protocol
+from analysis.runs import Run, analysis_runs
+
+MODES = ("product", "pairwise")
+# protocols with more combinations than this are swept pairwise instead
+DEFAULT_LIMIT = 256
+
+Values = Dict[str, Any]
+Pair = Tuple[int, Any, int, Any]
+
+
+def candidates(definition: dict) -> List[Any]:
+    """The values of one parameter worth analyzing, default first."""
+    default = definition.get("default")
+    if definition.get("choices"):
+        values = [choice["value"] for choice in definition["choices"]]
+    elif definition["type"] == "bool":
+        values = [False, True]
+    else:
+        values = [definition.get("min"), definition.get("max")]
+    ordered = [default]
+    for value in values:
+        if value is not None and value not in ordered:
+            ordered.append(value)
+    return ordered
+
+
+def _space(definitions: Iterable[dict]) -> Tuple[List[str], List[List[Any]]]:
+    """Swept parameter names and their candidates; CSV files are not swept."""
+    swept = [d for d in definitions if d["type"] != "csv_file"]
+    return [d["variableName"] for d in swept], [candidates(d) for d in swept]
+
+
+def cartesian(definitions: Iterable[dict]) -> List[Values]:
+    names, choices = _space(definitions)
+    return [dict(zip(names, values)) for values in product(*choices)]
+
+
+def _uncovered(choices: List[List[Any]]) -> Set[Pair]:
+    return {
+        (i, a, j, b)
+        for i, j in combinations(range(len(choices)), 2)
+        for a in choices[i]
+        for b in choices[j]
+    }
+
+
+def _covers(row: List[Any], column: int, value: Any, uncovered: Set[Pair]) -> int:
+    """How many uncovered pairs setting row[column] to value would cover."""
+    return sum((i, row[i], column, value) in uncovered for i in range(column))
+
+
+def pairwise(definitions: Iterable[dict]) -> List[Values]:
+    """Combinations covering every pair of values of every two parameters.
+
+    Greedy and deterministic: each new combination starts from the first
+    pair not yet covered and fills the remaining parameters with whichever
+    value covers the most uncovered pairs, defaults winning ties.
+    """
+    names, choices = _space(definitions)
+    if len(names) < 2:
+        return cartesian(definitions)
+    uncovered = _uncovered(choices)
+    rows: List[Values] = []
+    while uncovered:
+        first, a, second, b = min(
+            uncovered,
+            key=lambda p: (
+                p[0],
+                choices[p[0]].index(p[1]),
+                p[2],
+                choices[p[2]].index(p[3]),
+            ),
+        )
+        row: List[Any] = []
+        for column, values in enumerate(choices):
+            if column in (first, second):
+                row.append(a if column == first else b)
+                continue
+            row.append(max(values, key=lambda v: _covers(row, column, v, uncovered)))
+        uncovered -= {
+            (i, row[i], j, row[j]) for i, j in combinations(range(len(row)), 2)
+        }
+        rows.append(dict(zip(names, row)))
+    return rows
+
+
+def plan(
+    definitions: List[dict], mode: str, limit: int = DEFAULT_LIMIT
+) -> Tuple[str, List[Values]]:
+    """The mode actually used and its combinations."""
+    if mode == "product":
+        rows = cartesian(definitions)
+        if len(rows) <= limit:
+            return mode, rows
+    return "pairwise", pairwise(definitions)
+
+
+# load commands, the id each one creates and the param describing what it loads
+LOADS = {
+    "loadLabware": ("labwareId", "loadName"),
+    "loadModule": ("moduleId", "model"),
+    "loadPipette": ("pipetteId", "pipetteName"),
+}
+
+
+def _renumber(value: Any, ids: Dict[str, str], key: str = "") -> Any:
+    if isinstance(value, dict):
+        return {k: _renumber(v, ids, k) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_renumber(v, ids, key) for v in value]
+    if key.endswith("Id") and isinstance(value, str):
+        return ids.setdefault(value, f"#{len(ids)}")
+    return value
+
+
+def _name_load(command: dict, ids: Dict[str, str]) -> None:
+    """Name the id a load command creates after what it loads and where.
+
+    Then inserting one load early in a protocol does not shift the names
+    of everything loaded after it.
+    """
+    id_key, what = LOADS.get(command.get("commandType", ""), ("", ""))
+    params = command.get("params", {})
+    created = params.get(id_key) or command.get("result", {}).get(id_key)
+    if not created or created in ids:
+        return
+    where = _renumber(params.get("location", params.get("mount")), ids)
+    if isinstance(where, dict) and len(where) == 1:
+        where = next(iter(where.values()))
+    name = f"{params.get(what)}@{where}"
+    taken = set(ids.values())
+    ids[created] = name
+    # the same labware loaded into the same place again, after moving the first away
+    for copy in itertools.count(2):
+        if ids[created] not in taken:
+            break
+        ids[created] = f"{name}#{copy}"
+
+
+def normalized(commands: Iterable[dict]) -> Iterator[dict]:
+    """Commands reduced to what they do, with ids replaced by stable names.
+
+    opentrons gives labware, pipettes and modules random ids, so two runs of
+    the same protocol only compare equal once those are renamed. Loaded
+    equipment is named after its load command; other ids are numbered by
+    first appearance.
+    """
+    return _normalized(commands, {})
+
+
+def _normalized(commands: Iterable[dict], ids: Dict[str, str]) -> Iterator[dict]:
+    for command in commands:
+        _name_load(command, ids)
+        yield {
+            "commandType": command.get("commandType"),
+            "params": _renumber(command.get("params", {}), ids),
+        }
+
+
+def normalized_runs(runs: Iterable[Run]) -> Iterator[Run]:
+    """Runs with their blocks normalized, each block once however often it repeats.
+
+    Every id in a block is named by the end of its first copy, so the
+    copies after it normalize exactly as it did.
+    """
+    ids: Dict[str, str] = {}
+    for run in runs:
+        yield Run(list(_normalized(run.block, ids)), run.count)
+
+
+def stream_digest(runs: Iterable[Run]) -> str:
+    """SHA-256 of the normalized command stream, hashing each repeat once."""
+    digest = hashlib.sha256()
+    for run in normalized_runs(runs):
+        digest.update(json.dumps(run.as_dict(), sort_keys=True).encode())
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+def combination_id(values: Values) -> str:
+    return hashlib.sha256(json.dumps(values, sort_keys=True).encode()).hexdigest()[:12]
+
+
+@dataclass
+class Trial:
+    """One combination of one protocol, analyzed."""
+
+    values: Values
+    status: str
+    commands: int
+    digest: str
+    output: str
+    errors: List[str] = field(default_factory=list)
+
+
+def _trial(protocol: Protocol, values: Values, out_dir: Path, analyzer: str) -> Trial:
+    """Analyze one combination; runs in a worker process."""
+    # results land at <out_dir>/<protocol>/<combination>.json
+    variant = replace(
+        protocol, relative=f"{protocol.relative}/{combination_id(values)}"
+    )
+    result = runner.ANALYZERS[analyzer](variant, out_dir, values)
+    digest = ""
+    if result.output:
+        analysis = json.loads(Path(result.output).read_text(encoding="utf-8"))
+        digest = stream_digest(analysis_runs(analysis))
+    return Trial(
+        values, result.status, result.commands, digest, result.output, result.errors
+    )
+
+
+@dataclass
+class SweepReport:
+    """Every combination tried for one protocol, grouped by command stream."""
+
+    protocol: str
+    mode: str
+    parameters: List[str]
+    trials: List[Trial] = field(default_factory=list)
+
+    @property
+    def streams(self) -> Dict[str, List[Trial]]:
+        """Trials by the digest of the commands they produced."""
+        groups: Dict[str, List[Trial]] = {}
+        for trial in self.trials:
+            groups.setdefault(trial.digest or f"error:{trial.errors}", []).append(trial)
+        return groups
+
+    @property
+    def failed(self) -> List[Trial]:
+        return [trial for trial in self.trials if trial.status != "ok"]
+
+    def as_dict(self) -> dict:
+        return {
+            "protocol": self.protocol,
+            "mode": self.mode,
+            "parameters": self.parameters,
+            "combinations": len(self.trials),
+            "streams": [
+                {
+                    "digest": digest,
+                    "output": trials[0].output,
+                    "status": trials[0].status,
+                    "commands": trials[0].commands,
+                    "errors": trials[0].errors,
+                    "values": [trial.values for trial in trials],
+                }
+                for digest, trials in self.streams.items()
+            ],
+        }
+
+
+def _deduplicate(report: SweepReport) -> None:
+    """Keep one analysis file per distinct stream."""
+    for trials in report.streams.values():
+        for trial in trials[1:]:
+            if trial.output and trial.output != trials[0].output:
+                os.remove(trial.output)
+                trial.output = trials[0].output
+
+
+def sweep(
+    protocols: Iterable[Protocol],
+    out_dir: Path,
+    mode: str = "pairwise",
+    limit: int = DEFAULT_LIMIT,
+    workers: Optional[int] = None,
+    analyzer: str = "opentrons",
+) -> List[SweepReport]:
+    """Analyze every parameter combination of every protocol that declares any.
+
+    All combinations of all protocols share one process pool.
+    """
+    reports: List[SweepReport] = []
+    jobs: List[Tuple[SweepReport, Protocol, Values]] = []
+    for protocol in protocols:
+        if protocol.kind != "python":
+            continue
+        definitions = extract.extract(protocol).parameters
+        names, _ = _space(definitions)
+        if not names:
+            continue
+        used, rows = plan(definitions, mode, limit)
+        report = SweepReport(protocol.relative, used, names)
+        reports.append(report)
+        jobs.extend((report, protocol, values) for values in rows)
+    if jobs:
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+            trials = pool.map(
+                _trial,
+                [protocol for _, protocol, _ in jobs],
+                [values for _, _, values in jobs],
+                [out_dir] * len(jobs),
+                [analyzer] * len(jobs),
+                chunksize=1,
+            )
+            for (report, _, _), trial in zip(jobs, trials):
+                report.trials.append(trial)
+    for report in reports:
+        _deduplicate(report)
+    return reports
+
+
+def sweep_table(reports: List[SweepReport]) -> str:
+    width = max([len(report.protocol) for report in reports] + [len("protocol")])
+    lines = [
+        f"{'protocol':<{width}}  {'mode':<8}  {'params':>6}  {'combos':>6}  "
+        f"{'streams':>7}  {'errors':>6}"
+    ]
+    for report in reports:
+        lines.append(
+            f"{report.protocol:<{width}}  {report.mode:<8}  {len(report.parameters):>6}  "
+            f"{len(report.trials):>6}  {len(report.streams):>7}  {len(report.failed):>6}"
+        )
+    combos = sum(len(report.trials) for report in reports)
+    streams = sum(len(report.streams) for report in reports)
+    lines.append(
+        f"{len(reports)} protocols, {combos} combinations, {streams} distinct command streams"
+    )
+    return "\n".join(lines)
+
+
+def write_sweep(reports: List[SweepReport], out_dir: Path) -> str:
+    """sweep.json and sweep.txt in out_dir."""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    (out_dir / "sweep.json").write_text(
+        json.dumps([report.as_dict() for report in reports], indent=2),
+        encoding="utf-8",
+    )
+    table = sweep_table(reports)
+    (out_dir / "sweep.txt").write_text(table + "\n", encoding="utf-8")
+    return table
@@ -0,0 +1,313 @@
+"""Overlap module activity with the robot's own, as a discrete-event timeline.
+
+The robot (pipettes and gripper, which share the gantry) works through
+commands one after another. Setting a module's target temperature starts
+that module ramping on its own timeline and returns at once; the robot
+only waits when it reaches the matching wait command, and then only for
+whatever is left of the ramp and hold. Thermocycler profiles and shake
+spin-up keep the robot waiting for their whole length.
+
+Following what each robot step waited on, back from the last thing to
+finish, gives the critical path. Time the robot spends blocked on a module
+is time a protocol could win back by starting that module earlier.
+"""
+
+import json
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional
+
+from analysis.ramps import DEFAULT, RampModel
+from analysis.runs import analysis_commands
+from analysis.runtime import (
+    AMBIENT_CELSIUS,
+    LEGACY_COMMANDS,
+    Estimator,
+    duration,
+    estimate,
+)
+
+ROBOT = "robot"
+# target commands: the timeline they act on, after the module's, and its ramp rates
+TARGETS = {
+    "thermocycler/setTargetBlockTemperature": ("", "thermocycler/block"),
+    "thermocycler/setTargetLidTemperature": ("/lid", "thermocycler/lid"),
+    "temperatureModule/setTargetTemperature": ("", "temperatureModule"),
+    "heaterShaker/setTargetTemperature": ("", "heaterShaker"),
+}
+WAITS = {
+    "thermocycler/waitForBlockTemperature": "",
+    "thermocycler/waitForLidTemperature": "/lid",
+    "temperatureModule/waitForTemperature": "",
+    "heaterShaker/waitForTemperature": "",
+}
+# commands that keep the module and the robot busy together
+BLOCKING = ("thermocycler/runProfile", "heaterShaker/setAndWaitForShakeSpeed")
+
+
+@dataclass
+class Activity:
+    """One span of work on one timeline, and what it had to wait for."""
+
+    resource: str
+    index: int
+    command_type: str
+    start: float
+    end: float
+    after: Optional[int] = None
+
+    @property
+    def seconds(self) -> float:
+        return self.end - self.start
+
+
+@dataclass
+class Timeline:
+    """Every timeline of one protocol, overlapped."""
+
+    protocol: str
+    sequential: float = 0.0
+    activities: List[Activity] = field(default_factory=list)
+    blocked: Dict[str, float] = field(default_factory=dict)
+    critical: List[int] = field(default_factory=list)
+
+    @property
+    def seconds(self) -> float:
+        return max((activity.end for activity in self.activities), default=0.0)
+
+    def busy(self) -> Dict[str, float]:
+        """Seconds each timeline spends working."""
+        totals: Dict[str, float] = {}
+        for activity in self.activities:
+            totals[activity.resource] = (
+                totals.get(activity.resource, 0.0) + activity.seconds
+            )
+        return totals
+
+    def critical_by_resource(self) -> Dict[str, float]:
+        """Seconds of the critical path spent on each timeline."""
+        totals: Dict[str, float] = {}
+        for position in self.critical:
+            activity = self.activities[position]
+            totals[activity.resource] = (
+                totals.get(activity.resource, 0.0) + activity.seconds
+            )
+        return totals
+
+
+class Scheduler:
+    """Places each command on the robot's timeline or a module's.
+
+    Durations come from the runtime Estimator, which also keeps module
+    temperatures, so both models agree on how long everything takes.
+    """
+
+    def __init__(self, timeline: Timeline, ramps: RampModel = DEFAULT) -> None:
+        self.timeline = timeline
+        self.estimator = Estimator(ramps)
+        self.now = 0.0
+        self.last: Optional[int] = None
+        self.names: Dict[str, str] = {}
+        # the activity each module timeline is busy with last
+        self.ready: Dict[str, int] = {}
+        self.handlers: Dict[str, Callable[[int, str, dict], None]] = {
+            "loadModule": self._load_module,
+            **{command_type: self._set for command_type in TARGETS},
+            **{command_type: self._wait for command_type in WAITS},
+            **{command_type: self._block for command_type in BLOCKING},
+        }
+
+    def command(self, index: int, command_type: str, params: dict) -> None:
+        command_type = LEGACY_COMMANDS.get(command_type, command_type)
+        handler = self.handlers.get(command_type, self._robot)
+        handler(index, command_type, params)
+
+    def _add(self, activity: Activity) -> int:
+        self.timeline.activities.append(activity)
+        return len(self.timeline.activities) - 1
+
+    def _robot(self, index: int, command_type: str, params: dict) -> None:
+        seconds = self.estimator.seconds(command_type, params)
+        if seconds > 0:
+            start = self.now
+            self.now += seconds
+            self.last = self._add(
+                Activity(ROBOT, index, command_type, start, self.now, self.last)
+            )
+
+    def _module(self, params: dict, suffix: str = "") -> str:
+        module_id = str(params.get("moduleId", params.get("module")))
+        return self.names.get(module_id, module_id) + suffix
+
+    def _load_module(self, index: int, command_type: str, params: dict) -> None:
+        self.estimator.seconds(command_type, params)
+        location = params.get("location") or {}
+        slot = location.get("slotName", "") if isinstance(location, dict) else location
+        name = f"{params.get('model')} {slot}".strip()
+        self.names[str(params.get("moduleId", params.get("module")))] = name
+
+    def _set(self, index: int, command_type: str, params: dict) -> None:
+        suffix, rates = TARGETS[command_type]
+        resource = self._module(params, suffix)
+        # the Estimator keys temperatures by module id, with the same suffix
+        key = str(params.get("moduleId", params.get("module"))) + suffix
+        before = self.estimator.temperatures.get(key, AMBIENT_CELSIUS)
+        self.estimator.seconds(command_type, params)
+        target = self.estimator.targets[key]
+        self.estimator.temperatures[key] = target
+        # a hold starts once the target is reached, so the module stays busy through it
+        hold = self.estimator.holds.pop(key, 0.0)
+        start, after = self.now, self.last
+        # a module still ramping to an earlier target starts from there once done
+        busy = self.ready.get(resource)
+        if busy is not None and self.timeline.activities[busy].end > start:
+            start, after = self.timeline.activities[busy].end, busy
+        volume = self.estimator.volumes.get(key, 0.0)
+        end = start + self.estimator.ramps.seconds(rates, before, target, volume) + hold
+        self.ready[resource] = self._add(
+            Activity(resource, index, command_type, start, end, after)
+        )
+
+    def _wait(self, index: int, command_type: str, params: dict) -> None:
+        resource = self._module(params, WAITS[command_type])
+        busy = self.ready.get(resource)
+        if busy is None:
+            # waiting for a temperature that was never set: nothing to overlap
+            self._robot(index, command_type, params)
+            return
+        ready = self.timeline.activities[busy].end
+        if ready > self.now:
+            # the robot sits idle, and the module is what the run waits on
+            self.timeline.blocked[resource] = (
+                self.timeline.blocked.get(resource, 0.0) + ready - self.now
+            )
+            self.now, self.last = ready, busy
+
+    def _block(self, index: int, command_type: str, params: dict) -> None:
+        resource = self._module(params)
+        seconds = self.estimator.seconds(command_type, params)
+        if seconds <= 0:
+            return
+        start = self.now
+        self.now += seconds
+        module = self._add(
+            Activity(resource, index, command_type, start, self.now, self.last)
+        )
+        self.ready[resource] = module
+        self.timeline.blocked[resource] = (
+            self.timeline.blocked.get(resource, 0.0) + seconds
+        )
+        self.last = module
+
+
+def _critical(timeline: Timeline) -> List[int]:
+    """The chain of activities, each waiting on the last, ending the run."""
+    if not timeline.activities:
+        return []
+    position: Optional[int] = max(
+        range(len(timeline.activities)),
+        key=lambda p: (timeline.activities[p].end, p),
+    )
+    chain = []
+    while position is not None:
+        chain.append(position)
+        position = timeline.activities[position].after
+    return chain[::-1]
+
+
+def schedule(
+    protocol: str, commands: Iterable[dict], ramps: RampModel = DEFAULT
+) -> Timeline:
+    """Lay a command stream out on the robot's and each module's timeline."""
+    commands = list(commands)
+    timeline = Timeline(protocol, estimate(protocol, commands, ramps).seconds)
+    scheduler = Scheduler(timeline, ramps)
+    for index, command in enumerate(commands):
+        scheduler.command(
+            index,
+            command.get("commandType") or command.get("command", ""),
+            command.get("params") or {},
+        )
+    timeline.critical = _critical(timeline)
+    return timeline
+
+
+def schedule_analysis(
+    protocol: str, analysis: Path, ramps: RampModel = DEFAULT
+) -> Timeline:
+    """The timeline from an analysis JSON file written by either analyzer."""
+    commands = analysis_commands(json.loads(analysis.read_text(encoding="utf-8")))
+    return schedule(protocol, commands, ramps)
+
+
+def timeline_table(timelines: List[Timeline]) -> str:
+    """Protocols with the most time blocked on modules first."""
+    shown = [timeline for timeline in timelines if len(timeline.busy()) > 1]
+    width = max([len(t.protocol) for t in shown] + [len("protocol")])
+    lines = [
+        f"{'protocol':<{width}}  {'in order':>9}  {'overlap':>9}  {'blocked':>9}  "
+        "blocked on"
+    ]
+    for timeline in sorted(shown, key=lambda t: -sum(t.blocked.values())):
+        blockers = ", ".join(
+            f"{resource} {duration(seconds)}"
+            for resource, seconds in sorted(
+                timeline.blocked.items(), key=lambda item: -item[1]
+            )
+        )
+        lines.append(
+            f"{timeline.protocol:<{width}}  {duration(timeline.sequential):>9}  "
+            f"{duration(timeline.seconds):>9}  "
+            f"{duration(sum(timeline.blocked.values())):>9}  {blockers or '-'}"
+        )
+    saved = sum(t.sequential - t.seconds for t in shown)
+    lines.append(
+        f"{len(shown)} protocols using modules, {duration(saved)} saved by "
+        "overlapping module ramps already in place"
+    )
+    return "\n".join(lines)
+
+
+def write_timelines(timelines: List[Timeline], out_dir: Path) -> str:
+    """Write each protocol's timelines beside its analysis, then timeline.json/.txt."""
+    for timeline in timelines:
+        detail = out_dir / f"{timeline.protocol}.timeline.json"
+        detail.write_text(
+            json.dumps(
+                {
+                    "activities": [asdict(a) for a in timeline.activities],
+                    "critical": timeline.critical,
+                }
+            ),
+            encoding="utf-8",
+        )
+    (out_dir / "timeline.json").write_text(
+        json.dumps(
+            [
+                {
+                    "protocol": timeline.protocol,
+                    "sequentialSeconds": timeline.sequential,
+                    "seconds": timeline.seconds,
+                    "busy": timeline.busy(),
+                    "blocked": timeline.blocked,
+                    "criticalPath": timeline.critical_by_resource(),
+                }
+                for timeline in timelines
+            ],
+            indent=2,
+        ),
+        encoding="utf-8",
+    )
+    table = timeline_table(timelines)
+    (out_dir / "timeline.txt").write_text(table + "\n", encoding="utf-8")
+    return table
+
+
+def timeline_results(out_dir: Path, ramps: RampModel = DEFAULT) -> List[Timeline]:
+    """Timelines for every protocol in a results directory's summary.json."""
+    summary = json.loads((out_dir / "summary.json").read_text(encoding="utf-8"))
+    return [
+        schedule_analysis(result["protocol"], Path(result["output"]), ramps)
+        for result in summary
+        if result["status"] == "ok" and result["output"]
+    ]
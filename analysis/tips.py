@@ -0,0 +1,328 @@
+"""Account for every tip a protocol picks up, rack by rack and well by well.
+
+The ledger is built from the command stream alone. A pickup takes as many
+tips as the pipette has active nozzles; a drop back into a tip rack returns
+them, anywhere else discards them. A pickup from a well whose tip is still
+out means the rack was swapped for a full one, as protocols that count tips
+themselves (tiptrack(), drop_count) do after a pause, and counts as a refill.
+"""
+
+import json
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+from analysis.diff import step_labels
+from analysis.recorder.instrument import NOZZLE_CHANNELS, pipette_spec
+from analysis.runs import analysis_commands
+
+RACK_ROWS = "ABCDEFGH"
+RACK_COLUMNS = 12
+RACK_SIZE = len(RACK_ROWS) * RACK_COLUMNS
+# where a rack goes when it is thrown out rather than moved
+RETIRED = ("offDeck", "wasteChute", "gripperWasteChute")
+
+
+def _tip_wells(well: str, count: int) -> List[str]:
+    """The wells a pickup of count tips at well takes from a 96-tip rack.
+
+    Multichannel pickups run down a column from the well named, a row
+    pickup runs along its row, and 96 channels take the whole rack.
+    """
+    row, column = well[:1], well[1:]
+    if count == 1 or row not in RACK_ROWS:
+        return [well]
+    if count >= RACK_SIZE:
+        return [f"{r}{c}" for c in range(1, RACK_COLUMNS + 1) for r in RACK_ROWS]
+    if count == RACK_COLUMNS:
+        return [f"{row}{c}" for c in range(1, RACK_COLUMNS + 1)]
+    start = RACK_ROWS.index(row)
+    return [f"{r}{column}" for r in RACK_ROWS[start : start + count]]
+
+
+def active_channels(channels: int, layout: dict) -> int:
+    """How many nozzles a configureNozzleLayout leaves in use."""
+    style = str(layout.get("style", "ALL"))
+    if channels == 1:
+        return 1
+    start, end = layout.get("primaryNozzle"), layout.get("end")
+    if style == "PARTIAL_COLUMN" and start and end:
+        return abs(ord(end[0]) - ord(start[0])) + 1
+    return NOZZLE_CHANNELS.get(style, channels)
+
+
+@dataclass
+class TipUse:
+    """One tip from pickup to drop."""
+
+    well: str
+    pipette: str
+    picked: int
+    dropped: Optional[int] = None
+    returned: bool = False
+    reused: bool = False
+
+
+@dataclass
+class RackLedger:
+    """Every tip taken from one tip rack."""
+
+    labware_id: str
+    load_name: str
+    location: str
+    uses: List[TipUse] = field(default_factory=list)
+    refills: int = 0
+    exhausted_at: Optional[int] = None
+    exhausted_step: Optional[str] = None
+
+    @property
+    def tips(self) -> int:
+        """Fresh tips consumed, not counting returned tips picked up again."""
+        return len([use for use in self.uses if not use.reused])
+
+    @property
+    def returned(self) -> int:
+        return len([use for use in self.uses if use.returned])
+
+    @property
+    def reused(self) -> int:
+        return len([use for use in self.uses if use.reused])
+
+
+@dataclass
+class TipLedger:
+    """One protocol's tip racks, with when the most were open at once."""
+
+    protocol: str
+    robot_type: str = ""
+    racks: List[RackLedger] = field(default_factory=list)
+    peak_open: int = 0
+    peak_at: Optional[int] = None
+
+    @property
+    def tips(self) -> int:
+        return sum(rack.tips for rack in self.racks)
+
+    @property
+    def racks_needed(self) -> int:
+        """Racks to have on hand: every rack touched plus every refill."""
+        return sum(1 + rack.refills for rack in self.racks if rack.uses)
+
+    @property
+    def first_exhausted(self) -> Optional[RackLedger]:
+        exhausted = [rack for rack in self.racks if rack.exhausted_at is not None]
+        return min(exhausted, key=lambda rack: rack.exhausted_at, default=None)
+
+
+class TipTracker:
+    """Walks one command stream, keeping which tips are out and on what."""
+
+    def __init__(self, ledger: TipLedger, steps: List[str]) -> None:
+        self.ledger = ledger
+        self.steps = steps
+        self.channels: Dict[str, int] = {}
+        self.active: Dict[str, int] = {}
+        self.held: Dict[str, List[TipUse]] = {}
+        self.racks: Dict[str, RackLedger] = {}
+        self.labware: Dict[str, dict] = {}
+        # tips out of each rack right now, and returned tips waiting in it
+        self.taken: Dict[str, Set[str]] = {}
+        self.back: Dict[str, Set[str]] = {}
+        self.open: Set[str] = set()
+        self.handlers: Dict[str, Callable[[int, dict], None]] = {
+            "loadPipette": self._load_pipette,
+            "loadLabware": self._load_labware,
+            "configureNozzleLayout": self._configure_nozzles,
+            "pickUpTip": self._pick_up,
+            "dropTip": self._drop,
+            "dropTipInPlace": self._drop,
+            "moveLabware": self._move,
+        }
+
+    def command(self, index: int, command_type: str, params: dict) -> None:
+        handler = self.handlers.get(command_type)
+        if handler is not None:
+            handler(index, params)
+
+    def _load_pipette(self, index: int, params: dict) -> None:
+        channels = pipette_spec(str(params.get("pipetteName", "")))[0]
+        self.channels[params.get("pipetteId", "")] = channels
+        self.active[params.get("pipetteId", "")] = channels
+
+    def _load_labware(self, index: int, params: dict) -> None:
+        self.labware[params.get("labwareId", "")] = params
+
+    def _configure_nozzles(self, index: int, params: dict) -> None:
+        pipette = params.get("pipetteId", "")
+        self.active[pipette] = active_channels(
+            self.channels.get(pipette, 1), params.get("configurationParams", {})
+        )
+
+    def _rack(self, labware_id: str) -> RackLedger:
+        if labware_id not in self.racks:
+            loaded = self.labware.get(labware_id, {})
+            location = loaded.get("location", {})
+            if isinstance(location, dict):
+                location = next(iter(location.values()), "")
+            # JSON protocols name labware in their header rather than the load command
+            name = loaded.get("loadName") or loaded.get("displayName") or labware_id
+            self.racks[labware_id] = RackLedger(labware_id, str(name), str(location))
+            self.ledger.racks.append(self.racks[labware_id])
+            self.taken[labware_id], self.back[labware_id] = set(), set()
+        return self.racks[labware_id]
+
+    def _pick_up(self, index: int, params: dict) -> None:
+        pipette, labware_id = params.get("pipetteId", ""), params.get("labwareId", "")
+        rack = self._rack(labware_id)
+        taken, back = self.taken[labware_id], self.back[labware_id]
+        wells = _tip_wells(str(params.get("wellName", "")), self.active.get(pipette, 1))
+        if taken & set(wells):
+            # a tip that never came back is there again: the rack was replaced
+            rack.refills += 1
+            taken.clear()
+            back.clear()
+        uses = [TipUse(well, pipette, index, reused=well in back) for well in wells]
+        back.difference_update(wells)
+        taken.update(wells)
+        rack.uses.extend(uses)
+        self.held[pipette] = uses
+        self.open.add(labware_id)
+        if len(taken) >= RACK_SIZE and rack.exhausted_at is None:
+            rack.exhausted_at, rack.exhausted_step = index, self.steps[index]
+        if len(taken) >= RACK_SIZE:
+            self.open.discard(labware_id)
+        self._peak(index)
+
+    def _drop(self, index: int, params: dict) -> None:
+        uses = self.held.pop(params.get("pipetteId", ""), [])
+        labware_id = params.get("labwareId")
+        returning = labware_id in self.racks and "wellName" in params
+        wells = _tip_wells(str(params.get("wellName", "")), len(uses))
+        for use, well in zip(uses, wells if returning else [None] * len(uses)):
+            use.dropped = index
+            if returning:
+                use.returned = True
+                self.taken[labware_id].discard(well)
+                self.back[labware_id].add(well)
+
+    def _move(self, index: int, params: dict) -> None:
+        location = params.get("newLocation")
+        if isinstance(location, dict):
+            location = location.get("addressableAreaName")
+        if params.get("labwareId") in self.open and location in RETIRED:
+            self.open.discard(params["labwareId"])
+
+    def _peak(self, index: int) -> None:
+        if len(self.open) > self.ledger.peak_open:
+            self.ledger.peak_open, self.ledger.peak_at = len(self.open), index
+
+
+def ledger(protocol: str, commands: Iterable[dict]) -> TipLedger:
+    """The tip ledger for one command stream."""
+    commands = list(commands)
+    result = TipLedger(protocol)
+    tracker = TipTracker(result, step_labels(commands))
+    for index, command in enumerate(commands):
+        tracker.command(
+            index, command.get("commandType", ""), command.get("params") or {}
+        )
+    return result
+
+
+def ledger_analysis(protocol: str, analysis: Path) -> TipLedger:
+    """The ledger from an analysis JSON file written by either analyzer."""
+    loaded = json.loads(analysis.read_text(encoding="utf-8"))
+    result = ledger(protocol, analysis_commands(loaded))
+    result.robot_type = loaded.get("robotType", "")
+    return result
+
+
+def inventory(ledgers: List[TipLedger]) -> Dict[str, Dict[str, int]]:
+    """Racks of each kind each robot type goes through running every protocol once."""
+    needed: Dict[str, Dict[str, int]] = {}
+    for result in ledgers:
+        robot = result.robot_type or "unknown"
+        for rack in result.racks:
+            if rack.uses:
+                kinds = needed.setdefault(robot, {})
+                kinds[rack.load_name] = kinds.get(rack.load_name, 0) + 1 + rack.refills
+    return needed
+
+
+def tips_table(ledgers: List[TipLedger]) -> str:
+    """Protocols using the most tips first, with where a rack first ran out."""
+    width = max([len(result.protocol) for result in ledgers] + [len("protocol")])
+    lines = [
+        f"{'protocol':<{width}}  {'tips':>5}  {'racks':>5}  {'peak':>4}  "
+        f"{'returned':>8}  {'reused':>6}  first rack emptied"
+    ]
+    for result in sorted(ledgers, key=lambda r: -r.tips):
+        if not result.tips:
+            continue
+        first = result.first_exhausted
+        emptied = f"#{first.exhausted_at} {first.exhausted_step}" if first else "-"
+        lines.append(
+            f"{result.protocol:<{width}}  {result.tips:>5}  {result.racks_needed:>5}  "
+            f"{result.peak_open:>4}  {sum(r.returned for r in result.racks):>8}  "
+            f"{sum(r.reused for r in result.racks):>6}  {emptied}"
+        )
+    for robot, kinds in sorted(inventory(ledgers).items()):
+        for load_name, count in sorted(kinds.items()):
+            lines.append(
+                f"{robot}: {count} x {load_name} ({count * RACK_SIZE} tips) "
+                "per run of every protocol"
+            )
+    lines.append(f"{len(ledgers)} protocols, {sum(r.tips for r in ledgers)} tips")
+    return "\n".join(lines)
+
+
+def write_tips(ledgers: List[TipLedger], out_dir: Path) -> str:
+    """Write each protocol's ledger beside its analysis, then tips.json/.txt."""
+    for result in ledgers:
+        detail = out_dir / f"{result.protocol}.tips.json"
+        detail.write_text(
+            json.dumps([asdict(rack) for rack in result.racks]), encoding="utf-8"
+        )
+    (out_dir / "tips.json").write_text(
+        json.dumps(
+            {
+                "protocols": [
+                    {
+                        "protocol": result.protocol,
+                        "tips": result.tips,
+                        "racks": result.racks_needed,
+                        "peakOpenRacks": result.peak_open,
+                        "peakAt": result.peak_at,
+                        "exhausted": [
+                            {
+                                "labwareId": rack.labware_id,
+                                "loadName": rack.load_name,
+                                "location": rack.location,
+                                "index": rack.exhausted_at,
+                                "step": rack.exhausted_step,
+                            }
+                            for rack in result.racks
+                            if rack.exhausted_at is not None
+                        ],
+                    }
+                    for result in ledgers
+                ],
+                "inventory": inventory(ledgers),
+            },
+            indent=2,
+        ),
+        encoding="utf-8",
+    )
+    table = tips_table(ledgers)
+    (out_dir / "tips.txt").write_text(table + "\n", encoding="utf-8")
+    return table
+
+
+def tips_results(out_dir: Path) -> List[TipLedger]:
+    """Ledgers for every protocol in a results directory's summary.json."""
+    summary = json.loads((out_dir / "summary.json").read_text(encoding="utf-8"))
+    return [
+        ledger_analysis(result["protocol"], Path(result["output"]))
+        for result in summary
+        if result["status"] == "ok" and result["output"]
+    ]
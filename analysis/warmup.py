@@ -0,0 +1,220 @@
+"""Find module warm-ups waited on one after another, and time them together.
+
+A blocking set_temperature records as a target followed at once by its
+wait. Several of those in a row, on different modules or on a
+thermocycler's block and lid, wait out each ramp before starting the next.
+Setting every target first and then waiting for all of them lets the
+ramps run at the same time, so the group takes as long as its slowest
+ramp: the single deadline one wait for all of them needs.
+
+Both orders are laid out by the timeline Scheduler, so a group's cost is
+the time the robot spends from its first command to past its last.
+"""
+
+import json
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from analysis.ramps import DEFAULT, RampModel
+from analysis.runs import analysis_commands
+from analysis.runtime import LEGACY_COMMANDS, duration
+from analysis.timeline import TARGETS, WAITS, Scheduler, Timeline
+
+
+@dataclass
+class WaitGroup:
+    """Back-to-back target and wait commands, as run and as awaited together."""
+
+    first: int
+    last: int
+    resources: List[str]
+    serial: float
+    together: float
+
+    @property
+    def saved(self) -> float:
+        return self.serial - self.together
+
+
+@dataclass
+class WarmupReport:
+    """Every group of serial module waits in one protocol."""
+
+    protocol: str
+    groups: List[WaitGroup] = field(default_factory=list)
+
+    @property
+    def saved(self) -> float:
+        return sum(group.saved for group in self.groups)
+
+
+def _command_type(command: dict) -> str:
+    command_type = command.get("commandType") or command.get("command", "")
+    return LEGACY_COMMANDS.get(command_type, command_type)
+
+
+def _resource(command_type: str, params: dict) -> Optional[str]:
+    """The timeline a target or wait command acts on, or None for any other."""
+    if command_type in TARGETS:
+        suffix = TARGETS[command_type][0]
+    elif command_type in WAITS:
+        suffix = WAITS[command_type]
+    else:
+        return None
+    return str(params.get("moduleId", params.get("module"))) + suffix
+
+
+def _groups(commands: List[dict]) -> List[List[int]]:
+    """Runs of target and wait commands, each module's timeline targeted once.
+
+    Only runs waiting on two timelines or more can overlap anything.
+    """
+    groups: List[List[int]] = []
+    current: List[int] = []
+    targeted: Set[str] = set()
+    waited: Set[str] = set()
+    for index, command in enumerate(commands + [{}]):
+        command_type = _command_type(command)
+        resource = _resource(command_type, command.get("params") or {})
+        retargeted = command_type in TARGETS and resource in targeted
+        if resource is None or retargeted:
+            if len(waited) > 1:
+                groups.append(current)
+            current, targeted, waited = [], set(), set()
+        if resource is not None:
+            current.append(index)
+            (targeted if command_type in TARGETS else waited).add(resource)
+    return groups
+
+
+def _hoisted(commands: List[dict], groups: List[List[int]]) -> List[dict]:
+    """The stream with every group's targets set before any of its waits."""
+    hoisted = list(commands)
+    for group in groups:
+        ordered = sorted(
+            group,
+            key=lambda index: _command_type(commands[index]) not in TARGETS,
+        )
+        for position, index in zip(group, ordered):
+            hoisted[position] = commands[index]
+    return hoisted
+
+
+def _clock(
+    protocol: str, commands: List[dict], ramps: RampModel
+) -> Tuple[List[float], Dict[str, str]]:
+    """The robot's time after each command, and the Scheduler's module names."""
+    scheduler = Scheduler(Timeline(protocol), ramps)
+    clock = []
+    for index, command in enumerate(commands):
+        scheduler.command(
+            index,
+            command.get("commandType") or command.get("command", ""),
+            command.get("params") or {},
+        )
+        clock.append(scheduler.now)
+    return clock, scheduler.names
+
+
+def _name(names: Dict[str, str], resource: str) -> str:
+    module_id, _, suffix = resource.partition("/")
+    return names.get(module_id, module_id) + (f"/{suffix}" if suffix else "")
+
+
+def group_waits(
+    protocol: str, commands: Iterable[dict], ramps: RampModel = DEFAULT
+) -> WarmupReport:
+    """Every serial warm-up in a command stream, and its time awaited together."""
+    commands = list(commands)
+    report = WarmupReport(protocol)
+    groups = _groups(commands)
+    if not groups:
+        return report
+    serial, names = _clock(protocol, commands, ramps)
+    together, _ = _clock(protocol, _hoisted(commands, groups), ramps)
+    for group in groups:
+        first, last = group[0], group[-1]
+        resources: List[str] = []
+        for index in group:
+            command = commands[index]
+            resource = _resource(_command_type(command), command.get("params") or {})
+            name = _name(names, str(resource))
+            if name not in resources:
+                resources.append(name)
+        before = serial[first - 1] if first else 0.0
+        hoisted = together[first - 1] if first else 0.0
+        report.groups.append(
+            WaitGroup(
+                first,
+                last,
+                resources,
+                serial[last] - before,
+                together[last] - hoisted,
+            )
+        )
+    return report
+
+
+def group_waits_analysis(
+    protocol: str, analysis: Path, ramps: RampModel = DEFAULT
+) -> WarmupReport:
+    """The warm-up report from an analysis JSON file written by either analyzer."""
+    commands = analysis_commands(json.loads(analysis.read_text(encoding="utf-8")))
+    return group_waits(protocol, commands, ramps)
+
+
+def warmup_table(reports: List[WarmupReport]) -> str:
+    """Protocols waiting on module warm-ups one at a time, the most to save first."""
+    shown = [report for report in reports if report.groups]
+    width = max([len(report.protocol) for report in shown] + [len("protocol")])
+    lines = [
+        f"{'protocol':<{width}}  {'groups':>6}  {'serial':>8}  {'together':>8}  "
+        f"{'saved':>8}  first group"
+    ]
+    for report in sorted(shown, key=lambda r: (-r.saved, r.protocol)):
+        serial = sum(group.serial for group in report.groups)
+        together = sum(group.together for group in report.groups)
+        first = report.groups[0]
+        lines.append(
+            f"{report.protocol:<{width}}  {len(report.groups):>6}  "
+            f"{duration(serial):>8}  {duration(together):>8}  "
+            f"{duration(report.saved):>8}  #{first.first} {' + '.join(first.resources)}"
+        )
+    lines.append(
+        f"{len(shown)} protocols waiting on warm-ups in series, "
+        f"{duration(sum(report.saved for report in shown))} saved awaiting them together"
+    )
+    return "\n".join(lines)
+
+
+def write_warmup(reports: List[WarmupReport], out_dir: Path) -> str:
+    """warmup.json, listing every group, and warmup.txt in out_dir."""
+    (out_dir / "warmup.json").write_text(
+        json.dumps(
+            [
+                {
+                    "protocol": report.protocol,
+                    "savedSeconds": report.saved,
+                    "groups": [asdict(group) for group in report.groups],
+                }
+                for report in reports
+                if report.groups
+            ],
+            indent=2,
+        ),
+        encoding="utf-8",
+    )
+    table = warmup_table(reports)
+    (out_dir / "warmup.txt").write_text(table + "\n", encoding="utf-8")
+    return table
+
+
+def warmup_results(out_dir: Path, ramps: RampModel = DEFAULT) -> List[WarmupReport]:
+    """Warm-up reports for every protocol in a results directory's summary.json."""
+    summary = json.loads((out_dir / "summary.json").read_text(encoding="utf-8"))
+    return [
+        group_waits_analysis(result["protocol"], Path(result["output"]), ramps)
+        for result in summary
+        if result["status"] == "ok" and result["output"]
+    ]
@@ -0,0 +1,256 @@
+"""Predict when liquid waste fills up and a person has to empty it.
+
+Liquid dispensed or blown out into waste goes into a sink: labware whose
+label names it waste (a nest_1_reservoir_195ml loaded as "Liquid Waste"),
+or a trash bin or waste chute. Labware sinks hold their wells' maximum
+volume and are emptied before they are completely full, as protocols that
+count waste_vol themselves do. A pause asking for liquid waste to be
+emptied empties every labware sink; any other fill is a stall the protocol
+does not plan for.
+"""
+
+import json
+import re
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from analysis.diff import step_labels
+from analysis.liquids import DISPENSE, LiquidTracker, track
+from analysis.runs import analysis_commands
+from analysis.runtime import duration, estimate
+
+WASTE_LABEL = re.compile(r"waste", re.IGNORECASE)
+EMPTIES_WASTE = re.compile(r"empty.*liquid waste|liquid waste.*empt", re.IGNORECASE)
+# share of a waste reservoir used before it is emptied, e.g. 185 of 195 mL
+FILL_FRACTION = 0.95
+
+
+@dataclass
+class Fill:
+    """A sink that would overflow at a command unless it is emptied first."""
+
+    sink: str
+    index: int
+    step: str
+    seconds: float
+    volume: float
+
+
+@dataclass
+class Pause:
+    """A pause the protocol asks for, and whether it empties liquid waste."""
+
+    index: int
+    step: str
+    seconds: float
+    message: str
+    empties_waste: bool
+
+
+@dataclass
+class Sink:
+    """Everything emptied into one waste labware, trash bin or chute."""
+
+    name: str
+    capacity: Optional[float] = None
+    total: float = 0.0
+    peak: float = 0.0
+    fills: List[Fill] = field(default_factory=list)
+
+
+@dataclass
+class WasteReport:
+    """One protocol's waste sinks and the pauses its run needs."""
+
+    protocol: str
+    sinks: List[Sink] = field(default_factory=list)
+    pauses: List[Pause] = field(default_factory=list)
+    seconds: float = 0.0
+
+    @property
+    def stalls(self) -> List[Fill]:
+        """Fills the protocol does not pause for, in the order they happen."""
+        fills = [fill for sink in self.sinks for fill in sink.fills]
+        return sorted(fills, key=lambda fill: fill.index)
+
+    def timeline(self) -> List[dict]:
+        """Every pause a person has to attend, planned or not, in order."""
+        events = [
+            {"index": p.index, "seconds": p.seconds, "step": p.step, "pause": p.message}
+            for p in self.pauses
+        ] + [
+            {"index": f.index, "seconds": f.seconds, "step": f.step, "full": f.sink}
+            for f in self.stalls
+        ]
+        return sorted(events, key=lambda event: event["index"])
+
+
+def _deposits(tracker: LiquidTracker) -> List[Tuple[int, str, float]]:
+    """(command, sink, volume) for every command putting liquid into a sink."""
+    sinks = {
+        offset: labware_id
+        for labware_id, labware in tracker.labware.items()
+        if WASTE_LABEL.search(labware.name)
+        for offset in range(labware.offset, labware.offset + len(labware.index))
+    }
+    totals: Dict[Tuple[int, str], float] = {}
+    for well, volume, index, kind in tracker.events:
+        if kind == DISPENSE and volume > 0 and int(well) in sinks:
+            key = (index, sinks[int(well)])
+            totals[key] = totals.get(key, 0.0) + volume
+    for area, volume, index in tracker.discarded:
+        # every chute opening drains into the same place
+        name = "wasteChute" if "WasteChute" in area else area
+        totals[(index, name)] = totals.get((index, name), 0.0) + volume
+    return sorted((index, sink, volume) for (index, sink), volume in totals.items())
+
+
+def _sinks(
+    tracker: LiquidTracker, deposits: Iterable[Tuple[int, str, float]]
+) -> Dict[str, Sink]:
+    sinks: Dict[str, Sink] = {}
+    for _, key, _ in deposits:
+        labware = tracker.labware.get(key)
+        if key not in sinks and labware is not None:
+            usable = float(labware.index.max_volume.sum()) * FILL_FRACTION
+            sinks[key] = Sink(labware.name, usable)
+        elif key not in sinks:
+            sinks[key] = Sink(key)
+    return sinks
+
+
+def _pauses(commands: List[dict], steps: List[str], starts: List[float]) -> List[Pause]:
+    pauses = []
+    for index, command in enumerate(commands):
+        params = command.get("params") or {}
+        if command.get("commandType") == "waitForResume" or params.get("wait") is True:
+            message = str(params.get("message") or "")
+            pauses.append(
+                Pause(
+                    index,
+                    steps[index],
+                    starts[index],
+                    message,
+                    bool(EMPTIES_WASTE.search(message)),
+                )
+            )
+    return pauses
+
+
+def _empty(held: Dict[str, float], sinks: Dict[str, Sink]) -> None:
+    """A person empties every waste labware; bins and chutes are left alone."""
+    for key in held:
+        if sinks[key].capacity is not None:
+            held[key] = 0.0
+
+
+def accumulate(protocol: str, commands: Iterable[dict]) -> WasteReport:
+    """Follow every sink's volume through a command stream."""
+    commands = list(commands)
+    tracker = track(commands)
+    steps = step_labels(commands)
+    timed = estimate(protocol, commands)
+    starts = [step.start for step in timed.steps]
+    report = WasteReport(protocol, seconds=timed.seconds)
+    report.pauses = _pauses(commands, steps, starts)
+    deposits = _deposits(tracker)
+    sinks = _sinks(tracker, deposits)
+    held = dict.fromkeys(sinks, 0.0)
+    emptied = [pause.index for pause in report.pauses if pause.empties_waste]
+    for index, key, volume in deposits:
+        while emptied and emptied[0] < index:
+            _empty(held, sinks)
+            emptied.pop(0)
+        sink = sinks[key]
+        if sink.capacity is not None and held[key] + volume > sink.capacity:
+            sink.fills.append(
+                Fill(sink.name, index, steps[index], starts[index], round(held[key], 2))
+            )
+            held[key] = 0.0
+        held[key] += volume
+        sink.total += volume
+        sink.peak = max(sink.peak, held[key])
+    report.sinks = list(sinks.values())
+    return report
+
+
+def accumulate_analysis(protocol: str, analysis: Path) -> WasteReport:
+    """The waste report from an analysis JSON file written by either analyzer."""
+    commands = analysis_commands(json.loads(analysis.read_text(encoding="utf-8")))
+    return accumulate(protocol, commands)
+
+
+def waste_table(reports: List[WasteReport]) -> str:
+    """Protocols putting liquid into waste, with when it fills unattended."""
+    shown = [report for report in reports if report.sinks]
+    width = max([len(report.protocol) for report in shown] + [len("protocol")])
+    lines = [
+        f"{'protocol':<{width}}  {'waste uL':>9}  {'trash uL':>9}  {'pauses':>6}  "
+        f"{'stalls':>6}  first stall"
+    ]
+    for report in sorted(shown, key=lambda r: (-len(r.stalls), r.protocol)):
+        labware = sum(sink.total for sink in report.sinks if sink.capacity is not None)
+        bins = sum(sink.total for sink in report.sinks if sink.capacity is None)
+        planned = len([pause for pause in report.pauses if pause.empties_waste])
+        stalls = report.stalls
+        first = (
+            f"{duration(stalls[0].seconds)} #{stalls[0].index} {stalls[0].sink} "
+            f"in {stalls[0].step}"
+            if stalls
+            else "-"
+        )
+        lines.append(
+            f"{report.protocol:<{width}}  {labware:>9.0f}  {bins:>9.0f}  "
+            f"{planned:>6}  {len(stalls):>6}  {first}"
+        )
+    stalled = len([report for report in shown if report.stalls])
+    lines.append(
+        f"{len(reports)} protocols, {len(shown)} using liquid waste, "
+        f"{stalled} filling it without a pause to empty it"
+    )
+    return "\n".join(lines)
+
+
+def write_waste(reports: List[WasteReport], out_dir: Path) -> str:
+    """Write each protocol's sinks and pause timeline beside its analysis, then waste.json/.txt."""
+    for report in reports:
+        detail = out_dir / f"{report.protocol}.waste.json"
+        detail.write_text(
+            json.dumps(
+                {
+                    "sinks": [asdict(sink) for sink in report.sinks],
+                    "timeline": report.timeline(),
+                }
+            ),
+            encoding="utf-8",
+        )
+    (out_dir / "waste.json").write_text(
+        json.dumps(
+            [
+                {
+                    "protocol": report.protocol,
+                    "seconds": report.seconds,
+                    "sinks": {sink.name: sink.total for sink in report.sinks},
+                    "timeline": report.timeline(),
+                }
+                for report in reports
+                if report.sinks or report.pauses
+            ],
+            indent=2,
+        ),
+        encoding="utf-8",
+    )
+    table = waste_table(reports)
+    (out_dir / "waste.txt").write_text(table + "\n", encoding="utf-8")
+    return table
+
+
+def waste_results(out_dir: Path) -> List[WasteReport]:
+    """Waste reports for every protocol in a results directory's summary.json."""
+    summary = json.loads((out_dir / "summary.json").read_text(encoding="utf-8"))
+    return [
+        accumulate_analysis(result["protocol"], Path(result["output"]))
+        for result in summary
+        if result["status"] == "ok" and result["output"]
+    ]
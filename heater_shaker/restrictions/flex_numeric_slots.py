@@ -0,0 +1,28 @@
+from opentrons import protocol_api
+
+metadata = {
+    "protocolName": "Flex Heater-Shaker with OT-2 style slot numbers",
+    "author": "Opentrons Engineering <engineering@opentrons.com>",
+    "source": "Software Testing Team",
+}
+requirements = {"robotType": "Flex", "apiLevel": "2.15"}
+
+
+def run(context: protocol_api.ProtocolContext):
+    # No error
+    # slots 1, 2 and 3 are D1, D2 and D3 on the Flex, where an 8-channel pipette
+    # may go beside a Heater-Shaker, even with its latch open
+    hs_mod = context.load_module("heaterShakerModuleV1", "1")
+    hs_adapter = hs_mod.load_adapter("opentrons_96_pcr_adapter")
+    hs_plate = hs_adapter.load_labware("nest_96_wellplate_100ul_pcr_full_skirt")
+    tips = context.load_labware("opentrons_flex_96_tiprack_200ul", "2")
+    reservoir = context.load_labware("nest_12_reservoir_15ml", "3")
+    context.load_trash_bin("A3")
+    pipette = context.load_instrument("flex_8channel_1000", "left", tip_racks=[tips])
+
+    hs_mod.open_labware_latch()
+    pipette.pick_up_tip()
+    pipette.aspirate(50, reservoir["A1"])
+    hs_mod.close_labware_latch()
+    pipette.dispense(50, hs_plate["A1"])
+    pipette.drop_tip()